@@ -1,5 +1,8 @@
+import math
+import tracer
 from packet import Packet
 from timeout_calculator import TimeoutCalculator
+from unacked_window import UnackedWindow
 
 # Structure to store information associated with an unacked packet
 # so that we can maintain a list of such UnackedPacket objects
@@ -10,7 +13,7 @@ class AimdHost:
     This class implements a host that follows the AIMD protocol.
     Data members of this class are
 
-    **unacked**: List of unacked packets
+    **unacked**: Unacked packets, indexed by sequence number (an UnackedWindow)
 
     **window**: Size of the window at any given moment
 
@@ -25,6 +28,8 @@ class AimdHost:
     **timeout_calculator**: An object of class TimeoutCalculator
     (Refer to TimeoutCalculator class for more information)
 
+    **tracer**: A tracer.Tracer that events are recorded to, or None
+
     There are two member functions - send and recv that perform the task of sending
     and receiving packets respectively. All send and receive logic should be written
     within one of these two functions.
@@ -32,7 +37,7 @@ class AimdHost:
     """
 
     def __init__(self, verbose=True, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
-        self.unacked = []
+        self.unacked = UnackedWindow(max_timeout=max_timeout)
         self.window = 1
         self.max_seq = -1
         self.in_order_rx_seq = -1
@@ -40,6 +45,7 @@ class AimdHost:
         self.next_decrease = -1
         self.verbose = verbose
         self.timeout_calculator = TimeoutCalculator(verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
+        self.tracer = None
 
     def send(self, tick):
         """
@@ -62,48 +68,51 @@ class AimdHost:
 
         # TODO: Create an empty list of packets that the host will send
         packets = []
-        for i in range(0, len(self.unacked)):
-            unacked_pkt = self.unacked[i]
-            if tick >= unacked_pkt.timeout_tick:
-                if self.verbose:
-                    print("@ " + str(tick) + " timeout for unacked_pkt " + str(unacked_pkt.seq_num) + " timeout duration was " + str(unacked_pkt.timeout_duration))
-                # TODO: Retransmit any packet that has timed out
-                # New packet
-                new_packet = Packet(tick, unacked_pkt.seq_num)
-                # Increment num_retx
-                new_packet.num_retx = unacked_pkt.num_retx+1
-                # Append the packet 
-                packets.append(new_packet)
-                # Back off timer
-                self.timeout_calculator.exp_backoff()
-                # Update timeout_tick and timeout_duration
-                new_packet.timeout_tick = self.timeout_calculator.timeout+tick
-                new_packet.timeout_duration = self.timeout_calculator.timeout
-                unacked_pkt = new_packet
-                if self.verbose:
-                    print("@ " + str(tick) + " exp backoff for packet " + str(new_packet.seq_num))
-                # TODO: Multiplicative decrease, if it's time for the next decrease
-                # Split window in half and don't let it go below 1
-                if self.next_decrease <= tick:
-                    self.window *= .5
-                    if self.window < 1:
-                        self.window = 1
-                # TODO: Make sure the next multiplicative decrease doesn't happen until an RTT later
-                self.next_decrease = tick+self.timeout_calculator.mean_rtt
-                self.slow_start = False
-
-            self.unacked[i] = unacked_pkt
+        for unacked_pkt in self.unacked.expired(tick):
+            if self.verbose:
+                print("@ " + str(tick) + " timeout for unacked_pkt " + str(unacked_pkt.seq_num) + " timeout duration was " + str(unacked_pkt.timeout_duration))
+            # TODO: Retransmit any packet that has timed out
+            # New packet
+            new_packet = Packet.alloc(tick, unacked_pkt.seq_num)
+            # Increment num_retx
+            new_packet.num_retx = unacked_pkt.num_retx+1
+            # Append the packet 
+            packets.append(new_packet)
+            # Back off timer
+            self.timeout_calculator.exp_backoff()
+            # Update timeout_tick and timeout_duration
+            new_packet.timeout_tick = self.timeout_calculator.timeout+tick
+            new_packet.timeout_duration = self.timeout_calculator.timeout
+            self.unacked.replace(new_packet)
+            if self.verbose:
+                print("@ " + str(tick) + " exp backoff for packet " + str(new_packet.seq_num))
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.BACKOFF, new_packet.seq_num, self.timeout_calculator.timeout)
+                self.tracer.emit(tick, tracer.RETX, new_packet.seq_num, new_packet.timeout_duration)
+            # TODO: Multiplicative decrease, if it's time for the next decrease
+            # Split window in half and don't let it go below 1
+            if self.next_decrease <= tick:
+                self.window *= .5
+                if self.window < 1:
+                    self.window = 1
+                if self.tracer is not None:
+                    self.tracer.emit(tick, tracer.WINDOW, -1, self.window)
+            # TODO: Make sure the next multiplicative decrease doesn't happen until an RTT later
+            self.next_decrease = tick+self.timeout_calculator.mean_rtt
+            self.slow_start = False
 
         # Fill window with new packets
         while len(self.unacked) < self.window:
             # TODO: Create new packets, set their retransmission timeout, and transmit them
-            new_packet = Packet(tick, self.max_seq+1)
+            new_packet = Packet.alloc(tick, self.max_seq+1)
             new_packet.timeout_tick = self.timeout_calculator.timeout+tick
             new_packet.timeout_duration = self.timeout_calculator.timeout
             packets.append(new_packet)
             # TODO: Remember to update self.max_seq and add the just sent packet to self.unacked
             self.max_seq += 1
-            self.unacked.append(new_packet)
+            self.unacked.add(new_packet)
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.SEND, new_packet.seq_num, new_packet.timeout_duration)
 
         # TODO: Return the list of packets that need to be sent on to the network
         return packets
@@ -125,18 +134,72 @@ class AimdHost:
         # TODO: Update timeout
         self.timeout_calculator.update_timeout(rtt_sample)
         # TODO: Remove received packet from self.unacked
-        for i in range(len(self.unacked)):
-            if self.unacked[i].seq_num == pkt.seq_num:
-                self.unacked.pop(i)
-                break
+        self.unacked.ack(pkt.seq_num)
         # TODO: Update in_order_rx_seq to reflect the largest sequence number that you
-        # have received in order so far
-        self.in_order_rx_seq = self.max_seq
-        for packet in self.unacked:
-            if packet.seq_num < self.in_order_rx_seq:
-                self.in_order_rx_seq = packet.seq_num-1
+        # have received in order so far (as with the original scan, the newest packet
+        # being unacked on its own doesn't hold it back)
+        if self.unacked.base < self.max_seq:
+            self.in_order_rx_seq = self.unacked.base-1
+        else:
+            self.in_order_rx_seq = self.max_seq
         # TODO: Increase your window given that you just received an ACK. Remember that:
         if self.slow_start:
             self.window += 1
         else:
             self.window += 1/self.window
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, pkt.seq_num, rtt_sample)
+            self.tracer.emit(tick, tracer.WINDOW, -1, self.window)
+        # Nothing refers to the ACK any more (acking removed it from self.unacked)
+        Packet.release(pkt)
+
+    def recv_ack(self, ack, tick):
+        """
+        Function to get a cumulative ACK from a receiver.Receiver, covering any
+        number of packets at once. The window grows as it would have on one ACK
+        per packet covered.
+
+        Args:
+
+            **ack**: receiver.Ack received from the network
+
+            **tick**: Simulated time
+        """
+        assert tick > ack.sent_ts
+        rtt_sample = tick-ack.sent_ts
+        self.timeout_calculator.update_timeout(rtt_sample)
+        self.unacked.ack_through(ack.cumulative)
+        for start, end in ack.ranges:
+            for seq_num in range(start, end+1):
+                self.unacked.ack(seq_num)
+        if self.unacked.base < self.max_seq:
+            self.in_order_rx_seq = self.unacked.base-1
+        else:
+            self.in_order_rx_seq = self.max_seq
+        if self.slow_start:
+            self.window += ack.count
+        else:
+            # One step per packet, 1/window shrinking as the window grows
+            for _ in range(ack.count):
+                self.window += 1/self.window
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, ack.cumulative, rtt_sample)
+            self.tracer.emit(tick, tracer.WINDOW, -1, self.window)
+
+    def next_event_tick(self, tick):
+        """
+        Earliest tick after tick at which send() has work to do: either the window has
+        room for new packets or an unacked packet has timed out. Used by Simulator.run
+        to skip ticks on which send() would do nothing.
+
+        Args:
+
+            **tick**: Simulated time
+
+        Returns:
+            The next tick to call send() on, or math.inf if only an ACK can wake the host
+        """
+        if len(self.unacked) < self.window:
+            return tick + 1
+        next_tick = self.unacked.next_timeout()
+        return max(tick + 1, math.ceil(next_tick)) if next_tick != math.inf else math.inf
@@ -0,0 +1,61 @@
+"""
+Simulated ticks/sec as cumulative ACKs (see receiver.py) cover more packets each.
+
+Times a sliding window host whose window is above the bandwidth-delay product, on
+a link delivering several packets per tick, acked with one ACK per packet by
+host.recv() and then by a Receiver that sends one cumulative ACK every ack_every
+packets (or ack_delay ticks after the first of them). The packets per ACK actually
+achieved and the in order received sequence number at the end are shown next to
+the speed, since holding ACKs back delays the window's progress. That a Receiver
+acking every packet as it arrives gives exactly the per-packet results is checked
+by tests/test_receiver.py.
+
+Run from the repository root:
+
+    python -m benchmarks.ack_ratio
+"""
+
+import argparse
+import time
+from simulator import Simulator, make_host
+
+ACK_EVERY = [1, 2, 4, 8, 16, 32, 64]
+
+
+def run(host_type, window_size, rtt_min, link_rate, ticks, receiver=None, loss_ratio=0.0, queue_limit=1000000, seed=1):
+    """
+    Runs one simulation and returns (ticks/sec, in_order_rx_seq, packets per ACK)
+    """
+    host = make_host(host_type, window_size, verbose=False)
+    simulator = Simulator(host, loss_ratio, queue_limit, rtt_min, seed, verbose=False, link_rate=link_rate,
+                          receiver=receiver)
+    start = time.perf_counter()
+    simulator.run(ticks)
+    elapsed = time.perf_counter() - start
+    per_ack = 1.0
+    if simulator.receiver is not None and simulator.receiver.acks_sent:
+        per_ack = simulator.receiver.packets_acked / simulator.receiver.acks_sent
+    return ticks / elapsed, host.in_order_rx_seq, per_ack
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulated ticks/sec against the number of packets per cumulative ACK")
+    parser.add_argument("--host_type", default="slidingwindow", choices=["stopandwait", "slidingwindow", "aimd"])
+    parser.add_argument("--window_size", type=int, default=200)
+    parser.add_argument("--rtt_min", type=int, default=10)
+    parser.add_argument("--link_rate", type=float, default=10)
+    parser.add_argument("--ack_delay", type=int, default=5, help="ticks an ACK is held back at most, default 5")
+    parser.add_argument("--ticks", type=int, default=20000)
+    args = parser.parse_args()
+
+    baseline, seq, _ = run(args.host_type, args.window_size, args.rtt_min, args.link_rate, args.ticks)
+    print("%12s %14s %10s %14s %16s" % ("ack_every", "packets/ack", "ticks/s", "speedup", "in order seq"))
+    print("%12s %14.2f %10.0f %14.2f %16d" % ("per packet", 1.0, baseline, 1.0, seq))
+    for ack_every in ACK_EVERY:
+        receiver = {"ack_every": ack_every, "ack_delay": args.ack_delay}
+        rate, seq, per_ack = run(args.host_type, args.window_size, args.rtt_min, args.link_rate, args.ticks, receiver)
+        print("%12d %14.2f %10.0f %14.2f %16d" % (ack_every, per_ack, rate, rate / baseline, seq))
+
+
+if __name__ == "__main__":
+    main()
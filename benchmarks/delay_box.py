@@ -0,0 +1,48 @@
+"""
+Per-tick cost of DelayBox as the number of packets in flight grows.
+
+In steady state one packet enters and one packet leaves the delay box on every
+tick, so with a propagation delay of n ticks there are n packets in flight.
+
+Run from the repository root:
+
+    python -m benchmarks.delay_box
+"""
+
+import time
+from network import DelayBox
+from packet import Packet
+
+
+class NullHost:
+    def recv(self, pkt, tick):
+        pass
+
+
+def time_per_tick(prop_delay, variable_delay=False, ticks=20000):
+    pdbox = DelayBox(prop_delay)
+    host = NullHost()
+    delay = prop_delay if variable_delay else None
+    # Fill the pipe so that prop_delay packets are in flight before timing
+    for tick in range(0, prop_delay):
+        pdbox.recv(Packet(tick, tick), tick, delay)
+        pdbox.tick(tick, host)
+    start = time.perf_counter()
+    for tick in range(prop_delay, prop_delay + ticks):
+        pdbox.recv(Packet(tick, tick), tick, delay)
+        pdbox.tick(tick, host)
+    elapsed = time.perf_counter() - start
+    assert len(pdbox) == prop_delay
+    return elapsed / ticks
+
+
+def main():
+    print("%10s %16s %16s" % ("in flight", "fifo ns/tick", "heap ns/tick"))
+    for in_flight in [10, 100, 1000, 10000, 100000]:
+        fifo = time_per_tick(in_flight)
+        heap = time_per_tick(in_flight, variable_delay=True)
+        print("%10d %16.0f %16.0f" % (in_flight, fifo * 1e9, heap * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Memory used per in-flight packet and garbage collector pressure of packet churn.
+
+"before" is the original Packet with a per-instance __dict__ and no reuse, "after"
+is the __slots__ Packet allocated from its free list.
+
+Run from the repository root:
+
+    python -m benchmarks.packet_memory
+"""
+
+import gc
+import io
+import contextlib
+import time
+import tracemalloc
+from packet import Packet
+from simulator import Simulator
+from sliding_window_host import SlidingWindowHost
+
+
+class DictPacket:
+    # Packet as it was before __slots__
+    def __init__(self, sent_ts, seq_num):
+        self.sent_ts = sent_ts
+        self.seq_num = seq_num
+        self.pdbox_time = -1
+        self.num_retx = 0
+        self.timeout_duration = 0
+        self.timeout_tick = 0
+
+
+def bytes_per_packet(make_packet, num_packets):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    packets = [make_packet(tick, tick) for tick in range(0, num_packets)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Don't count the list holding the packets
+    return (after - before - packets.__sizeof__()) / num_packets
+
+
+def gc_pressure(window, ticks, pool_size):
+    Packet.POOL_SIZE = pool_size
+    Packet.pool = []
+    # Timeouts are set high enough that the window is never retransmitted
+    host = SlidingWindowHost(window, verbose=False, min_timeout=10 * ticks, max_timeout=10 * ticks)
+    simulator = Simulator(host, 0.0, 1000000, 100, 1, verbose=False)
+    gc.collect()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.run(ticks)
+    elapsed = time.perf_counter() - start
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    return collections, elapsed, host.in_order_rx_seq
+
+
+def main():
+    print("%10s %18s %18s" % ("packets", "before bytes/pkt", "after bytes/pkt"))
+    for num_packets in [10000, 100000]:
+        print("%10d %18.1f %18.1f" % (num_packets, bytes_per_packet(DictPacket, num_packets),
+                                      bytes_per_packet(Packet, num_packets)))
+    print()
+    pool_size = Packet.POOL_SIZE
+    print("%10s %8s %14s %10s %14s %10s" % ("window", "ticks", "no pool gcs", "secs", "pool gcs", "secs"))
+    for window in [10000, 50000]:
+        ticks = 5 * window
+        no_pool = gc_pressure(window, ticks, 0)
+        pool = gc_pressure(window, ticks, pool_size)
+        assert no_pool[2] == pool[2]
+        print("%10d %8d %14d %10.2f %14d %10.2f" % (window, ticks, no_pool[0], no_pool[1], pool[0], pool[1]))
+
+
+if __name__ == "__main__":
+    main()
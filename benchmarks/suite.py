@@ -0,0 +1,292 @@
+"""
+Benchmark suite for the simulator hot paths, with a history of results.
+
+"run" times Simulator.tick for every host type across window sizes, rtt_min values,
+loss ratios and queue limits (ticks/sec, and bytes per in-flight packet measured in
+a separate traced run), and microbenchmarks Link.recv/tick, DelayBox.tick,
+TimeoutCalculator.update_timeout and host send/recv in isolation (ops/sec). Each
+benchmark is timed repeat times and the best time is kept. The results are
+appended as one JSON line to the history file, together with the commit, Python
+version and machine they were measured on.
+
+"compare" compares two entries of the history (by default the last two) and flags
+every metric that got worse by more than threshold, exiting with status 1 if any did.
+Metrics ending in _per_sec are better when higher, the others when lower.
+
+Run from the repository root:
+
+    python -m benchmarks.suite run --quick
+    python -m benchmarks.suite compare --threshold 0.1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from network import DelayBox, Link
+from packet import Packet
+from simulator import Simulator, make_host
+from timeout_calculator import TimeoutCalculator
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+
+
+class NullHost:
+    def recv(self, pkt, tick):
+        pass
+
+
+def best_time(func, repeat):
+    # Smallest wall clock time of repeat calls of func, which returns the number of operations it did
+    best = None
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        ops = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return ops / best
+
+
+def simulator_cases(quick):
+    """
+    Returns (name, parameters) of the Simulator.tick benchmarks
+    """
+    windows = [1, 10, 100, 1000] if quick else [1, 10, 100, 1000, 10000]
+    rtt_mins = [10] if quick else [10, 100]
+    loss_ratios = [0.0, 0.01]
+    queue_limits = [1000000] if quick else [100, 1000000]
+    cases = []
+    for host_type in ["stopandwait", "slidingwindow", "aimd"]:
+        for window in (windows if host_type == "slidingwindow" else [None]):
+            for rtt_min in rtt_mins:
+                for loss_ratio in loss_ratios:
+                    for queue_limit in queue_limits:
+                        name = "simulator.%s.w%s.rtt%d.loss%g.q%d" % (host_type, window or "-", rtt_min, loss_ratio, queue_limit)
+                        cases.append((name, (host_type, window, rtt_min, loss_ratio, queue_limit)))
+    return cases
+
+
+def bench_simulator(params, ticks, repeat):
+    host_type, window, rtt_min, loss_ratio, queue_limit = params
+
+    def build():
+        host = make_host(host_type, window, verbose=False)
+        return Simulator(host, loss_ratio, queue_limit, rtt_min, 1, verbose=False)
+
+    def run():
+        simulator = build()
+        tick = simulator.tick
+        for tick_val in range(0, ticks):
+            tick(tick_val)
+        return ticks
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ticks_per_sec = best_time(run, repeat)
+        # Memory the run added to the simulator, per packet in the host's window, the link and the delay box
+        Packet.pool = []
+        tracemalloc.start()
+        simulator = build()
+        before = tracemalloc.get_traced_memory()[0]
+        for tick_val in range(0, ticks):
+            simulator.tick(tick_val)
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    host = simulator.host
+    in_flight = len(host.unacked) if hasattr(host, "unacked") else 1
+    in_flight += len(simulator.link.link_queue) + len(simulator.pdbox)
+    return {"ticks_per_sec": ticks_per_sec, "bytes_per_packet": memory / max(1, in_flight)}
+
+
+def bench_link(ops, repeat):
+    def run():
+        link = Link(0.0, 1000000, verbose=False)
+        pdbox = DelayBox(1)
+        host = NullHost()
+        packets = [Packet(0, seq) for seq in range(0, 16)]
+        recv = link.recv
+        for tick_val in range(0, ops):
+            recv(packets[tick_val & 15], tick_val)
+            link.tick(tick_val, pdbox)
+            pdbox.tick(tick_val, host)
+        return ops
+    return {"ops_per_sec": best_time(run, repeat)}
+
+
+def bench_delay_box(in_flight, ops, repeat):
+    def run():
+        pdbox = DelayBox(in_flight)
+        host = NullHost()
+        packets = [Packet(0, seq) for seq in range(0, in_flight + 1)]
+        for tick_val in range(0, in_flight + ops):
+            pdbox.recv(packets[tick_val % (in_flight + 1)], tick_val)
+            pdbox.tick(tick_val, host)
+        return in_flight + ops
+    return {"ops_per_sec": best_time(run, repeat)}
+
+
+def bench_update_timeout(ops, repeat):
+    samples = [10 + (i * 7919) % 13 for i in range(0, 1024)]
+
+    def run():
+        calculator = TimeoutCalculator(TimeoutCalculator.MIN_TIMEOUT, TimeoutCalculator.MAX_TIMEOUT, verbose=False)
+        update_timeout = calculator.update_timeout
+        for i in range(0, ops):
+            update_timeout(samples[i & 1023])
+        return ops
+    return {"ops_per_sec": best_time(run, repeat)}
+
+
+def bench_host(host_type, window, ops, repeat):
+    # Every packet the host sends is acked 10 ticks later, without a link in between,
+    # except every 100th, which is lost so that AIMD windows don't grow without bound
+    def run():
+        host = make_host(host_type, window, verbose=False)
+        in_flight = {}
+        sent = 0
+        for tick_val in range(0, ops):
+            for pkt in in_flight.pop(tick_val, []):
+                host.recv(pkt, tick_val)
+            packets = host.send(tick_val)
+            if packets is not None:
+                if type(packets) is Packet:
+                    packets = [packets]
+                for pkt in packets:
+                    sent += 1
+                    if sent % 100 != 0:
+                        in_flight.setdefault(tick_val + 10, []).append(pkt)
+        return ops
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {"ops_per_sec": best_time(run, repeat)}
+
+
+def run_suite(quick=False, only=None, repeat=3):
+    """
+    Runs the benchmarks whose name contains only (all by default) and returns {name: metrics}
+    """
+    ticks = 5000 if quick else 20000
+    ops = 20000 if quick else 100000
+    benchmarks = []
+    for name, params in simulator_cases(quick):
+        # Large windows do much more work per tick, so they run for fewer ticks
+        window = params[1] or 1
+        case_ticks = max(500, ticks * 10 // window) if window > 10 else ticks
+        benchmarks.append((name, lambda params=params, case_ticks=case_ticks: bench_simulator(params, case_ticks, repeat)))
+    benchmarks.append(("micro.link.recv_tick", lambda: bench_link(ops, repeat)))
+    for in_flight in [10, 1000, 100000]:
+        benchmarks.append(("micro.delay_box.tick.inflight%d" % in_flight,
+                           lambda in_flight=in_flight: bench_delay_box(in_flight, ops, repeat)))
+    benchmarks.append(("micro.timeout_calculator.update_timeout", lambda: bench_update_timeout(ops, repeat)))
+    for host_type, window in [("stopandwait", None), ("slidingwindow", 10), ("slidingwindow", 1000), ("aimd", None)]:
+        benchmarks.append(("micro.host.%s.w%s.send_recv" % (host_type, window or "-"),
+                           lambda host_type=host_type, window=window: bench_host(host_type, window, ops, repeat)))
+    results = {}
+    for name, bench in benchmarks:
+        if only is not None and only not in name:
+            continue
+        results[name] = bench()
+        print("%-60s %s" % (name, "  ".join("%s %.1f" % item for item in sorted(results[name].items()))))
+        sys.stdout.flush()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(results, path=HISTORY):
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine() + " " + platform.processor(),
+        "results": results,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+    return entry
+
+
+def load_history(path=HISTORY):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_entry(history, ref):
+    # An entry by index into the history (negative counts from the end) or by commit
+    try:
+        return history[int(ref)]
+    except ValueError:
+        for entry in reversed(history):
+            if entry["commit"] is not None and entry["commit"].startswith(ref):
+                return entry
+        raise ValueError("no history entry for commit " + ref)
+
+
+def compare(old, new, threshold):
+    """
+    Returns (name, metric, old value, new value, relative change, regressed) for every
+    metric measured in both results. The relative change is positive when new is better.
+    """
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        for metric in sorted(set(old[name]) & set(new[name])):
+            before = old[name][metric]
+            after = new[name][metric]
+            if before == 0:
+                continue
+            change = (after - before) / before
+            if not metric.endswith("_per_sec"):
+                change = -change
+            rows.append((name, metric, before, after, change, change < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulator and track regressions")
+    parser.add_argument("--history", default=HISTORY, help="history file, one JSON line per run")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and append the results to the history")
+    run_parser.add_argument("--quick", action="store_true", help="fewer cases and shorter runs")
+    run_parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    run_parser.add_argument("--repeat", type=int, default=3, help="times each benchmark is run, the best is kept")
+    run_parser.add_argument("--no-save", dest="save", action="store_false", help="don't append to the history")
+    compare_parser = commands.add_parser("compare", help="compare two runs from the history")
+    compare_parser.add_argument("old", nargs="?", default="-2", help="history index or commit (default: second to last)")
+    compare_parser.add_argument("new", nargs="?", default="-1", help="history index or commit (default: last)")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.quick, args.only, args.repeat)
+        if args.save:
+            append_history(results, args.history)
+        return
+
+    history = load_history(args.history)
+    try:
+        old = find_entry(history, args.old)
+        new = find_entry(history, args.new)
+    except (ValueError, IndexError) as e:
+        parser.error(str(e) or "no such history entry")
+    print("old: %s %s   new: %s %s" % (old["commit"], old["time"], new["commit"], new["time"]))
+    regressions = 0
+    for name, metric, before, after, change, regressed in compare(old["results"], new["results"], args.threshold):
+        regressions += regressed
+        print("%-60s %-18s %14.1f %14.1f %+7.1f%%%s" % (name, metric, before, after, 100 * change,
+                                                       "  REGRESSION" if regressed else ""))
+    print(str(regressions) + " regressions beyond " + str(100 * args.threshold) + "%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
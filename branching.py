@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+What-if branches that share a warmed-up simulation.
+
+Simulator.branch() (see run_branches()) takes a simulator that has already run a
+common prefix, e.g. a long AIMD warm-up, and runs every branch from that state in
+its own process, forked from the parent: copy-on-write shares the warmed-up host,
+link and delay box with every branch instead of copying or re-simulating them, so
+N branches cost the prefix once plus their N suffixes rather than N full runs. The
+parent's simulator is left untouched.
+
+A branch is either a dict of changes, among
+
+    loss_ratio, loss_model:     the link's losses (see loss_models.make_loss_model()); a
+                                loss_ratio on its own means i.i.d. losses, whatever
+                                loss model the parent had
+    queue_limit:                the link's queue limit (a queue already above it drains)
+    min_timeout, max_timeout:   the bounds of the host's TimeoutCalculator
+    seed:                       the seed of the branch's random stream
+
+or a function that changes the simulator it is given as it likes. Either way the
+branch then runs up to until, and its result is collect(simulator) (the largest in
+order received sequence number by default), sent back to the parent.
+
+Every branch draws its losses from its own random.Random, seeded with its "seed"
+if it has one and otherwise from the state the parent has reached (its tick and
+random streams) and the index of the branch, so branches are independent of each
+other and of the parent, and give the same results on every run. Tracers,
+profilers and metrics attached to the parent are detached in the branches, which
+would otherwise share their files.
+
+Branching needs os.fork(), so it is not available on Windows:
+
+    python branching.py --seed 1 --host_type aimd --rtt_min 10 --warmup 1000000 --ticks 1200000 --loss_ratio 0.0 0.01 0.05
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import traceback
+from multiprocessing.connection import wait
+from loss_models import IID, make_loss_model
+
+CHANGES = ["loss_ratio", "loss_model", "queue_limit", "min_timeout", "max_timeout", "seed"]
+
+
+def branch_seed(simulator, index):
+    # Seed of branch index, derived from the state the parent has reached without
+    # drawing from it. The loss model draws from a generator of its own and hands
+    # decisions out of a buffer (see loss_models.py), so simulator.rng alone doesn't
+    # move as the parent runs: its tick and the loss model's position are hashed too.
+    loss_model = simulator.link.loss_model
+    generator = getattr(loss_model, "generator", None)
+    state = pickle.dumps((simulator.now, simulator.rng.getstate(),
+                          generator.bit_generator.state if generator is not None else None,
+                          getattr(loss_model, "pos", None)))
+    return int.from_bytes(hashlib.sha256(state + b"/%d" % index).digest()[:8], "little")
+
+
+def in_order_rx_seq(simulator):
+    return simulator.host.in_order_rx_seq
+
+
+def apply_changes(simulator, changes, seed):
+    """
+    Gives simulator a random stream of its own, seeded with seed, and applies the
+    changes of a branch, a dict of CHANGES or a function of the simulator
+    """
+    custom = callable(changes)
+    params = {} if custom else changes
+    for key in params:
+        if key not in CHANGES:
+            raise ValueError("Unknown branch parameter " + key)
+    simulator.attach_tracer(None)
+    simulator.attach_profiler(None)
+    simulator.attach_metrics(None)
+    link = simulator.link
+    simulator.rng = random.Random(params.get("seed", seed))
+    # A new loss_ratio alone means i.i.d. losses, which the parent's loss_model would ignore
+    loss_model = params.get("loss_model", None if "loss_ratio" in params else simulator.loss_model)
+    if "loss_ratio" in params and loss_model is not None and loss_model.get("type", IID) != IID:
+        raise ValueError("loss_ratio only applies to iid losses, not to a %s loss_model" % loss_model["type"])
+    link.loss_ratio = params.get("loss_ratio", link.loss_ratio)
+    simulator.loss_model = loss_model
+    # The loss model takes the new stream over, even when the losses don't change
+    link.loss_model = make_loss_model(simulator.loss_model, link.loss_ratio, simulator.rng)
+    link.queue_limit = params.get("queue_limit", link.queue_limit)
+    timeout_calculator = simulator.host.timeout_calculator
+    timeout_calculator.min_timeout = params.get("min_timeout", timeout_calculator.min_timeout)
+    timeout_calculator.max_timeout = params.get("max_timeout", timeout_calculator.max_timeout)
+    timeout_calculator.timeout = min(max(timeout_calculator.timeout, timeout_calculator.min_timeout),
+                                     timeout_calculator.max_timeout)
+    if custom:
+        changes(simulator)
+
+
+def run_branch(simulator, changes, seed, until, collect, connection):
+    # Runs in the forked process: the simulator is this process's copy of the parent's
+    try:
+        apply_changes(simulator, changes, seed)
+        simulator.run(until)
+        connection.send(("result", collect(simulator)))
+    except BaseException:
+        connection.send(("error", traceback.format_exc()))
+    finally:
+        connection.close()
+        sys.stdout.flush()
+
+
+def run_branches(simulator, branches, until, workers=None, collect=in_order_rx_seq):
+    """
+    Runs every branch from the current state of simulator up to until, each in a
+    process forked from this one, at most workers at a time. Returns one dict per
+    branch, in the order of branches: its "branch" index and the "result" of
+    collect (which must be picklable), or an "error" with the traceback if it failed.
+
+    Args:
+
+        **branches**: List of branches, each a dict of CHANGES or a function of the simulator
+
+        **until**: Tick up to which every branch runs
+
+        **workers**: Number of branches run at once, defaults to the number of CPUs
+
+        **collect**: Function of a branch's simulator once it has run, returning its result
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise ValueError("branching needs os.fork(), which is not available on this platform")
+    context = multiprocessing.get_context("fork")
+    workers = workers if workers is not None else os.cpu_count() or 1
+    seeds = [branch_seed(simulator, index) for index in range(0, len(branches))]
+    results = [None] * len(branches)
+    running = {}
+    next_branch = 0
+    # Output still buffered when forking would be printed by every branch
+    sys.stdout.flush()
+    sys.stderr.flush()
+    while next_branch < len(branches) or running:
+        while next_branch < len(branches) and len(running) < workers:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=run_branch,
+                                      args=(simulator, branches[next_branch], seeds[next_branch], until, collect, sender))
+            process.start()
+            sender.close()
+            running[receiver] = (next_branch, process)
+            next_branch += 1
+        for receiver in wait(list(running)):
+            index, process = running.pop(receiver)
+            try:
+                kind, value = receiver.recv()
+            except EOFError:
+                kind, value = "error", "branch process exited with code %s" % process.exitcode
+            receiver.close()
+            process.join()
+            results[index] = {"branch": index, kind: value}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm a simulation up once, then run what-if branches of it in forked processes. "
+                                                 "Every value given to a branch option is one branch that changes that parameter only")
+    parser.add_argument("--seed", type=int, required=True)
+    parser.add_argument("--host_type", choices=["stopandwait", "slidingwindow", "aimd"], required=True)
+    parser.add_argument("--rtt_min", type=int, required=True)
+    parser.add_argument("--warmup", type=int, required=True, help="ticks of the common prefix")
+    parser.add_argument("--ticks", type=int, required=True, help="tick up to which every branch runs")
+    parser.add_argument("--window_size", type=int, help="Window size in packets for sliding window senders")
+    parser.add_argument("--base_loss_ratio", type=float, default=0.0, help="loss ratio of the prefix, default 0")
+    parser.add_argument("--base_queue_limit", type=int, default=1000000, help="queue limit of the prefix, default 1000000")
+    parser.add_argument("--loss_ratio", type=float, nargs="*", default=[], help="branch loss ratios")
+    parser.add_argument("--queue_limit", type=int, nargs="*", default=[], help="branch queue limits")
+    parser.add_argument("--min_timeout", type=int, nargs="*", default=[], help="branch minimum timeouts")
+    parser.add_argument("--max_timeout", type=int, nargs="*", default=[], help="branch maximum timeouts")
+    parser.add_argument("--workers", type=int, default=None, help="number of branches run at once, defaults to the number of CPUs")
+    args = parser.parse_args()
+
+    from simulator import Simulator, make_host
+    host = make_host(args.host_type, args.window_size, verbose=False)
+    simulator = Simulator(host, args.base_loss_ratio, args.base_queue_limit, args.rtt_min, args.seed, verbose=False)
+    simulator.run(args.warmup)
+    print("Prefix: maximum in order received sequence number %d at tick %d" % (host.in_order_rx_seq, args.warmup))
+    branches = []
+    for key in ["loss_ratio", "queue_limit", "min_timeout", "max_timeout"]:
+        branches.extend({key: value} for value in getattr(args, key))
+    for result in run_branches(simulator, branches, args.ticks, workers=args.workers):
+        changes = ", ".join("%s %s" % item for item in branches[result["branch"]].items())
+        if "error" in result:
+            print("Branch %s failed:\n%s" % (changes, result["error"]))
+        else:
+            print("Branch %s: maximum in order received sequence number %d" % (changes, result["result"]))
+
+
+if __name__ == "__main__":
+    main()
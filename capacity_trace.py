@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Trace-driven link capacity.
+
+A Link given a CapacityTrace doesn't earn its rate every tick: it earns the
+delivery opportunities the trace lists for that tick, one packet's worth each (one
+packet, or Packet.SIZE bytes when its rate_unit is BYTES). The trace loops once
+its period is over, so a recorded trace of a few minutes can drive runs of any
+length.
+
+Traces are read from a binary file that is memory-mapped, not loaded: only the
+pages around the ticks being simulated are ever read from disk, so traces tens of
+millions of entries long cost neither startup time nor memory. The file stores
+only the ticks that have opportunities, which is what lets Link.next_event_tick()
+jump over stretches without capacity in one step (a binary search), whatever
+their length. The file is made of
+
+    MAGIC, then the period in ticks and the number n of ticks with opportunities
+    (little-endian uint64s), then two little-endian int64 columns of n entries:
+    the ticks with opportunities (0 <= tick < period, increasing) and the
+    cumulative number of opportunities up to and including each of them
+
+Binary traces are made from text traces by convert(), or from the command line:
+
+    python capacity_trace.py trace.txt trace.bin --format mahimahi
+
+The text formats are
+
+    mahimahi: one timestamp in ms per line, a delivery opportunity for one packet
+              at that time (repeated lines for several packets), the last
+              timestamp being the period, as in Mahimahi's cellular traces. Tick t
+              is ms t + 1 of the trace, so that tick 0 is its first ms.
+    counts:   one line per tick, the number of opportunities on that tick, the
+              period being the number of lines
+
+Lines that are empty or start with # are skipped in both formats.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+MAGIC = b"NSCAPTR1"
+HEADER = struct.Struct("<8sQQ")
+
+MAHIMAHI = "mahimahi"
+COUNTS = "counts"
+
+# Entries written per block by convert()
+BLOCK = 1 << 16
+
+
+class CapacityTrace:
+    """
+    Delivery opportunities per tick, read from the binary trace file at path.
+    Ticks count from 0 and loop over the trace every period ticks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(self.path + " is not a capacity trace file")
+            _, self.period, self.entries = HEADER.unpack(header)
+            if self.period < 1 or self.entries < 1:
+                raise ValueError(self.path + " has no delivery opportunities")
+            if os.fstat(f.fileno()).st_size != HEADER.size + 16 * self.entries:
+                raise ValueError(self.path + " is truncated")
+            self.mmap = None
+            if sys.byteorder == "little":
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(self.mmap)
+                end = HEADER.size + 8 * self.entries
+                self.ticks = view[HEADER.size:end].cast("q")
+                self.cumulative_counts = view[end:end + 8 * self.entries].cast("q")
+            else:
+                # A mapping can't be byteswapped lazily, so big-endian machines read the columns in
+                self.ticks = array("q")
+                self.ticks.fromfile(f, self.entries)
+                self.cumulative_counts = array("q")
+                self.cumulative_counts.fromfile(f, self.entries)
+                self.ticks.byteswap()
+                self.cumulative_counts.byteswap()
+        # Opportunities per period
+        self.total = self.cumulative_counts[-1]
+
+    def close(self):
+        if self.mmap is not None:
+            self.ticks.release()
+            self.cumulative_counts.release()
+            self.mmap.close()
+            self.mmap = None
+
+    def __getstate__(self):
+        # Checkpoints save the path, the mapping is made again when they are loaded
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.open()
+
+    def cumulative(self, tick):
+        """
+        Returns the number of opportunities on the ticks before tick
+        """
+        loops, offset = divmod(tick, self.period)
+        index = bisect.bisect_left(self.ticks, offset)
+        return loops * self.total + (self.cumulative_counts[index - 1] if index > 0 else 0)
+
+    def opportunities(self, start, end):
+        """
+        Returns the number of opportunities on the ticks from start up to (but not including) end
+        """
+        return self.cumulative(end) - self.cumulative(start)
+
+    def tick_of(self, count):
+        """
+        Returns the tick of opportunity number count (counting from 1 at tick 0), i.e.
+        the first tick by the end of which count opportunities have been offered
+        """
+        loops, rest = divmod(count - 1, self.total)
+        index = bisect.bisect_right(self.cumulative_counts, rest)
+        return loops * self.period + self.ticks[index]
+
+    def mean_rate(self):
+        # Long run opportunities per tick
+        return self.total / self.period
+
+
+class TraceWriter:
+    # Writes the ticks column to out and the cumulative column to a temporary file
+    # as they come, so that converting never holds the whole trace in memory
+
+    def __init__(self, out):
+        self.out = out
+        self.out.write(HEADER.pack(MAGIC, 0, 0))
+        self.cumulative_file = tempfile.TemporaryFile()
+        self.ticks = array("q")
+        self.cumulative_counts = array("q")
+        self.entries = 0
+        self.total = 0
+        self.last_tick = -1
+
+    def add(self, tick, count):
+        if count <= 0:
+            return
+        if tick < self.last_tick:
+            raise ValueError("trace ticks must not decrease")
+        self.total += count
+        if tick == self.last_tick:
+            self.cumulative_counts[-1] = self.total
+            return
+        if len(self.ticks) == BLOCK:
+            self.write_block()
+        self.ticks.append(tick)
+        self.cumulative_counts.append(self.total)
+        self.entries += 1
+        self.last_tick = tick
+
+    def write_block(self):
+        for column, f in [(self.ticks, self.out), (self.cumulative_counts, self.cumulative_file)]:
+            if sys.byteorder != "little":
+                column.byteswap()
+            column.tofile(f)
+            del column[:]
+
+    def finish(self, period):
+        if self.entries == 0:
+            raise ValueError("the trace has no delivery opportunities")
+        if self.last_tick >= period:
+            raise ValueError("trace ticks must be below the period")
+        self.write_block()
+        self.cumulative_file.seek(0)
+        shutil.copyfileobj(self.cumulative_file, self.out)
+        self.cumulative_file.close()
+        self.out.seek(0)
+        self.out.write(HEADER.pack(MAGIC, period, self.entries))
+
+
+def trace_lines(f):
+    # Yields the integers of the lines of a text trace
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield int(line)
+        except ValueError:
+            raise ValueError("line %d: %r is not an integer" % (line_number, line))
+
+
+def convert(text_path, path, trace_format=MAHIMAHI):
+    """
+    Converts the text trace at text_path (in the MAHIMAHI or COUNTS format) into a
+    binary trace file at path, and returns its period and total number of opportunities
+    """
+    if trace_format not in [MAHIMAHI, COUNTS]:
+        raise ValueError("trace format must be " + MAHIMAHI + " or " + COUNTS)
+    with open(text_path) as f, open(path, "wb") as out:
+        writer = TraceWriter(out)
+        if trace_format == COUNTS:
+            period = 0
+            for count in trace_lines(f):
+                if count < 0:
+                    raise ValueError("opportunity counts must not be negative")
+                writer.add(period, count)
+                period += 1
+        else:
+            # Tick t is ms t + 1, so opportunities at ms 0 are those at the end of the
+            # previous loop (ms period): they are added to the last tick once it is known
+            period = 0
+            wrapped = 0
+            for timestamp in trace_lines(f):
+                if timestamp < period:
+                    raise ValueError("mahimahi timestamps must not decrease")
+                period = timestamp
+                if timestamp == 0:
+                    wrapped += 1
+                else:
+                    writer.add(timestamp - 1, 1)
+            if period == 0:
+                raise ValueError("the trace must last for at least 1 ms")
+            writer.add(period - 1, wrapped)
+        writer.finish(period)
+    return period, writer.total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a text link capacity trace into the binary format read by CapacityTrace")
+    parser.add_argument("text_trace", help="text trace to convert")
+    parser.add_argument("trace", help="binary trace file to write")
+    parser.add_argument("--format", dest="format", choices=[MAHIMAHI, COUNTS], default=MAHIMAHI,
+                        help="mahimahi: one line per delivery opportunity with its timestamp in ms; counts: the number of opportunities of every tick, one per line; default mahimahi")
+    args = parser.parse_args()
+    period, total = convert(args.text_trace, args.trace, args.format)
+    print("%d opportunities over a period of %d ticks (%.4f per tick)" % (total, period, total / period))
@@ -1,6 +1,33 @@
 #!/usr/bin/env python3
+"""
+Congestion collapse of a sliding window host.
+
+main() simulates a fixed progression of window sizes. find_knee_and_collapse()
+instead searches for the two points of the curve that matter, for any rtt_min,
+queue_limit and loss_ratio:
+
+    knee:     the smallest window whose throughput reaches the peak (within knee_tolerance)
+    collapse: the smallest window above the knee whose throughput falls below
+              collapse_fraction of the peak
+
+A coarse pass simulates windows 1, 2, 4, 8, ... until one has collapsed. The
+peak lies between the coarse windows either side of the best one, and is found by
+simulating points on both sides of the best window so far until its neighbours
+have been simulated. This assumes the throughput rises up to the peak and falls
+after it within that bracket. The peak gives the knee and collapse thresholds,
+and the coarse windows bracket both points. Each bracket is then refined by
+simulating points evenly spaced inside it (one point is a bisection), until it is
+at most tolerance windows wide. Every window is simulated at most once, so finding
+the peak and both points to the exact window takes a few dozen simulations where
+a dense grid takes one per window:
+
+    python congestion_collapse.py --adaptive --rtt_min 10 --queue_limit 1000000
+"""
+
+import argparse
 from simulator import Simulator
 from sliding_window_host import SlidingWindowHost
+from sweep import DEFAULTS, grid, run_config, sweep
 
 
 def return_congested_simulator(host):
@@ -14,8 +41,7 @@ def return_congested_simulator(host):
 def tick_and_get_seq_number(window):
     host = SlidingWindowHost(window, verbose=False)
     simulator = return_congested_simulator(host)
-    for tick in range(0, 10000):
-        simulator.tick(tick)
+    simulator.run(10000)
     # Return the largest sequence number that has been received in order
     print("Maximum in order received sequence number " + str(simulator.host.in_order_rx_seq))
     return simulator.host.in_order_rx_seq
@@ -33,13 +59,169 @@ def main():
     assert len(window_sizes) >= 10
     # Should only increase
     assert all(x <= y for x, y in zip(window_sizes, window_sizes[1:]))
-    results = []
     # TODO: For each window size, call tick_and_get_seq_number
-    for window_size in window_sizes:
-        results.append(tick_and_get_seq_number(window_size))
+    # The window sizes are simulated in parallel, with the same settings as return_congested_simulator
+    configs = grid(host_type="slidingwindow", window_size=window_sizes, rtt_min=10, loss_ratio=0.0,
+                   queue_limit=1000000, seed=1000, ticks=10000)
+    seq_numbers = {}
+    for result in sweep(configs):
+        if "error" in result:
+            raise ValueError("window size %d failed: %s" % (result["window_size"], result["error"]))
+        seq_numbers[result["window_size"]] = result["in_order_rx_seq"]
     # TODO: Collect the results
-    seq_numbers = []
+    results = []
+    for window_size in window_sizes:
+        print("Window size " + str(window_size) + ": maximum in order received sequence number " + str(seq_numbers[window_size]))
+        results.append(seq_numbers[window_size])
+    return results
+
+
+def simulate_windows(windows, settings, results, points):
+    # Simulate the windows that haven't been simulated yet into results, in parallel
+    # when the search simulates several points at a time
+    windows = sorted(set(window for window in windows if window not in results))
+    if points > 1 and len(windows) > 1:
+        for result in sweep(grid(window_size=windows, **settings)):
+            if "error" in result:
+                raise ValueError("window size %d failed: %s" % (result["window_size"], result["error"]))
+            results[result["window_size"]] = result["in_order_rx_seq"]
+    else:
+        for window in windows:
+            results[window] = run_config(dict(DEFAULTS, window_size=window, **settings))
+
+
+def refine(lo, hi, test, settings, results, tolerance, points):
+    # Narrow the bracket (lo, hi), test(hi) being true and test(lo) false, down to at
+    # most tolerance windows. Returns the narrowed bracket.
+    while hi - lo > tolerance:
+        windows = sorted(set(lo + (hi - lo) * i // (points + 1) for i in range(1, points + 1)) - {lo, hi})
+        if not windows:
+            windows = [lo + 1]
+        simulate_windows(windows, settings, results, points)
+        for window in windows:
+            if test(results[window]):
+                hi = window
+                break
+            lo = window
+    return lo, hi
+
+
+def refine_peak(lo, hi, settings, results, points):
+    # Find the best window inside the bracket (lo, hi) by narrowing it around the best
+    # window simulated so far, until the windows either side of that one are simulated
+    while True:
+        best = max((w for w in results if lo < w < hi), key=lambda w: (results[w], -w))
+        lo = max([lo] + [w for w in results if lo < w < best])
+        hi = min([hi] + [w for w in results if best < w < hi])
+        windows = sorted(set(side_lo + (side_hi - side_lo) * i // (points + 1)
+                             for side_lo, side_hi in [(lo, best), (best, hi)]
+                             for i in range(1, points + 1)) - {lo, best, hi})
+        if not windows:
+            return best
+        simulate_windows(windows, settings, results, points)
+
+
+def find_knee_and_collapse(rtt_min=10, queue_limit=1000000, loss_ratio=0.0, seed=1000, ticks=10000, tolerance=1,
+                           max_window=1024, knee_tolerance=0.01, collapse_fraction=0.5, points=1):
+    """
+    Searches for the knee and the collapse of the throughput (largest in order
+    received sequence number) of a sliding window host against its window size.
+    Returns a dict with the peak throughput and the window reaching it, the knee
+    and the collapse (None if no window up to max_window collapses), the (lo, hi]
+    bracket each was narrowed to, the number of simulations run and the results of
+    every window simulated.
+
+    Args:
+
+        **tolerance**: Width in windows below which a bracket is not refined further, 1 for the exact window
+
+        **max_window**: Largest window size the coarse pass goes up to
+
+        **knee_tolerance**: Fraction of the peak below which a window is not on the plateau yet
+
+        **collapse_fraction**: Fraction of the peak below which a window past the peak has collapsed
+
+        **points**: Windows simulated per refinement round, in parallel with sweep() when more than 1
+    """
+    if tolerance < 1 or points < 1 or max_window < 1:
+        raise ValueError("tolerance, points and max_window must be at least 1")
+    settings = {"host_type": "slidingwindow", "rtt_min": rtt_min, "queue_limit": queue_limit,
+                "loss_ratio": loss_ratio, "seed": seed, "ticks": ticks}
+    results = {}
+
+    # Coarse pass: doubling windows, a batch of points at a time, until one past the peak has collapsed
+    ladder = []
+    window = 1
+    while window < max_window:
+        ladder.append(window)
+        window *= 2
+    ladder.append(max_window)
+    for i in range(0, len(ladder), points):
+        simulate_windows(ladder[i:i + points], settings, results, points)
+        coarse = ladder[:i + points]
+        peak_window = max(coarse, key=lambda w: results[w])
+        if any(w > peak_window and results[w] < collapse_fraction * results[peak_window] for w in coarse):
+            break
+
+    # Peak: between the coarse windows either side of the best one
+    index = ladder.index(peak_window)
+    peak_lo = ladder[index - 1] if index > 0 else 0
+    peak_hi = ladder[index + 1] if index + 1 < len(ladder) else max_window + 1
+    peak_window = refine_peak(peak_lo, peak_hi, settings, results, points)
+    peak = results[peak_window]
+
+    # Knee: between the last window simulated below the plateau and the first one on it
+    on_plateau = lambda seq: seq >= (1 - knee_tolerance) * peak
+    knee_hi = min(w for w in results if on_plateau(results[w]))
+    below = [w for w in results if w < knee_hi]
+    knee = knee_hi
+    knee_bracket = (knee_hi, knee_hi)
+    if below:
+        knee_bracket = refine(max(below), knee_hi, on_plateau, settings, results, tolerance, points)
+        knee = knee_bracket[1]
+
+    # Collapse: between the first window simulated past the knee that gets less than
+    # collapse_fraction of the peak and the window simulated before it. Assumes the
+    # curve only collapses once in between.
+    collapse = None
+    collapse_bracket = None
+    has_collapsed = lambda seq: seq < collapse_fraction * peak
+    past_knee = [w for w in results if w > knee and has_collapsed(results[w])]
+    if past_knee:
+        collapsed = min(past_knee)
+        collapse_lo = max(w for w in results if w < collapsed)
+        collapse_bracket = refine(collapse_lo, collapsed, has_collapsed, settings, results, tolerance, points)
+        collapse = collapse_bracket[1]
+
+    return {"peak": peak, "peak_window": peak_window, "knee": knee, "knee_bracket": knee_bracket, "collapse": collapse,
+            "collapse_bracket": collapse_bracket, "simulations": len(results), "results": results}
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Congestion collapse curve of a sliding window host")
+    parser.add_argument("--adaptive", action="store_true", help="search for the knee and the collapse instead of simulating the fixed window sizes")
+    parser.add_argument("--rtt_min", type=int, default=10)
+    parser.add_argument("--queue_limit", type=int, default=1000000)
+    parser.add_argument("--loss_ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=10000)
+    parser.add_argument("--tolerance", type=int, default=1, help="width in windows of the brackets to stop at, default 1 (the exact window)")
+    parser.add_argument("--max_window", type=int, default=1024, help="largest window size to search, default 1024")
+    parser.add_argument("--points", type=int, default=1, help="windows simulated in parallel per refinement round, default 1 (bisection)")
+    args = parser.parse_args()
+    if not args.adaptive:
+        main()
+    else:
+        search = find_knee_and_collapse(rtt_min=args.rtt_min, queue_limit=args.queue_limit, loss_ratio=args.loss_ratio,
+                                        seed=args.seed, ticks=args.ticks, tolerance=args.tolerance,
+                                        max_window=args.max_window, points=args.points)
+        for window in sorted(search["results"]):
+            print("Window size " + str(window) + ": maximum in order received sequence number " + str(search["results"][window]))
+        print("Peak: window size %d, maximum in order received sequence number %d" % (search["peak_window"], search["peak"]))
+        print("Knee: window size %d, bracket %s" % (search["knee"], search["knee_bracket"]))
+        if search["collapse"] is not None:
+            print("Collapse: window size %d, bracket %s" % (search["collapse"], search["collapse_bracket"]))
+        else:
+            print("Collapse: none up to window size " + str(args.max_window))
+        print("%d simulations (a dense grid up to the largest window simulated would take %d)" %
+              (search["simulations"], max(search["results"])))
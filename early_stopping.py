@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Multi-seed experiments that stop each configuration as soon as its estimate is
+precise enough.
+
+run_experiment() estimates the mean in_order_rx_seq of every configuration (the
+dicts of sweep.grid()) over seeds first_seed, first_seed + 1, ... It keeps a
+running mean and variance per configuration and stops giving it seeds once the
+half-width of the confidence interval of its mean is at most the target (absolute,
+or relative to the mean), after at least min_seeds and at most max_seeds seeds.
+Configurations that converge early stop using workers, which go to the
+configurations still short of the target: every free worker is given a seed of
+the configuration with the most seeds left to run, as estimated from its current
+variance. Deterministic configurations therefore cost min_seeds runs and noisy
+ones as many as they need, instead of everything costing a worst-case fixed count.
+
+Results are folded into the statistics in seed order, so the seeds a
+configuration stops at don't depend on the number of workers or on which run
+finished first. Runs of seeds past the stopping point that were already under
+way are discarded. A run that raises stops its configuration, whose result then
+carries an "error" (as in sweep()) and the statistics of the seeds before it,
+while the other configurations carry on.
+
+    python early_stopping.py --host_type slidingwindow --window_size 10 --loss_ratio 0.0 0.01 0.05 --half_width 0.02 --relative
+"""
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from statistics import NormalDist
+from simulator import check_host_type
+from sweep import DEFAULTS, grid, init_worker, run_config
+
+
+def t_quantile(p, df):
+    """
+    Returns the p-quantile of Student's t distribution with df degrees of freedom:
+    exact for 1 and 2 degrees of freedom, from the Cornish-Fisher expansion
+    (Abramowitz and Stegun 26.7.5) beyond, which is within 0.5% for 95% intervals
+    and 0.8% for 99% intervals from 3 degrees of freedom on and improves quickly
+    with more
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    z2 = z * z
+    return (z
+            + z * (z2 + 1) / (4 * df)
+            + z * ((5 * z2 + 16) * z2 + 3) / (96 * df ** 2)
+            + z * (((3 * z2 + 19) * z2 + 17) * z2 - 15) / (384 * df ** 3)
+            + z * ((((79 * z2 + 776) * z2 + 1482) * z2 - 1920) * z2 - 945) / (92160 * df ** 4))
+
+
+class RunningStats:
+    """
+    Count, mean and variance of a stream of values (Welford's algorithm), and the
+    confidence interval of the mean
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the mean
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        # Sample variance, nan below 2 values
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def half_width(self, confidence=0.95):
+        # Half-width of the confidence interval of the mean, inf below 2 values
+        if self.count < 2:
+            return math.inf
+        return t_quantile(0.5 + confidence / 2, self.count - 1) * math.sqrt(self.variance() / self.count)
+
+
+class Estimate:
+    # One configuration of an experiment: its statistics, the results that came in
+    # ahead of their turn, and the seeds handed out so far
+
+    def __init__(self, config, first_seed):
+        self.config = config
+        self.stats = RunningStats()
+        self.waiting = {}
+        self.next_seed = first_seed
+        self.next_result = first_seed
+        self.in_flight = 0
+        self.done = False
+        self.error = None
+
+    def target(self, half_width, relative):
+        return half_width * abs(self.stats.mean) if relative else half_width
+
+    def converged(self, half_width, relative, confidence, min_seeds):
+        return self.stats.count >= min_seeds and self.stats.half_width(confidence) <= self.target(half_width, relative)
+
+    def seeds_left(self, half_width, relative, confidence, min_seeds, max_seeds):
+        # Seeds still to hand out before the target is expected to be met: from the
+        # current variance, n seeds give a half-width of t * stdev / sqrt(n)
+        count = self.stats.count
+        needed = min_seeds
+        if count >= 2 and count >= min_seeds:
+            target = self.target(half_width, relative)
+            spread = t_quantile(0.5 + confidence / 2, count - 1) * math.sqrt(self.stats.variance())
+            needed = max(count + 1, math.ceil((spread / target) ** 2) if target > 0 else max_seeds)
+        return min(needed, max_seeds) - count - len(self.waiting) - self.in_flight
+
+
+def run_experiment(configs, half_width, relative=False, confidence=0.95, min_seeds=5, max_seeds=1000, first_seed=1,
+                   workers=None):
+    """
+    Runs every configuration on as many seeds as it needs and returns one result
+    dict per configuration, in the order of configs: the configuration (without
+    its seed) with the number of seeds used, the mean, standard deviation and
+    confidence interval half-width of in_order_rx_seq, and whether it converged
+    (False if it stopped at max_seeds). A configuration one of whose runs raised
+    has an "error" too, and the statistics of the seeds before that one.
+
+    Args:
+
+        **configs**: List of configuration dicts (see sweep.grid()), their seed is ignored
+
+        **half_width**: Target half-width of the confidence interval of the mean
+
+        **relative**: Whether half_width is a fraction of the mean rather than in sequence numbers
+
+        **confidence**: Confidence level of the interval
+
+        **min_seeds**, **max_seeds**: Bounds on the number of seeds of every configuration
+
+        **workers**: Number of worker processes, defaults to the number of CPUs
+    """
+    if min_seeds < 2 or max_seeds < min_seeds:
+        raise ValueError("min_seeds must be at least 2 and at most max_seeds")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+    estimates = [Estimate(dict(config), first_seed) for config in configs]
+    workers = workers if workers is not None else os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        running = {}
+        while True:
+            # Keep every worker busy with the configurations that have the most seeds left
+            while len(running) < workers:
+                left, index = max(((estimate.seeds_left(half_width, relative, confidence, min_seeds, max_seeds), -index)
+                                   for index, estimate in enumerate(estimates) if not estimate.done),
+                                  default=(0, None))
+                if left <= 0:
+                    break
+                index = -index
+                estimate = estimates[index]
+                future = executor.submit(run_config, dict(estimate.config, seed=estimate.next_seed))
+                running[future] = (index, estimate.next_seed)
+                estimate.next_seed += 1
+                estimate.in_flight += 1
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, seed = running.pop(future)
+                estimate = estimates[index]
+                estimate.in_flight -= 1
+                if estimate.done:
+                    continue
+                try:
+                    estimate.waiting[seed] = future.result()
+                except Exception as e:
+                    estimate.waiting[seed] = e
+                while estimate.next_result in estimate.waiting and not estimate.done:
+                    value = estimate.waiting.pop(estimate.next_result)
+                    if isinstance(value, Exception):
+                        estimate.error = "seed %d: %r" % (estimate.next_result, value)
+                        estimate.done = True
+                        break
+                    estimate.stats.add(value)
+                    estimate.next_result += 1
+                    if (estimate.converged(half_width, relative, confidence, min_seeds)
+                            or estimate.stats.count >= max_seeds):
+                        estimate.done = True
+                if estimate.done:
+                    estimate.waiting = {}
+                    for other, (other_index, _) in list(running.items()):
+                        if other_index == index and other.cancel():
+                            del running[other]
+                            estimate.in_flight -= 1
+    results = []
+    for estimate in estimates:
+        result = {key: value for key, value in estimate.config.items() if key != "seed"}
+        stats = estimate.stats
+        result["seeds"] = stats.count
+        result["mean"] = stats.mean
+        result["stdev"] = math.sqrt(stats.variance()) if stats.count > 1 else math.nan
+        result["half_width"] = stats.half_width(confidence)
+        result["converged"] = estimate.error is None and estimate.converged(half_width, relative, confidence, min_seeds)
+        if estimate.error is not None:
+            result["error"] = estimate.error
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the mean in order received sequence number of a grid of configurations, "
+                                                 "running each on seeds until its confidence interval is narrow enough")
+    parser.add_argument("--host_type", type=check_host_type, nargs="+", default=[DEFAULTS["host_type"]])
+    parser.add_argument("--window_size", type=int, nargs="+", default=[DEFAULTS["window_size"]])
+    parser.add_argument("--rtt_min", type=int, nargs="+", default=[DEFAULTS["rtt_min"]])
+    parser.add_argument("--loss_ratio", type=float, nargs="+", default=[DEFAULTS["loss_ratio"]])
+    parser.add_argument("--queue_limit", type=int, nargs="+", default=[DEFAULTS["queue_limit"]])
+    parser.add_argument("--ticks", type=int, default=DEFAULTS["ticks"])
+    parser.add_argument("--half_width", type=float, required=True, help="target half-width of the confidence interval of the mean")
+    parser.add_argument("--relative", action="store_true", help="half_width is a fraction of the mean")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level, default 0.95")
+    parser.add_argument("--min_seeds", type=int, default=5, help="seeds every configuration runs at least, default 5")
+    parser.add_argument("--max_seeds", type=int, default=1000, help="seeds a configuration runs at most, default 1000")
+    parser.add_argument("--first_seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+
+    configs = grid(host_type=args.host_type, window_size=args.window_size, rtt_min=args.rtt_min,
+                   loss_ratio=args.loss_ratio, queue_limit=args.queue_limit, ticks=args.ticks)
+    results = run_experiment(configs, args.half_width, relative=args.relative, confidence=args.confidence,
+                             min_seeds=args.min_seeds, max_seeds=args.max_seeds, first_seed=args.first_seed,
+                             workers=args.workers)
+    keys = ["host_type", "window_size", "rtt_min", "loss_ratio", "queue_limit"]
+    print(",".join(keys + ["seeds", "mean", "stdev", "half_width", "converged", "error"]))
+    for result in results:
+        print(",".join(str(result[key]) for key in keys) + ",%d,%.2f,%.2f,%.2f,%s,%s" %
+              (result["seeds"], result["mean"], result["stdev"], result["half_width"], result["converged"],
+               result.get("error", "")))
+    total = sum(result["seeds"] for result in results)
+    print("%d seeds in total, %d with a fixed %d seeds per configuration" % (total, args.max_seeds * len(results), args.max_seeds))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
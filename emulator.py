@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Real-time emulation: the link and the delay box paced to wall-clock time, with
+hosts attached over UDP on localhost.
+
+LinkEmulator runs a Link and a DelayBox as an asyncio loop that starts tick t at
+t * tick_duration seconds after it started. Hosts (StopAndWaitHost,
+SlidingWindowHost, AimdHost, unchanged) run in a HostEndpoint, the same kind of
+loop, in this process or another one: every tick the endpoint hands the ACKs that
+came back to host.recv() and sends what host.send() returns to the emulator.
+Every host address the emulator hears from is a flow of its own, so several host
+processes can share the link (and its scheduler). As in Simulator, the ACK of a
+packet is the packet itself coming back out of the delay box.
+
+Each side keeps its own tick count, and hosts time their packets by their own
+ticks, so the two clocks don't have to agree. On the wire packets are records of
+seq_num, sent_ts (int64) and size (uint32), little-endian, after a uint16 count:
+all the packets one side sends to the other on a tick go in one datagram (or as
+few as fit), so sockets see one system call per tick and direction rather than
+one per packet. Sockets are asyncio datagram transports: the datagrams the loop
+receives while it waits for a tick are kept until the tick starts, which reads
+them all before doing anything else. Datagrams are packed into buffers allocated
+once, and packets come from the Packet free list.
+
+A tick that starts late doesn't shift the ticks after it: they keep their wall-clock
+deadlines and run back to back until the loop has caught up. Every loop records how
+late each tick started and how long it took (in microseconds), and reports them
+with the achieved tick rate and the number of ticks that started more than a whole
+tick late, which shows how fine a tick the emulator sustains. The wait for a tick
+is an asyncio sleep, which the selectors round up to the millisecond, so ticks may
+start up to a millisecond late. With spin the last spin seconds before every
+deadline are spun instead, going round the loop every time so that its I/O and
+other tasks still run: a spin of a millisecond keeps ticks of a millisecond or
+less on time, at the cost of a busy core:
+
+    python emulator.py run --host_type aimd --rtt_min 10 --ticks 20000 --tick_ms 1
+    python emulator.py link --port 9000 --rtt_min 10 --ticks 20000 --tick_ms 1
+    python emulator.py host --emulator 127.0.0.1:9000 --host_type aimd --ticks 20000 --tick_ms 1
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import struct
+import time
+from metrics import Aggregate, QuantileSketch, Stream
+from network import DelayBox, Link
+from packet import Packet
+from loss_models import make_loss_model
+from capacity_trace import CapacityTrace
+
+RECORD = struct.Struct("<qqI")
+COUNT = struct.Struct("<H")
+# Largest UDP payload, and the records that fit in it
+DATAGRAM = 65507
+RECORDS = (DATAGRAM - COUNT.size) // RECORD.size
+SOCKET_BUFFER = 1 << 22
+
+
+class Pacer:
+    """
+    Starts tick t at t * tick_duration seconds after the first tick, and records how
+    late every tick started and how long it ran
+    """
+
+    def __init__(self, tick_duration, spin=0.0):
+        if tick_duration <= 0:
+            raise ValueError("tick_duration must be positive")
+        self.tick_duration = tick_duration
+        self.spin = spin
+        self.start = None
+        self.tick_start = None
+        self.lateness = Aggregate()
+        self.lateness_sketch = QuantileSketch()
+        self.busy = Aggregate()
+        self.busy_sketch = QuantileSketch()
+        self.late_ticks = 0
+        self.ticks = 0
+
+    async def wait(self, tick):
+        # Returns once tick is due
+        clock = time.perf_counter
+        now = clock()
+        if self.start is None:
+            self.start = now
+        elif self.tick_start is not None:
+            busy = (now - self.tick_start) * 1e6
+            self.busy.add(busy)
+            self.busy_sketch.add(busy)
+        deadline = self.start + tick * self.tick_duration
+        # Late or nearly due, this still goes round the loop once, so its I/O gets done
+        await asyncio.sleep(max(0.0, deadline - now - self.spin))
+        # The last spin seconds (or what the loop woke up early by) are spun, yielding to the loop
+        now = clock()
+        while now < deadline:
+            await asyncio.sleep(0)
+            now = clock()
+        late = now - deadline
+        self.lateness.add(late * 1e6)
+        self.lateness_sketch.add(late * 1e6)
+        if late > self.tick_duration:
+            self.late_ticks += 1
+        self.ticks += 1
+        self.tick_start = now
+
+    def report(self):
+        """
+        Returns the target and achieved tick rates, and the lateness and run time of
+        the ticks in microseconds
+        """
+        elapsed = time.perf_counter() - self.start if self.start is not None else 0.0
+        return {
+            "ticks": self.ticks,
+            "target_rate": 1 / self.tick_duration,
+            "achieved_rate": self.ticks / elapsed if elapsed > 0 else 0.0,
+            "late_ticks": self.late_ticks,
+            "lateness_us": Stream.describe(self.lateness, self.lateness_sketch),
+            "busy_us": Stream.describe(self.busy, self.busy_sketch),
+        }
+
+
+def open_socket(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for option in [socket.SO_RCVBUF, socket.SO_SNDBUF]:
+        sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+    sock.bind(address)
+    sock.setblocking(False)
+    return sock
+
+
+class Endpoint(asyncio.DatagramProtocol):
+    """
+    Datagram transport of a socket opened by open_socket(), which keeps the
+    datagrams received between two ticks until drain() reads them
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.transport = None
+        self.datagrams = []
+
+    async def open(self):
+        # Hands the socket over to the running loop
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, sock=self.sock)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        self.datagrams.append((data, address))
+
+    def error_received(self, exc):
+        # An earlier datagram found nobody listening (reported by some platforms)
+        pass
+
+    def close(self):
+        # The transport closes the socket, and has to be closed while its loop runs
+        if self.transport is not None:
+            if not self.transport.is_closing():
+                self.transport.close()
+        else:
+            self.sock.close()
+
+
+class Batch:
+    # Packets on their way to one address, packed into a datagram buffer allocated once
+
+    def __init__(self, endpoint, address):
+        self.endpoint = endpoint
+        self.address = address
+        self.buffer = bytearray(DATAGRAM)
+        self.view = memoryview(self.buffer)
+        self.count = 0
+
+    def add(self, pkt):
+        if self.count == RECORDS:
+            self.flush()
+        RECORD.pack_into(self.buffer, COUNT.size + self.count * RECORD.size, pkt.seq_num, pkt.sent_ts, pkt.size)
+        self.count += 1
+
+    def flush(self):
+        if self.count == 0:
+            return
+        COUNT.pack_into(self.buffer, 0, self.count)
+        transport = self.endpoint.transport
+        # The transport only buffers datagrams once the socket buffer is full: the
+        # datagram is lost then, as it would be on a real network
+        if transport.get_write_buffer_size() == 0:
+            transport.sendto(self.view[:COUNT.size + self.count * RECORD.size], self.address)
+        self.count = 0
+
+
+def drain(endpoint, receive):
+    # Hands every record of every datagram endpoint received to receive(seq_num, sent_ts, size, address)
+    datagrams = endpoint.datagrams
+    for data, address in datagrams:
+        if len(data) < COUNT.size:
+            continue
+        count = min(COUNT.unpack_from(data, 0)[0], (len(data) - COUNT.size) // RECORD.size)
+        for offset in range(COUNT.size, COUNT.size + count * RECORD.size, RECORD.size):
+            seq_num, sent_ts, size = RECORD.unpack_from(data, offset)
+            receive(seq_num, sent_ts, size, address)
+    datagrams.clear()
+
+
+class LinkEmulator:
+    """
+    A Link and a DelayBox of rtt_min - 1 ticks, paced to wall-clock time and fed by
+    the hosts that send to address. The link parameters are those of Simulator.
+    """
+
+    def __init__(self, address, rtt_min, tick_duration, loss_ratio=0.0, queue_limit=1000000, seed=1,
+                 link_rate=1, rate_unit=Link.PACKETS, limit_unit=Link.PACKETS, scheduler=Link.FIFO,
+                 loss_model=None, capacity_trace=None, spin=0.0):
+        if rtt_min < 2:
+            raise ValueError("rtt_min must be at least 2")
+        self.rng = random.Random(seed)
+        self.link = Link(loss_ratio=loss_ratio, queue_limit=queue_limit, verbose=False, rate=link_rate,
+                         rate_unit=rate_unit, limit_unit=limit_unit, rng=self.rng, scheduler=scheduler,
+                         loss_model=make_loss_model(loss_model, loss_ratio, self.rng),
+                         capacity_trace=CapacityTrace(capacity_trace) if capacity_trace is not None else None)
+        self.pdbox = DelayBox(rtt_min - 1)
+        sock = open_socket(address)
+        self.address = sock.getsockname()
+        self.endpoint = Endpoint(sock)
+        self.pacer = Pacer(tick_duration, spin)
+        # Flow id of every host address, and the batch of ACKs going back to each flow
+        self.flows = {}
+        self.batches = []
+        self.tick_val = 0
+        self.received = 0
+        self.delivered = 0
+
+    def flow_id(self, address):
+        flow_id = self.flows.get(address)
+        if flow_id is None:
+            flow_id = self.flows[address] = len(self.batches)
+            self.batches.append(Batch(self.endpoint, address))
+        return flow_id
+
+    def receive(self, seq_num, sent_ts, size, address):
+        pkt = Packet.alloc(sent_ts, seq_num, size)
+        pkt.flow_id = self.flow_id(address)
+        self.received += 1
+        self.link.recv(pkt, self.tick_val)
+
+    def recv(self, pkt, tick):
+        # Called by the delay box: the packet goes back to its host as the ACK
+        self.batches[pkt.flow_id].add(pkt)
+        self.delivered += 1
+        Packet.release(pkt)
+
+    async def run(self, ticks):
+        await self.endpoint.open()
+        try:
+            for tick in range(0, ticks):
+                await self.pacer.wait(tick)
+                self.tick_val = tick
+                drain(self.endpoint, self.receive)
+                self.link.tick(tick, self.pdbox)
+                self.pdbox.tick(tick, self)
+                for batch in self.batches:
+                    batch.flush()
+        finally:
+            self.endpoint.close()
+
+    def report(self):
+        report = self.pacer.report()
+        report.update(flows=len(self.batches), received=self.received, delivered=self.delivered,
+                      queue=len(self.link.link_queue))
+        return report
+
+    def close(self):
+        self.endpoint.close()
+
+
+class HostEndpoint:
+    """
+    Runs host paced to wall-clock time, sending its packets to the emulator at
+    emulator_address and handing it the ACKs that come back
+    """
+
+    def __init__(self, host, emulator_address, tick_duration, address=("127.0.0.1", 0), spin=0.0):
+        self.host = host
+        self.endpoint = Endpoint(open_socket(address))
+        self.batch = Batch(self.endpoint, emulator_address)
+        self.pacer = Pacer(tick_duration, spin)
+        self.tick_val = 0
+        self.sent = 0
+        self.acked = 0
+
+    def receive(self, seq_num, sent_ts, size, address):
+        self.acked += 1
+        self.host.recv(Packet.alloc(sent_ts, seq_num, size), self.tick_val)
+
+    async def run(self, ticks):
+        await self.endpoint.open()
+        try:
+            for tick in range(0, ticks):
+                await self.pacer.wait(tick)
+                self.tick_val = tick
+                drain(self.endpoint, self.receive)
+                packets = self.host.send(tick)
+                if packets is not None:
+                    if type(packets) is Packet:
+                        packets = [packets]
+                    for packet in packets:
+                        self.batch.add(packet)
+                        self.sent += 1
+                    self.batch.flush()
+        finally:
+            self.endpoint.close()
+
+    def report(self):
+        report = self.pacer.report()
+        report.update(sent=self.sent, acked=self.acked, in_order_rx_seq=self.host.in_order_rx_seq)
+        return report
+
+    def close(self):
+        self.endpoint.close()
+
+
+def run_host(host_type, window_size, emulator_address, tick_duration, ticks, spin, connection=None):
+    # Runs a host against the emulator at emulator_address, in a process of its own
+    # when started by "run", and returns (or sends back) its report
+    from simulator import make_host
+    endpoint = HostEndpoint(make_host(host_type, window_size, verbose=False), emulator_address, tick_duration, spin=spin)
+    try:
+        asyncio.run(endpoint.run(ticks))
+    finally:
+        endpoint.close()
+    report = endpoint.report()
+    if connection is not None:
+        connection.send(report)
+        connection.close()
+    return report
+
+
+def format_report(name, report):
+    lateness = report["lateness_us"]
+    busy = report["busy_us"]
+    lines = ["%s: %d ticks at %.1f ticks/s (target %.1f), %d started more than a tick late" %
+             (name, report["ticks"], report["achieved_rate"], report["target_rate"], report["late_ticks"])]
+    if lateness["count"]:
+        lines.append("    lateness (us): mean %.1f, p50 %.1f, p90 %.1f, p99 %.1f, max %.1f" %
+                     (lateness["mean"], lateness["p50"], lateness["p90"], lateness["p99"], lateness["max"]))
+    if busy["count"]:
+        lines.append("    tick run time (us): mean %.1f, p99 %.1f, max %.1f" % (busy["mean"], busy["p99"], busy["max"]))
+    return "\n".join(lines)
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError("address must be host:port")
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time emulation of the link with hosts attached over UDP")
+    parser.add_argument("mode", choices=["run", "link", "host"],
+                        help="run: emulator and one host in a separate process; link: the emulator alone; host: one host alone")
+    parser.add_argument("--ticks", type=int, required=True, help="number of ticks to run for")
+    parser.add_argument("--tick_ms", type=float, default=1.0, help="wall-clock duration of a tick in ms, default 1")
+    parser.add_argument("--spin_us", type=float, default=0.0, help="spin this many us before every deadline instead of sleeping, about 1000 for ticks of a ms or less, default 0")
+    parser.add_argument("--port", type=int, default=0, help="link: UDP port to listen on")
+    parser.add_argument("--emulator", type=parse_address, help="host: address of the emulator, host:port")
+    parser.add_argument("--host_type", choices=["stopandwait", "slidingwindow", "aimd"], help="run, host: type of the host")
+    parser.add_argument("--window_size", type=int, help="Window size in packets for sliding window senders")
+    parser.add_argument("--rtt_min", type=int, help="run, link: minimum round-trip time in ticks")
+    parser.add_argument("--loss_ratio", type=float, default=0.0)
+    parser.add_argument("--queue_limit", type=int, default=1000000)
+    parser.add_argument("--link_rate", type=float, default=1)
+    parser.add_argument("--capacity_trace", help="binary capacity trace to replay instead of link_rate (see capacity_trace.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    tick_duration = args.tick_ms / 1000
+    spin = args.spin_us / 1e6
+    if args.host_type == "slidingwindow" and args.window_size is None:
+        parser.error("--window_size must be given for a slidingwindow host")
+
+    if args.mode == "host":
+        if args.emulator is None or args.host_type is None:
+            parser.error("host needs --emulator and --host_type")
+        report = run_host(args.host_type, args.window_size, args.emulator, tick_duration, args.ticks, spin)
+        print(format_report("Host", report))
+        print("Maximum in order received sequence number " + str(report["in_order_rx_seq"]))
+        return
+    if args.rtt_min is None or args.rtt_min < 2:
+        parser.error("--rtt_min of at least 2 must be given to run the link")
+    if args.mode == "run" and args.host_type is None:
+        parser.error("run needs --host_type")
+    emulator = LinkEmulator(("127.0.0.1", args.port), args.rtt_min, tick_duration, loss_ratio=args.loss_ratio,
+                            queue_limit=args.queue_limit, seed=args.seed, link_rate=args.link_rate,
+                            capacity_trace=args.capacity_trace, spin=spin)
+    host_process = None
+    if args.mode == "run":
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        host_process = multiprocessing.Process(target=run_host, args=(args.host_type, args.window_size, emulator.address,
+                                                                      tick_duration, args.ticks, spin, sender))
+        host_process.start()
+        sender.close()
+    else:
+        print("Emulator listening on %s:%d" % emulator.address)
+    try:
+        asyncio.run(emulator.run(args.ticks))
+    finally:
+        emulator.close()
+    report = emulator.report()
+    print(format_report("Link", report))
+    print("    %d packets from %d flows, %d ACKs sent back, %d packets queued" %
+          (report["received"], report["flows"], report["delivered"], report["queue"]))
+    if host_process is not None:
+        host_report = receiver.recv()
+        host_process.join()
+        print(format_report("Host", host_report))
+        print("Maximum in order received sequence number " + str(host_report["in_order_rx_seq"]))
+
+
+if __name__ == "__main__":
+    main()
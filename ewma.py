@@ -1,5 +1,4 @@
 import sys
-import matplotlib.pyplot as plt
 
 
 class Ewma:
@@ -25,11 +24,71 @@ class Ewma:
             self.smooth_rtt[i] = mean_rtt
 
     def plot(self):
+        # Imported here so that using Ewma or ewma_series doesn't need matplotlib
+        import matplotlib.pyplot as plt
         plt.plot(self.smooth_rtt)
         plt.ylim([0, 2.5])
         plt.show()
 
 
+def ewma_series(samples, alphas, initial, block=128):
+    """
+    EWMA of samples for many values of alpha at once, using NumPy. For every alpha
+    this computes the same recurrence as Ewma, i.e. for i = 0, 1, ..., n-1
+
+        smooth[i] = (1 - alpha) * smooth[i - 1] + alpha * samples[..., i]
+
+    with smooth[-1] = initial.
+
+    The series is cut into blocks of block samples. Within a block every value is a
+    weighted sum of the samples of the block, computed as one matrix product for all
+    blocks, and only the value carried from one block to the next is computed in a
+    Python loop, once per block.
+
+    Args:
+
+        **samples**: Array of shape (..., n)
+
+        **alphas**: 1-D array of P weights
+
+        **initial**: Value before the first sample, a scalar or an array that
+        broadcasts to shape (P, ...)
+
+    Returns:
+        Array of shape (P, ..., n)
+    """
+    import numpy as np
+    samples = np.asarray(samples, dtype=float)
+    alphas = np.asarray(alphas, dtype=float).reshape(-1)
+    lead = samples.shape[:-1]
+    n = samples.shape[-1]
+    num_alphas = alphas.shape[0]
+    initial = np.broadcast_to(np.asarray(initial, dtype=float), (num_alphas,) + lead).reshape(num_alphas, -1)
+    x = samples.reshape(-1, n)
+    num_blocks = -(-n // block)
+    x = np.pad(x, ((0, 0), (0, num_blocks * block - n))).reshape(x.shape[0], num_blocks, block)
+
+    decay = 1.0 - alphas
+    # powers[p, j] = decay[p] ** j
+    powers = decay[:, None] ** np.arange(block + 1)[None, :]
+    # weights[p, j, k] = decay[p] ** (j - k) for k <= j, i.e. how much sample k of a
+    # block contributes to value j of the same block
+    lags = np.arange(block)[:, None] - np.arange(block)[None, :]
+    weights = np.where(lags >= 0, powers[:, np.maximum(lags, 0)], 0.0)
+    # Values of every block as if the value carried into it was 0
+    smooth = np.matmul(x[None, :, :, :], weights.transpose(0, 2, 1)[:, None, :, :]) * alphas[:, None, None, None]
+
+    # Value carried into each block
+    carries = np.empty((num_alphas, x.shape[0], num_blocks))
+    carry = initial
+    decay_block = powers[:, block][:, None]
+    for b in range(0, num_blocks):
+        carries[:, :, b] = carry
+        carry = smooth[:, :, b, block - 1] + decay_block * carry
+    smooth += powers[:, None, None, 1:] * carries[:, :, :, None]
+    return smooth.reshape(num_alphas, -1, num_blocks * block)[:, :, :n].reshape((num_alphas,) + lead + (n,))
+
+
 def main(alpha):
     if alpha is not None:
         ewma = Ewma(alpha)
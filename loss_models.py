@@ -0,0 +1,181 @@
+"""
+Loss models for links.
+
+A Link asks its loss model lost() once for every packet it dequeues. Models decide
+losses a block at a time and hand them out from a buffer, so the per-packet cost is
+a list lookup rather than a call into the random number generator:
+
+    IidLoss:            every packet is lost independently with probability loss_ratio
+    GilbertElliottLoss: bursty losses from a two state (good/bad) Markov chain
+
+Every model draws from its own generator, built from a random.Random: with NumPy,
+a numpy.random.Generator over an MT19937 started from the state of that
+random.Random, so that its uniforms are bit for bit those the random.Random would
+have returned (and IidLoss decides exactly as the per-packet rng.uniform(0.0, 1)
+check did). Without NumPy the random.Random itself is drawn from, one block at a
+time. Either way the model takes the random.Random over: nothing else should draw
+from it.
+"""
+
+BLOCK = 4096
+
+
+def numpy_generator(rng):
+    """
+    Returns a numpy.random.Generator continuing the stream of rng (a random.Random),
+    or None if NumPy is not installed
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    state = rng.getstate()[1]
+    bit_generator = np.random.MT19937()
+    bit_generator.state = {"bit_generator": "MT19937",
+                           "state": {"key": np.array(state[:624], dtype=np.uint32), "pos": state[624]}}
+    return np.random.Generator(bit_generator)
+
+
+class IidLoss:
+    """
+    Independent losses with probability loss_ratio
+    """
+
+    def __init__(self, loss_ratio, rng, block=BLOCK):
+        self.loss_ratio = loss_ratio
+        self.rng = rng
+        self.generator = numpy_generator(rng) if loss_ratio > 0 else None
+        self.block = block
+        self.decisions = []
+        self.pos = 0
+
+    def refill(self):
+        # A packet gets through when its uniform draw is below 1 - loss_ratio
+        threshold = 1 - self.loss_ratio
+        if self.generator is not None:
+            self.decisions = (self.generator.random(self.block) >= threshold).tolist()
+        else:
+            draw = self.rng.random
+            self.decisions = [not draw() < threshold for _ in range(0, self.block)]
+        self.pos = 0
+
+    def lost(self):
+        if self.loss_ratio <= 0:
+            return False
+        pos = self.pos
+        if pos == len(self.decisions):
+            self.refill()
+            pos = 0
+        self.pos = pos + 1
+        return self.decisions[pos]
+
+    def mean_loss(self):
+        return self.loss_ratio
+
+    def deterministic(self):
+        # No packet is ever lost, so the link's behaviour doesn't depend on random draws
+        return self.loss_ratio <= 0
+
+
+class GilbertElliottLoss:
+    """
+    Gilbert-Elliott bursty losses. The channel is either good or bad; after every
+    packet a good channel turns bad with probability p and a bad one turns good with
+    probability r, so bursts of bad packets last 1/r packets on average. Packets are
+    lost with probability loss_good in the good state and loss_bad in the bad one.
+
+    Blocks are built from whole sojourns: the number of packets spent in a state is
+    geometric, so a block is a few geometric draws expanded into per-packet states,
+    then one uniform per packet against the loss probability of its state.
+    """
+
+    def __init__(self, p, r, rng, loss_good=0.0, loss_bad=1.0, block=BLOCK):
+        if not (0 < p <= 1 and 0 < r <= 1):
+            raise ValueError("p and r must be in (0, 1]")
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.rng = rng
+        self.generator = numpy_generator(rng)
+        self.block = block
+        # Current state, and packets left in its sojourn (0: draw a new sojourn length)
+        self.bad = False
+        self.remaining = 0
+        self.decisions = []
+        self.pos = 0
+
+    def refill(self):
+        if self.generator is None:
+            self.refill_python()
+            return
+        np = __import__("numpy")
+        generator = self.generator
+        lengths = []
+        states = []
+        filled = 0
+        bad = self.bad
+        remaining = self.remaining
+        while filled < self.block:
+            if remaining == 0:
+                remaining = int(generator.geometric(self.r if bad else self.p))
+            take = min(remaining, self.block - filled)
+            lengths.append(take)
+            states.append(bad)
+            filled += take
+            remaining -= take
+            if remaining == 0:
+                bad = not bad
+        self.bad = bad
+        self.remaining = remaining
+        loss = np.repeat(np.where(states, self.loss_bad, self.loss_good), lengths)
+        self.decisions = (generator.random(self.block) < loss).tolist()
+        self.pos = 0
+
+    def refill_python(self):
+        draw = self.rng.random
+        decisions = []
+        bad = self.bad
+        for _ in range(0, self.block):
+            decisions.append(draw() < (self.loss_bad if bad else self.loss_good))
+            if draw() < (self.r if bad else self.p):
+                bad = not bad
+        self.bad = bad
+        self.decisions = decisions
+        self.pos = 0
+
+    def lost(self):
+        pos = self.pos
+        if pos == len(self.decisions):
+            self.refill()
+            pos = 0
+        self.pos = pos + 1
+        return self.decisions[pos]
+
+    def mean_loss(self):
+        # Long run loss ratio: the chain is bad a fraction p / (p + r) of the time
+        bad = self.p / (self.p + self.r)
+        return (1 - bad) * self.loss_good + bad * self.loss_bad
+
+    def deterministic(self):
+        return False
+
+
+IID = "iid"
+GILBERT_ELLIOTT = "gilbert_elliott"
+
+
+def make_loss_model(spec, loss_ratio, rng):
+    """
+    Returns the loss model described by spec, a dict with a "type" (IID or
+    GILBERT_ELLIOTT) and the model's parameters, or an IidLoss(loss_ratio) if spec is None
+    """
+    if spec is None:
+        return IidLoss(loss_ratio, rng)
+    params = dict(spec)
+    loss_type = params.pop("type", IID)
+    if loss_type == IID:
+        return IidLoss(params.pop("loss_ratio", loss_ratio), rng, **params)
+    elif loss_type == GILBERT_ELLIOTT:
+        return GilbertElliottLoss(rng=rng, **params)
+    raise ValueError("Unknown loss model " + str(loss_type))
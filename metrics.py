@@ -0,0 +1,344 @@
+"""
+Streaming metrics of a Simulator run, in constant memory.
+
+A Metrics object attached to a Simulator (Simulator(..., metrics=...) or
+attach_metrics()) receives the events of the host and the link (see tracer.py;
+they are passed on to the simulator's tracer, if it has one) and looks at the
+simulator after every simulated tick. Every interval ticks it emits one record
+with the aggregates of that interval, as a JSON line:
+
+    goodput:        packets delivered in order per tick
+    utilization:    packets the link sent (or lost) per tick, over its capacity
+    queue_mean, queue_max: link queue length, averaged over the interval's ticks
+    retx, drops, losses:   counts of retransmissions, queue drops and random losses
+    rtt, queueing_delay:   count, mean, min, max, p50, p90 and p99 of the RTT samples
+                           and of pdbox_time - sent_ts of the packets the link sent
+    window:         count, mean, min, max and last value of the AIMD window
+
+Nothing is kept per packet: intervals are summarized by an Aggregate and a
+QuantileSketch per stream, which are reset after every record, and the whole run
+by a fixed-bucket Histogram and a QuantileSketch per stream (and a histogram of
+the queue length, counting the ticks each length lasted, so that ticks skipped by
+Simulator.run() count as much as simulated ones), returned by summary().
+Memory therefore doesn't depend on how long the simulation runs:
+
+    python simulator.py --seed 1 --host_type aimd --rtt_min 10 --ticks 1000000 --metrics metrics.jsonl --metrics_interval 10000
+"""
+
+import bisect
+import json
+import math
+import sys
+import tracer
+from packet import Packet
+from network import Link
+
+
+class Aggregate:
+    """
+    Count, sum, minimum, maximum and last value of a stream of values
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.total / self.count, "min": self.min, "max": self.max}
+
+
+class Histogram:
+    """
+    Counts of values in fixed buckets: counts[i] counts the values below bounds[i]
+    (and at least bounds[i - 1]), the last bucket the values from bounds[-1] up
+    """
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def add(self, value, weight=1):
+        self.counts[bisect.bisect_right(self.bounds, value)] += weight
+
+    def summary(self):
+        return {"bounds": self.bounds, "counts": self.counts}
+
+
+class QuantileSketch:
+    """
+    Quantiles of a stream of non-negative values within relative_accuracy, from
+    logarithmic buckets: a value x goes to bucket ceil(log(x) / log(gamma)) with
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy). At most max_buckets
+    buckets are kept; beyond that the lowest ones are merged into one, an eighth of
+    max_buckets at a time, and values below it are counted in it from then on,
+    which only costs accuracy on the smallest quantiles. Values of at most 0 are
+    counted as 0.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.reset()
+
+    def reset(self):
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        # Lowest bucket kept once buckets have been merged, lower keys are counted in it
+        self.floor = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        if key < self.floor:
+            key = self.floor
+        buckets = self.buckets
+        count = buckets.get(key)
+        if count is not None:
+            buckets[key] = count + 1
+            return
+        buckets[key] = 1
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        # Merge the lowest buckets into one, leaving room for max_buckets // 8 new ones,
+        # so that the sort is paid once per that many new buckets rather than per add
+        buckets = self.buckets
+        keys = sorted(buckets)
+        merged = len(keys) - (self.max_buckets - self.max_buckets // 8)
+        floor = keys[merged]
+        for key in keys[:merged]:
+            buckets[floor] += buckets.pop(key)
+        self.floor = floor
+
+    def quantile(self, q):
+        """
+        Returns the q-quantile (0 <= q <= 1) of the values added, or None if there are none
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # Middle of the bucket (gamma^(key-1), gamma^key], within relative_accuracy of any value in it
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class Stream:
+    """
+    A stream of values summarized per interval (Aggregate and QuantileSketch, reset
+    after every record) and over the whole run (Histogram and QuantileSketch)
+    """
+    QUANTILES = [0.5, 0.9, 0.99]
+
+    def __init__(self, bounds, relative_accuracy):
+        self.interval = Aggregate()
+        self.interval_sketch = QuantileSketch(relative_accuracy)
+        self.total = Aggregate()
+        self.histogram = Histogram(bounds)
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        self.interval.add(value)
+        self.interval_sketch.add(value)
+        self.total.add(value)
+        self.histogram.add(value)
+        self.sketch.add(value)
+
+    @staticmethod
+    def describe(aggregate, sketch):
+        summary = aggregate.summary()
+        if aggregate.count:
+            for q in Stream.QUANTILES:
+                summary["p%g" % (100 * q)] = sketch.quantile(q)
+        return summary
+
+    def interval_summary(self):
+        summary = Stream.describe(self.interval, self.interval_sketch)
+        self.interval.reset()
+        self.interval_sketch.reset()
+        return summary
+
+    def run_summary(self):
+        summary = Stream.describe(self.total, self.sketch)
+        summary["histogram"] = self.histogram.summary()
+        return summary
+
+
+class Metrics:
+    """
+    Streaming metrics of a Simulator, emitted every interval ticks to out (a file
+    object, stdout by default) as JSON lines. Delay histograms have buckets bounded
+    by delay_bounds ticks (powers of two by default).
+    """
+
+    def __init__(self, interval=10000, out=None, delay_bounds=None, relative_accuracy=0.01):
+        if interval < 1:
+            raise ValueError("interval must be at least 1")
+        self.interval = interval
+        self.out = out if out is not None else sys.stdout
+        if delay_bounds is None:
+            delay_bounds = [0] + [1 << i for i in range(0, 21)]
+        self.rtt = Stream(delay_bounds, relative_accuracy)
+        self.queueing_delay = Stream(delay_bounds, relative_accuracy)
+        self.window = Aggregate()
+        self.window_total = Aggregate()
+        self.queue = Histogram([0] + [1 << i for i in range(0, 21)])
+        # Events are passed on to tracer, if there is one (see Simulator.attach_metrics)
+        self.tracer = None
+        self.counts = dict.fromkeys(["retx", "drops", "losses", "sent"], 0)
+        self.totals = dict.fromkeys(["retx", "drops", "losses", "sent"], 0)
+        self.records = 0
+        self.last_record = None
+        self.capacity = 1.0
+
+    def start(self, simulator):
+        # Called when the metrics are attached: intervals start at the simulator's next tick
+        link = simulator.link
+        # Link capacity in packets per tick (on average over its capacity trace, if it has one)
+        if link.capacity_trace is not None:
+            self.capacity = link.capacity_trace.mean_rate()
+        else:
+            self.capacity = link.rate / Packet.SIZE if link.rate_unit == Link.BYTES else link.rate
+        self.interval_start = simulator.now
+        self.next_record = simulator.now + self.interval
+        self.start_seq = self.delivered_seq(simulator)
+        self.queue_len = len(link.link_queue)
+        self.queue_tick = simulator.now
+        self.queue_area = 0
+        self.queue_max = self.queue_len
+
+    @staticmethod
+    def delivered_seq(simulator):
+        # Packets delivered in order so far (sequence numbers start at 0)
+        return simulator.host.in_order_rx_seq + 1
+
+    def emit(self, tick, kind, seq_num=-1, value=0.0):
+        # Same interface as tracer.Tracer.emit(), so hosts and the link can emit to us
+        if kind == tracer.DEPART:
+            self.counts["sent"] += 1
+            self.queueing_delay.add(value)
+        elif kind == tracer.ACK:
+            self.rtt.add(value)
+        elif kind == tracer.RETX:
+            self.counts["retx"] += 1
+        elif kind == tracer.LOSS:
+            self.counts["sent"] += 1
+            self.counts["losses"] += 1
+        elif kind == tracer.DROP:
+            self.counts["drops"] += 1
+        elif kind == tracer.WINDOW:
+            self.window.add(value)
+            self.window_total.add(value)
+        if self.tracer is not None:
+            self.tracer.emit(tick, kind, seq_num, value)
+
+    def account_queue(self, tick_val):
+        # The queue length seen after the last observed tick lasted until tick_val
+        if tick_val > self.queue_tick:
+            self.queue_area += self.queue_len * (tick_val - self.queue_tick)
+            self.queue.add(self.queue_len, tick_val - self.queue_tick)
+            self.queue_tick = tick_val
+
+    def tick(self, simulator, inner, tick_val):
+        # Replaces simulator.tick while the metrics are attached; inner is the tick it wraps
+        if tick_val >= self.next_record:
+            self.roll(simulator, tick_val)
+        inner(tick_val)
+        self.account_queue(tick_val)
+        queue_len = len(simulator.link.link_queue)
+        self.queue_len = queue_len
+        if queue_len > self.queue_max:
+            self.queue_max = queue_len
+
+    def roll(self, simulator, tick_val):
+        # Emit the records of all intervals that end at or before tick_val
+        while tick_val >= self.next_record:
+            self.record(simulator, self.next_record)
+            self.next_record += self.interval
+
+    def record(self, simulator, end):
+        self.account_queue(end)
+        ticks = end - self.interval_start
+        seq = self.delivered_seq(simulator)
+        record = {
+            "tick_start": self.interval_start,
+            "tick_end": end,
+            "delivered": seq - self.start_seq,
+            "goodput": (seq - self.start_seq) / ticks,
+            "utilization": self.counts["sent"] / (ticks * self.capacity),
+            "queue_mean": self.queue_area / ticks,
+            "queue_max": self.queue_max,
+            "retx": self.counts["retx"],
+            "drops": self.counts["drops"],
+            "losses": self.counts["losses"],
+            "rtt": self.rtt.interval_summary(),
+            "queueing_delay": self.queueing_delay.interval_summary(),
+            "window": dict(self.window.summary(), last=self.window.last),
+        }
+        self.out.write(json.dumps(record) + "\n")
+        self.last_record = record
+        self.records += 1
+        for key in self.counts:
+            self.totals[key] += self.counts[key]
+            self.counts[key] = 0
+        self.window.reset()
+        self.interval_start = end
+        self.start_seq = seq
+        self.queue_area = 0
+        self.queue_max = self.queue_len
+
+    def finish(self, simulator):
+        """
+        Emits the records up to the simulator's current tick (the last one possibly
+        covering less than interval ticks) and returns summary()
+        """
+        end = simulator.now
+        self.roll(simulator, end)
+        if end > self.interval_start:
+            self.record(simulator, end)
+        self.out.flush()
+        return self.summary()
+
+    def summary(self):
+        """
+        Returns the whole-run totals, histograms and quantiles as a dict
+        """
+        return {
+            "records": self.records,
+            "retx": self.totals["retx"],
+            "drops": self.totals["drops"],
+            "losses": self.totals["losses"],
+            "sent": self.totals["sent"],
+            "rtt": self.rtt.run_summary(),
+            "queueing_delay": self.queueing_delay.run_summary(),
+            "queue": self.queue.summary(),
+            "window": dict(self.window_total.summary(), last=self.window_total.last),
+        }
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Lockstep Monte Carlo: many seeds of one scenario simulated at once with NumPy.
+
+LockstepSimulator runs R replicas of the Simulator scenario (one host behind a link
+of 1 packet per tick with a FIFO queue, then a delay box of rtt_min - 1 ticks), one
+replica per seed, and advances all of them together one tick at a time. Instead of
+Python objects, the state of every replica is kept in rows of NumPy arrays:
+
+    link queue:     ring buffers of (seq_num, sent_ts) of shape (R, queue capacity)
+    delay box:      one slot per tick of delay, shape (R, rtt_min - 1)
+    unacked:        seq_nums and timeout_ticks sorted by seq_num, shape (R, window capacity)
+    host:           max_seq, in_order_rx_seq, window, next_decrease, ... of shape (R,)
+    timeouts:       mean_rtt, rtt_var and timeout of every replica's TimeoutCalculator
+
+so every step of a tick (timeouts and backoff, filling the window, enqueueing,
+dequeueing with a loss draw, delivering ACKs and updating the timeouts) is a handful
+of array operations over all replicas. Buffers grow on demand, as queues and AIMD
+windows do in the scalar simulator.
+
+Replica r draws its losses from the same Mersenne Twister stream as
+random.Random(seeds[r]), generated in blocks by NumPy, and the host logic follows
+SlidingWindowHost and AimdHost step by step with the same floating point
+operations, so every replica ends with exactly the in_order_rx_seq of the scalar
+Simulator with that seed. validate() checks this on a sample of seeds:
+
+    python monte_carlo.py --host_type slidingwindow --window_size 10 --rtt_min 10 --loss_ratio 0.01 --seeds 500 --ticks 10000 --validate 5
+"""
+
+import argparse
+import math
+import random
+import numpy as np
+from loss_models import numpy_generator
+from simulator import Simulator, make_host
+from timeout_calculator import TimeoutCalculator
+
+SLIDING_WINDOW = "slidingwindow"
+AIMD = "aimd"
+
+# Backoffs beyond this many doublings saturate at max_timeout anyway
+MAX_DOUBLINGS = 1024
+
+
+class LossStreams:
+    """
+    Uniform draws of every replica, bit for bit those of random.Random(seed).random()
+    """
+
+    def __init__(self, seeds, block=4096):
+        self.generators = []
+        for seed in seeds:
+            self.generators.append(numpy_generator(random.Random(seed)))
+        self.block = block
+        self.buffer = np.empty((len(seeds), block))
+        for row, generator in enumerate(self.generators):
+            self.buffer[row] = generator.random(block)
+        self.pos = np.zeros(len(seeds), dtype=np.int64)
+
+    def draw(self, rows):
+        # Next draw of each replica in rows
+        for row in rows[self.pos[rows] == self.block]:
+            self.buffer[row] = self.generators[row].random(self.block)
+            self.pos[row] = 0
+        draws = self.buffer[rows, self.pos[rows]]
+        self.pos[rows] += 1
+        return draws
+
+
+class LockstepSimulator:
+    """
+    Simulates one replica of the scenario per seed, all in lockstep. Data members of
+    this class are described in the module docstring; in_order_rx_seq is the array
+    of every replica's largest in order received sequence number.
+    """
+
+    def __init__(self, host_type, seeds, loss_ratio, queue_limit, rtt_min, window_size=None,
+                 min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+        if host_type not in [SLIDING_WINDOW, AIMD]:
+            raise ValueError("host_type must be slidingwindow or aimd")
+        if host_type == SLIDING_WINDOW and window_size is None:
+            raise argparse.ArgumentTypeError("window_size must be defined for host_type SlidingWindow")
+        if rtt_min < 2:
+            raise argparse.ArgumentTypeError("rtt_min must be at least 2")
+        self.host_type = host_type
+        self.seeds = list(seeds)
+        self.loss_ratio = loss_ratio
+        self.queue_limit = queue_limit
+        self.delay = rtt_min - 1
+        self.window_size = window_size
+        self.min_timeout = float(min_timeout)
+        self.max_timeout = float(max_timeout)
+        replicas = len(self.seeds)
+        self.rows = np.arange(0, replicas)
+
+        # TimeoutCalculator
+        self.alpha = 0.125
+        self.beta = 0.25
+        self.k = 4.0
+        self.mean_rtt = np.zeros(replicas)
+        self.rtt_var = np.zeros(replicas)
+        self.timeout = np.full(replicas, self.min_timeout)
+        self.ewma_init = np.zeros(replicas, dtype=bool)
+
+        # Host
+        capacity = 16
+        while capacity < (window_size or 0):
+            capacity *= 2
+        self.unacked_seq = np.zeros((replicas, capacity), dtype=np.int64)
+        self.unacked_timeout_tick = np.zeros((replicas, capacity))
+        self.unacked_count = np.zeros(replicas, dtype=np.int64)
+        # Lower bound on the earliest timeout_tick of every replica's unacked packets
+        self.next_timeout_tick = np.full(replicas, np.inf)
+        self.max_seq = np.full(replicas, -1, dtype=np.int64)
+        self.in_order_rx_seq = np.full(replicas, -1, dtype=np.int64)
+        self.window = np.ones(replicas)
+        self.slow_start = np.ones(replicas, dtype=bool)
+        self.next_decrease = np.full(replicas, -1.0)
+
+        # Link
+        self.queue_seq = np.zeros((replicas, 16), dtype=np.int64)
+        self.queue_sent_ts = np.zeros((replicas, 16), dtype=np.int64)
+        self.queue_head = np.zeros(replicas, dtype=np.int64)
+        self.queue_len = np.zeros(replicas, dtype=np.int64)
+        self.streams = LossStreams(self.seeds)
+
+        # Delay box: the packet that entered on tick t leaves on tick t + delay from slot t % delay
+        self.pdbox_seq = np.zeros((replicas, self.delay), dtype=np.int64)
+        self.pdbox_sent_ts = np.zeros((replicas, self.delay), dtype=np.int64)
+        self.pdbox_valid = np.zeros((replicas, self.delay), dtype=bool)
+
+        # Next tick that run() will simulate
+        self.now = 0
+
+    def grow_unacked(self, needed):
+        capacity = self.unacked_seq.shape[1]
+        while capacity < needed:
+            capacity *= 2
+        for name in ["unacked_seq", "unacked_timeout_tick"]:
+            old = getattr(self, name)
+            new = np.zeros((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def grow_queue(self, needed):
+        capacity = self.queue_seq.shape[1]
+        new_capacity = capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        # Unroll every ring so that its head is at column 0
+        order = (self.queue_head[:, None] + np.arange(0, capacity)) % capacity
+        for name in ["queue_seq", "queue_sent_ts"]:
+            new = np.zeros((len(self.rows), new_capacity), dtype=np.int64)
+            new[:, :capacity] = np.take_along_axis(getattr(self, name), order, axis=1)
+            setattr(self, name, new)
+        self.queue_head[:] = 0
+
+    def send(self, tick):
+        """
+        Timeouts, backoff and new packets of every host (SlidingWindowHost.send or
+        AimdHost.send). Returns the packets to put on the link as an (R, K) array of
+        seq_nums, and how many of every row are used; all of them were sent at tick.
+        """
+        # Only replicas whose earliest timeout may have passed, and only the columns in use, are looked at
+        width = int(self.unacked_count.max())
+        columns = np.arange(0, width)
+        candidates = np.nonzero(self.next_timeout_tick <= tick)[0]
+        valid = columns < self.unacked_count[candidates, None]
+        timeout_tick = self.unacked_timeout_tick[candidates, :width]
+        expired = valid & (timeout_tick <= tick)
+        num_expired = np.zeros(len(self.rows), dtype=np.int64)
+        num_expired[candidates] = expired.sum(axis=1)
+        has_expired = num_expired[candidates] > 0
+        expired_rows = candidates[has_expired]
+        expired = expired[has_expired]
+        if len(expired_rows) > 0:
+            timeout = self.timeout[expired_rows]
+            doublings = np.minimum(num_expired[expired_rows], MAX_DOUBLINGS).astype(np.int32)
+            if self.host_type == AIMD:
+                # The k-th retransmission of the tick is timed out with the timeout after k backoffs
+                rank = np.minimum(np.cumsum(expired, axis=1), MAX_DOUBLINGS).astype(np.int32)
+                retx_timeout_tick = tick + np.minimum(np.ldexp(timeout[:, None], rank), self.max_timeout)
+                timeout_tick[has_expired] = np.where(expired, retx_timeout_tick, timeout_tick[has_expired])
+                self.unacked_timeout_tick[candidates, :width] = timeout_tick
+                # The first timeout halves the window if it is time to; the others only do
+                # while mean_rtt is 0, since next_decrease is then tick again
+                halvings = ((self.next_decrease[expired_rows] <= tick).astype(np.int64)
+                            + (num_expired[expired_rows] - 1) * (self.mean_rtt[expired_rows] <= 0))
+                self.window[expired_rows] = np.maximum(
+                    np.ldexp(self.window[expired_rows], -np.minimum(halvings, MAX_DOUBLINGS).astype(np.int32)), 1.0)
+                self.next_decrease[expired_rows] = tick + self.mean_rtt[expired_rows]
+                self.slow_start[expired_rows] = False
+            self.timeout[expired_rows] = np.minimum(np.ldexp(timeout, doublings), self.max_timeout)
+        # Sliding window hosts keep the stale timeout_tick, so their expired packets stay due
+        self.next_timeout_tick[candidates] = np.where(valid, timeout_tick, np.inf).min(axis=1, initial=np.inf)
+
+        if self.host_type == SLIDING_WINDOW:
+            num_new = self.window_size - self.unacked_count
+        else:
+            num_new = np.maximum(np.ceil(self.window).astype(np.int64) - self.unacked_count, 0)
+        num_packets = num_expired + num_new
+        width = int(num_packets.max())
+        packets = np.zeros((len(self.rows), width), dtype=np.int64)
+        if width == 0:
+            return packets, num_packets
+
+        # Retransmissions first, in seq_num order, then the new packets
+        if len(expired_rows) > 0:
+            rows, cols = np.nonzero(expired)
+            packets[expired_rows[rows], np.cumsum(expired, axis=1)[rows, cols] - 1] = self.unacked_seq[expired_rows[rows], cols]
+        slots = np.arange(0, width)
+        new = (slots >= num_expired[:, None]) & (slots < num_packets[:, None])
+        packets = np.where(new, self.max_seq[:, None] + 1 + slots - num_expired[:, None], packets)
+
+        needed = int((self.unacked_count + num_new).max())
+        if needed > self.unacked_seq.shape[1]:
+            self.grow_unacked(needed)
+        senders = np.nonzero(num_new)[0]
+        columns = np.arange(0, needed)
+        added = (columns >= self.unacked_count[senders, None]) & (columns < (self.unacked_count + num_new)[senders, None])
+        rows, cols = np.nonzero(added)
+        rows = senders[rows]
+        self.unacked_seq[rows, cols] = self.max_seq[rows] + 1 + cols - self.unacked_count[rows]
+        self.unacked_timeout_tick[rows, cols] = self.timeout[rows] + tick
+        self.next_timeout_tick[senders] = np.minimum(self.next_timeout_tick[senders], self.timeout[senders] + tick)
+        self.max_seq += num_new
+        self.unacked_count += num_new
+        return packets, num_packets
+
+    def enqueue(self, packets, num_packets, tick):
+        # Link.recv of every packet, dropping those that find the queue full
+        accepted = np.clip(self.queue_limit - self.queue_len, 0, num_packets)
+        needed = int((self.queue_len + accepted).max())
+        if needed > self.queue_seq.shape[1]:
+            self.grow_queue(needed)
+        capacity = self.queue_seq.shape[1]
+        rows, slots = np.nonzero(np.arange(0, packets.shape[1]) < accepted[:, None])
+        pos = (self.queue_head[rows] + self.queue_len[rows] + slots) % capacity
+        self.queue_seq[rows, pos] = packets[rows, slots]
+        self.queue_sent_ts[rows, pos] = tick
+        self.queue_len += accepted
+
+    def recv(self, rows, seq, sent_ts, tick):
+        # TimeoutCalculator.update_timeout and host.recv of the replicas in rows
+        rtt_sample = (tick - sent_ts).astype(np.float64)
+        init = self.ewma_init[rows]
+        mean_rtt = self.mean_rtt[rows]
+        rtt_var = np.where(init, (1 - self.beta) * self.rtt_var[rows] + self.beta * np.abs(rtt_sample - mean_rtt),
+                           rtt_sample * .5)
+        mean_rtt = np.where(init, (1 - self.alpha) * mean_rtt + self.alpha * rtt_sample, rtt_sample)
+        timeout = mean_rtt + self.k * rtt_var
+        timeout = np.where(timeout < self.min_timeout, self.min_timeout,
+                           np.where(timeout > self.max_timeout, self.max_timeout, timeout))
+        self.rtt_var[rows] = rtt_var
+        self.mean_rtt[rows] = mean_rtt
+        self.timeout[rows] = timeout
+        self.ewma_init[rows] = True
+
+        # Ack: remove seq from the sorted unacked packets of its replica, if it is there
+        width = int(self.unacked_count[rows].max())
+        columns = np.arange(0, width)
+        match = (columns < self.unacked_count[rows, None]) & (self.unacked_seq[rows, :width] == seq[:, None])
+        found = match.any(axis=1)
+        acked = rows[found]
+        if len(acked) > 0:
+            pos = np.argmax(match[found], axis=1)
+            shift = np.minimum(columns + (columns >= pos[:, None]), width - 1)
+            self.unacked_seq[acked, :width] = np.take_along_axis(self.unacked_seq[acked, :width], shift, axis=1)
+            self.unacked_timeout_tick[acked, :width] = np.take_along_axis(self.unacked_timeout_tick[acked, :width], shift, axis=1)
+            self.unacked_count[acked] -= 1
+
+        max_seq = self.max_seq[rows]
+        base = np.where(self.unacked_count[rows] > 0, self.unacked_seq[rows, 0], max_seq + 1)
+        self.in_order_rx_seq[rows] = np.where(base < max_seq, base - 1, max_seq)
+        if self.host_type == AIMD:
+            window = self.window[rows]
+            self.window[rows] = np.where(self.slow_start[rows], window + 1, window + 1 / window)
+
+    def tick(self, tick):
+        packets, num_packets = self.send(tick)
+        if packets.shape[1] > 0:
+            self.enqueue(packets, num_packets, tick)
+
+        # Link.tick: every non-empty queue sends its head packet, which survives with probability 1 - loss_ratio
+        busy = np.nonzero(self.queue_len)[0]
+        head = self.queue_head[busy]
+        head_seq = self.queue_seq[busy, head]
+        head_sent_ts = self.queue_sent_ts[busy, head]
+        self.queue_head[busy] = (head + 1) % self.queue_seq.shape[1]
+        self.queue_len[busy] -= 1
+        survived = self.streams.draw(busy) < (1 - self.loss_ratio)
+
+        # DelayBox.tick: deliver the packets that entered delay ticks ago, then take in the new ones
+        slot = tick % self.delay
+        delivered = np.nonzero(self.pdbox_valid[:, slot])[0]
+        delivered_seq = self.pdbox_seq[delivered, slot]
+        delivered_sent_ts = self.pdbox_sent_ts[delivered, slot]
+        self.pdbox_valid[:, slot] = False
+        entering = busy[survived]
+        self.pdbox_valid[entering, slot] = True
+        self.pdbox_seq[entering, slot] = head_seq[survived]
+        self.pdbox_sent_ts[entering, slot] = head_sent_ts[survived]
+        if len(delivered) > 0:
+            self.recv(delivered, delivered_seq, delivered_sent_ts, tick)
+
+    def run(self, until):
+        # Run all replicas from self.now up to (but not including) tick until
+        for tick in range(self.now, until):
+            self.tick(tick)
+        self.now = max(self.now, until)
+
+
+def scalar_in_order_rx_seq(host_type, seed, loss_ratio, queue_limit, rtt_min, ticks, window_size=None,
+                           min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+    # in_order_rx_seq of the same scenario run by the scalar Simulator
+    host = make_host(host_type, window_size, verbose=False, min_timeout=min_timeout, max_timeout=max_timeout)
+    simulator = Simulator(host, loss_ratio, queue_limit, rtt_min, seed, verbose=False)
+    simulator.run(ticks)
+    return host.in_order_rx_seq
+
+
+def validate(simulator, ticks, sample, rng=None):
+    """
+    Runs sample of the simulator's seeds (after it has run up to ticks) through the
+    scalar Simulator and returns the (seed, lockstep, scalar) results that differ
+    """
+    rng = rng if rng is not None else random.Random(0)
+    mismatches = []
+    for row in sorted(rng.sample(range(0, len(simulator.seeds)), min(sample, len(simulator.seeds)))):
+        expected = scalar_in_order_rx_seq(simulator.host_type, simulator.seeds[row], simulator.loss_ratio,
+                                          simulator.queue_limit, simulator.delay + 1, ticks, simulator.window_size,
+                                          simulator.min_timeout, simulator.max_timeout)
+        if expected != simulator.in_order_rx_seq[row]:
+            mismatches.append((simulator.seeds[row], int(simulator.in_order_rx_seq[row]), expected))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate one scenario for many seeds at once")
+    parser.add_argument("--host_type", choices=[SLIDING_WINDOW, AIMD], required=True)
+    parser.add_argument("--rtt_min", type=int, required=True)
+    parser.add_argument("--ticks", type=int, required=True)
+    parser.add_argument("--seeds", type=int, default=100, help="number of seeds, from --first_seed on")
+    parser.add_argument("--first_seed", type=int, default=1)
+    parser.add_argument("--loss_ratio", type=float, default=0.0)
+    parser.add_argument("--queue_limit", type=int, default=1000000)
+    parser.add_argument("--window_size", type=int, help="Window size in packets for sliding window senders")
+    parser.add_argument("--min_timeout", type=int, default=TimeoutCalculator.MIN_TIMEOUT)
+    parser.add_argument("--max_timeout", type=int, default=TimeoutCalculator.MAX_TIMEOUT)
+    parser.add_argument("--validate", type=int, default=0, help="number of seeds to rerun with the scalar Simulator")
+    args = parser.parse_args()
+
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    simulator = LockstepSimulator(args.host_type, seeds, args.loss_ratio, args.queue_limit, args.rtt_min, args.window_size,
+                                  args.min_timeout, args.max_timeout)
+    simulator.run(args.ticks)
+    seqs = simulator.in_order_rx_seq
+    half_width = 1.96 * seqs.std(ddof=1) / math.sqrt(len(seqs)) if len(seqs) > 1 else math.nan
+    print("Seeds: " + str(len(seqs)))
+    print("Maximum in order received sequence number: mean %.2f +- %.2f (95%% CI), min %d, max %d" %
+          (seqs.mean(), half_width, seqs.min(), seqs.max()))
+    if args.validate > 0:
+        mismatches = validate(simulator, args.ticks, args.validate)
+        print("Validated %d seeds against Simulator, %d mismatches" % (min(args.validate, len(seqs)), len(mismatches)))
+        for seed, lockstep, scalar in mismatches:
+            print("    seed %d: lockstep %d, scalar %d" % (seed, lockstep, scalar))
+
+
+if __name__ == "__main__":
+    main()
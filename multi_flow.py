@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Many hosts (flows) sharing one bottleneck link.
+
+MultiFlowSimulator connects any number of hosts to one Link and one DelayBox.
+Host i is flow i: every packet it sends is stamped with flow_id = i, and when the
+packet comes out of the delay box it is handed back to the recv() of host i.
+
+Hosts are only polled when they have work to do. Each host's next_event_tick()
+is kept in a heap (HostWakeups), and on every tick only the hosts that are due or that just got
+an ACK are called (in flow id order, as if all hosts were polled every tick).
+Hosts without next_event_tick() are polled on every tick. Per-tick work therefore
+grows with the number of active flows, not with the number of hosts.
+
+    python multi_flow.py --flows aimd:50 slidingwindow:50 --window_size 4 --scheduler drr --rtt_min 20 --ticks 100000
+"""
+
+import argparse
+import heapq
+import math
+import random
+from network import DelayBox, Link
+from packet import Packet
+from simulator import make_host, check_host_type
+from timeout_calculator import TimeoutCalculator
+
+
+class FlowDemux:
+    """
+    Hands ACKs coming out of the delay box to the host of their flow and remembers
+    which flows got one, so that their next wake-up can be recomputed
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.touched = set()
+
+    def recv(self, pkt, tick):
+        self.touched.add(pkt.flow_id)
+        self.hosts[pkt.flow_id].recv(pkt, tick)
+
+
+class HostWakeups:
+    """
+    Keeps track of when each host next has work to do. Data members of this class are
+
+    **wake_heap**: Heap of (tick, flow_id) wake-ups. Entries that no longer match
+    wake_tick are stale and skipped
+
+    **wake_tick**: Current wake-up tick of every flow (math.inf if it waits for an ACK)
+
+    **always**: Flows whose hosts don't implement next_event_tick, woken on every tick
+
+    Only the flows in flow_ids (all of them by default) are ever woken.
+    """
+
+    def __init__(self, hosts, flow_ids=None):
+        self.hosts = hosts
+        self.wake_heap = []
+        self.wake_tick = [math.inf] * len(hosts)
+        self.always = []
+        if flow_ids is None:
+            flow_ids = range(0, len(hosts))
+        for flow_id in flow_ids:
+            if hasattr(hosts[flow_id], "next_event_tick"):
+                self.schedule(flow_id, 0)
+            else:
+                self.always.append(flow_id)
+
+    def schedule(self, flow_id, tick_val):
+        self.wake_tick[flow_id] = tick_val
+        if tick_val != math.inf:
+            heapq.heappush(self.wake_heap, (tick_val, flow_id))
+
+    def due(self, tick_val):
+        # Pop the flows whose wake-up is at or before tick_val, in flow id order
+        due = list(self.always)
+        wake_heap = self.wake_heap
+        while wake_heap and wake_heap[0][0] <= tick_val:
+            wake, flow_id = heapq.heappop(wake_heap)
+            if self.wake_tick[flow_id] == wake:
+                self.wake_tick[flow_id] = math.inf
+                due.append(flow_id)
+        due.sort()
+        return due
+
+    def update(self, flow_ids, tick_val):
+        # Recompute the wake-up of flows whose hosts sent or received on tick_val
+        for flow_id in flow_ids:
+            host = self.hosts[flow_id]
+            if hasattr(host, "next_event_tick"):
+                next_tick = host.next_event_tick(tick_val)
+                if next_tick != math.inf:
+                    next_tick = math.ceil(next_tick)
+                if next_tick != self.wake_tick[flow_id]:
+                    self.schedule(flow_id, next_tick)
+
+    def next_event_tick(self, tick_val):
+        if self.always:
+            return tick_val + 1
+        wake_heap = self.wake_heap
+        while wake_heap and self.wake_tick[wake_heap[0][1]] != wake_heap[0][0]:
+            heapq.heappop(wake_heap)
+        if wake_heap:
+            return max(tick_val + 1, wake_heap[0][0])
+        return math.inf
+
+
+class MultiFlowSimulator:
+    def __init__(self, hosts, loss_ratio, queue_limit, rtt_min, seed, verbose=True,
+                 link_rate=1, rate_unit=Link.PACKETS, limit_unit=Link.PACKETS,
+                 scheduler=Link.FIFO, quantum=Packet.SIZE):
+        self.hosts = list(hosts)
+        self.rng = random.Random(seed)
+        self.link = Link(loss_ratio=loss_ratio, queue_limit=queue_limit, verbose=verbose,
+                         rate=link_rate, rate_unit=rate_unit, limit_unit=limit_unit, rng=self.rng,
+                         scheduler=scheduler, quantum=quantum)
+        if rtt_min < 2:
+            raise argparse.ArgumentTypeError("rtt_min must be at least 2")
+        self.pdbox = DelayBox(rtt_min - 1)
+        self.demux = FlowDemux(self.hosts)
+        self.wakeups = HostWakeups(self.hosts)
+
+        # Next tick that run() will simulate
+        self.now = 0
+
+    def tick(self, tick_val):
+        due = self.wakeups.due(tick_val)
+        for flow_id in due:
+            packets = self.hosts[flow_id].send(tick_val)
+            if packets is not None:
+                if type(packets) is Packet:
+                    packets = [packets]
+                for packet in packets:
+                    packet.flow_id = flow_id
+                    self.link.recv(packet, tick_val)
+        self.link.tick(tick_val, self.pdbox)
+        self.demux.touched.clear()
+        self.pdbox.tick(tick_val, self.demux)
+
+        # Flows that sent or got an ACK may want to send again at a different time
+        self.demux.touched.update(due)
+        self.wakeups.update(self.demux.touched, tick_val)
+
+    def next_event_tick(self, tick_val):
+        return min(self.wakeups.next_event_tick(tick_val), self.link.next_event_tick(tick_val),
+                   self.pdbox.next_event_tick(tick_val))
+
+    def run(self, until):
+        # Run simulation from self.now up to (but not including) tick until, skipping idle ticks
+        tick_val = self.now
+        while tick_val < until:
+            self.tick(tick_val)
+            next_tick = self.next_event_tick(tick_val)
+            if next_tick == math.inf:
+                break
+            tick_val = next_tick
+        self.now = until
+
+    def in_order_rx_seqs(self):
+        return [host.in_order_rx_seq for host in self.hosts]
+
+
+def jain_fairness(values):
+    # Jain's fairness index: 1 when all values are equal, 1/n when one flow gets everything
+    total = sum(values)
+    squares = sum(value * value for value in values)
+    if squares == 0:
+        return 1.0
+    return total * total / (len(values) * squares)
+
+
+def parse_flows(flows):
+    # "aimd:10" -> ["aimd"] * 10
+    host_types = []
+    for flow in flows:
+        host_type, _, count = flow.partition(":")
+        host_types += [check_host_type(host_type)] * (int(count) if count else 1)
+    return host_types
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many flows sharing one bottleneck link")
+    parser.add_argument("--flows", nargs="+", required=True, help="host types with counts, e.g. aimd:100 slidingwindow:20")
+    parser.add_argument("--seed", type=int, required=True)
+    parser.add_argument("--rtt_min", type=int, required=True)
+    parser.add_argument("--ticks", type=int, required=True)
+    parser.add_argument("--loss_ratio", type=float, default=0.0)
+    parser.add_argument("--queue_limit", type=int, default=1000000)
+    parser.add_argument("--link_rate", type=float, default=1)
+    parser.add_argument("--scheduler", choices=[Link.FIFO, Link.ROUND_ROBIN, Link.DRR], default=Link.FIFO)
+    parser.add_argument("--quantum", type=int, default=Packet.SIZE, help="DRR quantum in bytes")
+    parser.add_argument("--window_size", type=int, help="Window size in packets for sliding window senders")
+    parser.add_argument("--min_timeout", type=int, default=TimeoutCalculator.MIN_TIMEOUT)
+    parser.add_argument("--max_timeout", type=int, default=TimeoutCalculator.MAX_TIMEOUT)
+    args = parser.parse_args()
+
+    hosts = [make_host(host_type, args.window_size, verbose=False, min_timeout=args.min_timeout, max_timeout=args.max_timeout)
+             for host_type in parse_flows(args.flows)]
+    simulator = MultiFlowSimulator(hosts, args.loss_ratio, args.queue_limit, args.rtt_min, args.seed, verbose=False,
+                                   link_rate=args.link_rate, scheduler=args.scheduler, quantum=args.quantum)
+    simulator.run(args.ticks)
+
+    seqs = [seq + 1 for seq in simulator.in_order_rx_seqs()]
+    print("Flows: " + str(len(hosts)))
+    print("Total packets received in order: " + str(sum(seqs)))
+    print("Min/max per flow: " + str(min(seqs)) + "/" + str(max(seqs)))
+    print("Jain's fairness index: %.4f" % jain_fairness(seqs))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
-import queue
+import heapq
+import math
 import random
+import tracer
+from collections import deque
+from fractions import Fraction
+from loss_models import IidLoss
+from packet import Packet
 
 
 class DelayBox:
@@ -7,38 +13,231 @@ class DelayBox:
     A class to delay packets by the propagation delay
     In our case, we'll use it to delay packets by the two-way propagation delay,
     i.e., RTT_min
+
+    Packets delayed by prop_delay sit in a FIFO: they all see the same delay, so they
+    leave in the order they came in and each tick only pops the packets that are due
+    from the head. Packets given their own delay in recv() go into a heap keyed by
+    their deadline instead. On a given tick FIFO packets are delivered first, then
+    heap packets in deadline and arrival order.
     """
 
     def __init__(self, prop_delay):
-        self.prop_delay_queue = []
+        self.prop_delay_queue = deque()
+        self.deadline_heap = []
         self.prop_delay = prop_delay
+        # Breaks ties between heap packets with the same deadline
+        self.heap_count = 0
 
-    def recv(self, pkt, tick):
+    def recv(self, pkt, tick, delay=None):
         pkt.pdbox_time = tick
-        self.prop_delay_queue += [pkt]
+        if delay is None:
+            self.prop_delay_queue.append(pkt)
+        else:
+            heapq.heappush(self.deadline_heap, (tick + delay, self.heap_count, pkt))
+            self.heap_count += 1
 
     def tick(self, tick, host):
-        to_deliver = []
-        for pkt in self.prop_delay_queue:
-            if pkt.pdbox_time + self.prop_delay <= tick:
-                assert pkt.pdbox_time + self.prop_delay == tick
-                to_deliver += [pkt]
-                host.recv(pkt, tick)
-        self.prop_delay_queue = [x for x in self.prop_delay_queue if x not in to_deliver]
+        prop_delay_queue = self.prop_delay_queue
+        while prop_delay_queue and prop_delay_queue[0].pdbox_time + self.prop_delay <= tick:
+            pkt = prop_delay_queue.popleft()
+            assert pkt.pdbox_time + self.prop_delay == tick
+            host.recv(pkt, tick)
+        deadline_heap = self.deadline_heap
+        while deadline_heap and deadline_heap[0][0] <= tick:
+            deadline, _, pkt = heapq.heappop(deadline_heap)
+            assert deadline == tick
+            host.recv(pkt, tick)
+
+    def __len__(self):
+        return len(self.prop_delay_queue) + len(self.deadline_heap)
+
+    def next_event_tick(self, tick):
+        """
+        Tick at which the next packet leaves the delay box, or math.inf if it is empty.
+        """
+        next_tick = math.inf
+        if self.prop_delay_queue:
+            next_tick = self.prop_delay_queue[0].pdbox_time + self.prop_delay
+        if self.deadline_heap and self.deadline_heap[0][0] < next_tick:
+            next_tick = self.deadline_heap[0][0]
+        return next_tick
+
+
+class FifoQueue(deque):
+    """
+    Link queue that sends packets in the order they arrived
+    """
+
+    def peek(self):
+        return self[0]
+
+
+class RoundRobinQueue:
+    """
+    Link queue with one FIFO per flow, served one packet per flow in turn.
+    Only flows with queued packets are in the rotation, so peek and popleft are O(1).
+    """
+
+    def __init__(self):
+        self.flow_queues = {}
+        # Flow ids of the flows with queued packets, next flow to serve first
+        self.active = deque()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, pkt):
+        flow_queue = self.flow_queues.get(pkt.flow_id)
+        if flow_queue is None:
+            flow_queue = self.flow_queues[pkt.flow_id] = deque()
+            self.active.append(pkt.flow_id)
+        flow_queue.append(pkt)
+        self.size += 1
+
+    def peek(self):
+        return self.flow_queues[self.active[0]][0]
+
+    def popleft(self):
+        flow_id = self.active.popleft()
+        flow_queue = self.flow_queues[flow_id]
+        pkt = flow_queue.popleft()
+        if flow_queue:
+            self.active.append(flow_id)
+        else:
+            del self.flow_queues[flow_id]
+        self.size -= 1
+        return pkt
+
+
+class DeficitRoundRobinQueue(RoundRobinQueue):
+    """
+    Link queue with one FIFO per flow, served by deficit round robin: each time a flow
+    comes up it earns quantum bytes of credit and sends packets while its credit covers
+    their size, so flows get the same share of bytes whatever their packet sizes.
+    With quantum at least the largest packet size every turn sends at least one
+    packet, so peek and popleft are amortized O(1).
+    """
+
+    def __init__(self, quantum=Packet.SIZE):
+        RoundRobinQueue.__init__(self)
+        self.quantum = quantum
+        self.deficit = {}
+        # Whether the flow at the head of active has already earned its quantum this turn
+        self.credited = False
+
+    def peek(self):
+        while True:
+            flow_id = self.active[0]
+            if not self.credited:
+                self.deficit[flow_id] = self.deficit.get(flow_id, 0) + self.quantum
+                self.credited = True
+            head = self.flow_queues[flow_id][0]
+            if head.size <= self.deficit[flow_id]:
+                return head
+            self.active.rotate(-1)
+            self.credited = False
+
+    def popleft(self):
+        pkt = self.peek()
+        flow_id = self.active[0]
+        flow_queue = self.flow_queues[flow_id]
+        flow_queue.popleft()
+        self.deficit[flow_id] -= pkt.size
+        if not flow_queue:
+            # A flow that runs out of packets loses its remaining credit
+            del self.flow_queues[flow_id]
+            del self.deficit[flow_id]
+            self.active.popleft()
+            self.credited = False
+        self.size -= 1
+        return pkt
 
 
 class Link:
     """
-    A class to represent a link with a finite capacity of 1 packet per tick
-    We can generalize this to other capacities, but we're keeping the assignment simple
+    A class to represent a link with a finite capacity of rate packets (or bytes) per tick.
+
+    The link serves its queue with a token bucket: every tick it earns rate tokens and
+    sends packets from the head of the queue for as long as it has enough tokens to pay
+    for them (1 token per packet, or pkt.size tokens per packet when rate_unit is BYTES).
+    Fractional rates therefore send a packet every few ticks. Unused capacity is not
+    banked while the queue is empty, so the default rate of 1 packet per tick sends
+    exactly one packet on every tick that the queue is non-empty.
+
+    queue_limit caps the queue in packets, or in bytes when limit_unit is BYTES.
+
+    The scheduler picks which queued packet goes next: FIFO, ROUND_ROBIN over flows
+    (by pkt.flow_id) or DRR (deficit round robin with the given quantum in bytes).
+
+    Whether a packet sent on the link is lost is decided by loss_model (see
+    loss_models.py), by default independent losses with probability loss_ratio drawn
+    from rng, a random.Random that the loss model takes over. A link given neither
+    draws from its own random.Random(Link.DEFAULT_SEED), so that its losses don't
+    depend on the global random module; links built that way all see the same
+    losses, and callers wanting different ones pass their own rng.
+    Drops, losses and departures are recorded to tracer (a tracer.Tracer) if it is set.
+
+    With a capacity_trace (a capacity_trace.CapacityTrace) the link earns the delivery
+    opportunities of the trace instead of rate tokens: one packet's worth of tokens
+    (Packet.SIZE when rate_unit is BYTES) per opportunity of the ticks it went through.
+    next_event_tick() skips straight to the tick that brings enough of them, so
+    stretches of the trace without any cost nothing.
     """
-    def __init__(self, loss_ratio, queue_limit, verbose=True):
-        self.link_queue = queue.Queue()
+    PACKETS = "packets"
+    BYTES = "bytes"
+    FIFO = "fifo"
+    ROUND_ROBIN = "rr"
+    DRR = "drr"
+    # Seed of the rng of links given neither a loss_model nor an rng
+    DEFAULT_SEED = 0
+
+    def __init__(self, loss_ratio, queue_limit, verbose=True, rate=1, rate_unit=PACKETS, limit_unit=PACKETS, rng=None,
+                 scheduler=FIFO, quantum=Packet.SIZE, loss_model=None, capacity_trace=None):
+        if rate_unit not in [Link.PACKETS, Link.BYTES] or limit_unit not in [Link.PACKETS, Link.BYTES]:
+            raise ValueError("rate_unit and limit_unit must be Link.PACKETS or Link.BYTES")
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if scheduler == Link.FIFO:
+            self.link_queue = FifoQueue()
+        elif scheduler == Link.ROUND_ROBIN:
+            self.link_queue = RoundRobinQueue()
+        elif scheduler == Link.DRR:
+            self.link_queue = DeficitRoundRobinQueue(quantum)
+        else:
+            raise ValueError("scheduler must be Link.FIFO, Link.ROUND_ROBIN or Link.DRR")
         self.loss_ratio = loss_ratio
         self.queue_limit = queue_limit
         self.verbose = verbose
+        if loss_model is None:
+            if rng is None:
+                rng = random.Random(Link.DEFAULT_SEED)
+            loss_model = IidLoss(loss_ratio, rng)
+        self.loss_model = loss_model
+        self.tracer = None
+        self.rate = rate
+        self.rate_unit = rate_unit
+        self.limit_unit = limit_unit
+        # Tokens are kept as integers in units of 1/rate_den so that fractional
+        # rates add up exactly however many ticks are skipped at once
+        rate = Fraction(rate).limit_denominator(1000000)
+        self.rate_num = rate.numerator
+        self.rate_den = rate.denominator
+        self.capacity_trace = capacity_trace
+        # Tokens earned per delivery opportunity of capacity_trace
+        self.opportunity_tokens = self.rate_den * (Packet.SIZE if rate_unit == Link.BYTES else 1)
+        self.tokens = 0
+        self.queue_bytes = 0
+        self.last_tick = -1
+        self.idle = True
+
+    def cost(self, pkt):
+        # Tokens (in units of 1/rate_den) needed to send pkt
+        if self.rate_unit == Link.BYTES:
+            return pkt.size * self.rate_den
+        return self.rate_den
 
-    def recv(self, pkt):
+    def recv(self, pkt, tick=-1):
         """
         Function to receive a packet from a device connected at either
         ends of the link. Device here can represent an end host or any other
@@ -48,21 +247,70 @@ class Link:
         packet on to the link. If link's queue is full, it starts dropping packets
         and does not receive any more packets.
         """
-        if self.link_queue.qsize() < self.queue_limit:
-            self.link_queue.put(pkt)
+        if self.limit_unit == Link.BYTES:
+            accept = self.queue_bytes + pkt.size <= self.queue_limit
+        else:
+            accept = len(self.link_queue) < self.queue_limit
+        if accept:
+            self.link_queue.append(pkt)
+            self.queue_bytes += pkt.size
         else:
             if self.verbose:
                 print("Link dropped packet because queue_limit was exceeded")
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.DROP, pkt.seq_num, len(self.link_queue))
 
     def tick(self, tick, pdbox):
         """
         This function simulates what a link would do at each time instant (tick).
-        It dequeue packets and sends it to the propagation delay box
+        It dequeues as many packets as its rate allows and sends them to the
+        propagation delay box
         """
-        if self.link_queue.qsize() != 0:
-            head = self.link_queue.get()
-            if random.uniform(0.0, 1) < (1 - self.loss_ratio):
+        link_queue = self.link_queue
+        if len(link_queue) == 0:
+            return
+        # Earn tokens for every tick since the last one we were ticked on. If the queue
+        # was empty until now, the packets only just arrived and earn a single tick.
+        capacity_trace = self.capacity_trace
+        if capacity_trace is not None:
+            start = tick if self.idle else self.last_tick + 1
+            self.tokens += capacity_trace.opportunities(start, tick + 1) * self.opportunity_tokens
+            self.idle = False
+        elif self.idle:
+            self.tokens += self.rate_num
+            self.idle = False
+        else:
+            self.tokens += self.rate_num * (tick - self.last_tick)
+        self.last_tick = tick
+        while link_queue and self.tokens >= self.cost(link_queue.peek()):
+            head = link_queue.popleft()
+            self.tokens -= self.cost(head)
+            self.queue_bytes -= head.size
+            if not self.loss_model.lost():
                 pdbox.recv(head, tick)
+                if self.tracer is not None:
+                    self.tracer.emit(tick, tracer.DEPART, head.seq_num, tick - head.sent_ts)
             else:
                 if self.verbose:
                     print("@ tick ", tick, " link dropped a packet ")
+                if self.tracer is not None:
+                    self.tracer.emit(tick, tracer.LOSS, head.seq_num, len(link_queue))
+        if len(link_queue) == 0:
+            self.tokens = 0
+            self.idle = True
+
+    def next_event_tick(self, tick):
+        """
+        Tick at which the link has earned enough tokens to dequeue its head packet,
+        or math.inf if its queue is empty.
+        """
+        if len(self.link_queue) == 0:
+            return math.inf
+        if self.idle:
+            return tick + 1
+        missing = self.cost(self.link_queue.peek()) - self.tokens
+        capacity_trace = self.capacity_trace
+        if capacity_trace is not None:
+            needed = max(1, -(-missing // self.opportunity_tokens))
+            return capacity_trace.tick_of(capacity_trace.cumulative(tick + 1) + needed)
+        return tick + max(1, -(-missing // self.rate_num))
@@ -10,11 +10,31 @@ class Packet:
 
     **retx**: To identify if the packet is a retransmission
 
+    **size**: Size of the packet in bytes, used by links that count bytes
+
+    **flow_id**: Flow the packet belongs to, used to hand its ACK to the right host
+    when several hosts share a link (see MultiFlowSimulator)
+
+    **dst**: Node the packet is currently headed to when it is routed across a
+    Topology (the receiver, then the sender for its ACK)
+
+    Packets use __slots__ so they don't carry a per-instance __dict__. Hosts create
+    them with Packet.alloc() and hand them back with Packet.release() once they are
+    done with them, so that long runs reuse packets from a free list instead of
+    allocating a new object for every transmission.
     """
+    __slots__ = ("sent_ts", "seq_num", "size", "flow_id", "dst", "pdbox_time", "num_retx", "timeout_duration", "timeout_tick")
+    SIZE = 1500
+    # Maximum number of released packets kept for reuse
+    POOL_SIZE = 1 << 16
+    pool = []
 
-    def __init__(self, sent_ts, seq_num):
+    def __init__(self, sent_ts, seq_num, size=SIZE):
         self.sent_ts = sent_ts
-        self.seq_num = seq_num  
+        self.seq_num = seq_num
+        self.size = size
+        self.flow_id = 0
+        self.dst = -1
         self.pdbox_time = -1
         self.num_retx = 0
         self.timeout_duration = 0
@@ -22,3 +42,33 @@ class Packet:
 
     def __repr__(self):
         return str(self.seq_num)
+
+    @staticmethod
+    def alloc(sent_ts, seq_num, size=SIZE):
+        """
+        Returns a packet from the free list, reset as if it was just constructed
+        """
+        pool = Packet.pool
+        if pool:
+            pkt = pool.pop()
+            # Same as __init__, spelled out because calling it costs more than a new packet
+            pkt.sent_ts = sent_ts
+            pkt.seq_num = seq_num
+            pkt.size = size
+            pkt.flow_id = 0
+            pkt.dst = -1
+            pkt.pdbox_time = -1
+            pkt.num_retx = 0
+            pkt.timeout_duration = 0
+            pkt.timeout_tick = 0
+            return pkt
+        return Packet(sent_ts, seq_num, size)
+
+    @staticmethod
+    def release(pkt):
+        """
+        Puts pkt on the free list. The caller must not hold any other reference to
+        pkt, since a later alloc() will hand it out again.
+        """
+        if len(Packet.pool) < Packet.POOL_SIZE:
+            Packet.pool.append(pkt)
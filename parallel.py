@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Conservative parallel simulation of a Topology across worker processes.
+
+The nodes of the topology are split into partitions, one per worker. A worker owns
+the nodes of its partition, the links leaving them and the flows whose source is
+one of them, and simulates them with its own TopologySimulator. A link whose far
+end is in another partition (a cut link) hands the packets it sends to a
+RemoteBox instead of its DelayBox; they are shipped to the partition of the far
+end, which puts them in its copy of the link's DelayBox.
+
+A packet sent on a cut link at tick t can't reach the other partition before
+t + lookahead, where lookahead is the smallest delay of any cut link. Workers
+therefore advance in lockstep epochs of lookahead ticks: within an epoch nothing
+another worker does can affect them, and the packets sent during an epoch are
+exchanged in one batch per worker (over a pipe) before the next one starts. When
+the whole topology is idle, the next epoch starts at the earliest pending event.
+
+Since links draw losses from their own random streams (see topology.link_rng())
+and every tick processes a partition's links and delay boxes in the same order as
+TopologySimulator does, results are identical to a single-process run with the
+same seed. Flows with ack=Topology.DIRECT need their source and destination in the
+same partition, and cut links need a delay of at least one tick.
+
+    python parallel.py topology.json --seed 1 --ticks 100000 --workers 4
+"""
+
+import argparse
+import heapq
+import math
+import multiprocessing
+from packet import Packet
+from topology import Topology, TopologySimulator, report
+from multi_flow import HostWakeups
+
+
+def partition_nodes(topology, parts, balance=1.25):
+    """
+    Returns the partition of every node id, trying to make the lookahead large.
+
+    For a threshold delay, the nodes joined by links shorter than the threshold must
+    stay together. These groups are packed into parts partitions, largest group first
+    into the partition with the fewest nodes. The largest threshold whose packing puts
+    at most balance times the average number of nodes in any partition wins, so cut
+    links are as long as the balance allows (and at least 1 tick).
+    """
+    num_nodes = len(topology.nodes)
+    delays = sorted(set(link["delay"] for link in topology.links if link["delay"] >= 1), reverse=True)
+    node_part = [0] * num_nodes
+    for threshold in delays:
+        parent = list(range(0, num_nodes))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for link in topology.links:
+            if link["delay"] < threshold:
+                parent[find(link["src"])] = find(link["dst"])
+        groups = {}
+        for node in range(0, num_nodes):
+            groups.setdefault(find(node), []).append(node)
+        loads = [0] * parts
+        for group in sorted(groups.values(), key=lambda group: (-len(group), group[0])):
+            part = loads.index(min(loads))
+            loads[part] += len(group)
+            for node in group:
+                node_part[node] = part
+        if max(loads) <= balance * num_nodes / parts:
+            break
+    return node_part
+
+
+class RemoteBox:
+    """
+    Stands in for the DelayBox of a cut link: collects the packets the link sends
+    as (link id, tick, packet fields) so they can be shipped to the far end
+    """
+
+    def __init__(self, link_id, outbox):
+        self.link_id = link_id
+        self.outbox = outbox
+
+    def recv(self, pkt, tick, delay=None):
+        self.outbox.append((self.link_id, tick, (pkt.sent_ts, pkt.seq_num, pkt.size, pkt.flow_id, pkt.dst,
+                                                 pkt.num_retx, pkt.timeout_duration, pkt.timeout_tick)))
+
+    def __len__(self):
+        # Packets never stay here, so there is never a delay box tick to schedule
+        return 0
+
+
+class PartitionSimulator(TopologySimulator):
+    """
+    TopologySimulator for the nodes of one partition
+    """
+
+    def __init__(self, topology, seed, node_part, part, verbose=False):
+        TopologySimulator.__init__(self, topology, seed, verbose=verbose)
+        self.flow_ids = [flow_id for flow_id, flow in enumerate(topology.flows) if node_part[flow["src"]] == part]
+        self.wakeups = HostWakeups(self.hosts, self.flow_ids)
+        self.outbox = []
+        for link_id, link in enumerate(topology.links):
+            if node_part[link["src"]] == part and node_part[link["dst"]] != part:
+                self.pdboxes[link_id] = RemoteBox(link_id, self.outbox)
+
+    def inject(self, packets):
+        # Put packets sent on cut links by other partitions into their delay boxes
+        for link_id, tick_val, fields in packets:
+            pkt = Packet.alloc(fields[0], fields[1], fields[2])
+            pkt.flow_id, pkt.dst, pkt.num_retx, pkt.timeout_duration, pkt.timeout_tick = fields[3:]
+            pdbox = self.pdboxes[link_id]
+            pdbox.recv(pkt, tick_val)
+            if self.pdbox_wake[link_id] == math.inf:
+                self.pdbox_wake[link_id] = pdbox.next_event_tick(tick_val)
+                heapq.heappush(self.pdbox_heap, (self.pdbox_wake[link_id], link_id))
+
+    def take_outbox(self):
+        outbox = list(self.outbox)
+        del self.outbox[:]
+        return outbox
+
+
+def run_worker(conn, topology, seed, node_part, part):
+    simulator = PartitionSimulator(topology, seed, node_part, part)
+    while True:
+        command, args = conn.recv()
+        if command == "run":
+            inbox, start, until = args
+            simulator.inject(inbox)
+            simulator.now = max(simulator.now, start)
+            simulator.run(until)
+            # Earliest tick at which this partition has something to do
+            conn.send((simulator.take_outbox(), simulator.next_event_tick(until - 1)))
+        elif command == "seqs":
+            conn.send({flow_id: simulator.hosts[flow_id].in_order_rx_seq for flow_id in simulator.flow_ids})
+        else:
+            conn.close()
+            return
+
+
+class ParallelTopologySimulator:
+    """
+    Runs a Topology split across worker processes, with the same results as
+    TopologySimulator. node_part gives the partition of every node id (see
+    partition_nodes(), which is used by default). Work only spreads across workers
+    as well as the flows and links are spread across partitions, and every epoch
+    costs a round trip to each worker, so long cut links make for faster runs.
+    """
+
+    def __init__(self, topology, seed, workers, node_part=None):
+        if node_part is None:
+            node_part = partition_nodes(topology, workers)
+        if len(node_part) != len(topology.nodes) or not all(0 <= part < workers for part in node_part):
+            raise ValueError("node_part must give a partition below workers for every node")
+        self.topology = topology
+        self.node_part = node_part
+        self.link_part = [node_part[link["dst"]] for link in topology.links]
+        self.link_delay = [link["delay"] for link in topology.links]
+
+        self.lookahead = math.inf
+        for link in topology.links:
+            if node_part[link["src"]] != node_part[link["dst"]]:
+                self.lookahead = min(self.lookahead, link["delay"])
+        if self.lookahead < 1:
+            raise ValueError("links between partitions need a delay of at least 1 tick")
+        for flow_id, flow in enumerate(topology.flows):
+            if flow["ack"] == Topology.DIRECT and node_part[flow["src"]] != node_part[flow["dst"]]:
+                raise ValueError("flow %d has direct ACKs, so its source and destination must be in the same partition" % flow_id)
+
+        self.conns = []
+        self.processes = []
+        for part in range(0, workers):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker, args=(child_conn, topology, seed, node_part, part))
+            process.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        # Packets in transit to every partition, and the earliest tick each partition has work at
+        self.inboxes = [[] for _ in range(0, workers)]
+        self.next_ticks = [0] * workers
+        self.now = 0
+
+    def run(self, until):
+        # Run simulation from self.now up to (but not including) tick until, one epoch at a time
+        while self.now < until:
+            start = min(self.next_ticks)
+            for inbox in self.inboxes:
+                for link_id, tick_val, _ in inbox:
+                    start = min(start, tick_val + self.link_delay[link_id])
+            if start >= until:
+                break
+            start = max(start, self.now)
+            end = min(until, start + self.lookahead)
+            for conn, inbox in zip(self.conns, self.inboxes):
+                conn.send(("run", (inbox, start, end)))
+            self.inboxes = [[] for _ in self.conns]
+            for part, conn in enumerate(self.conns):
+                outbox, self.next_ticks[part] = conn.recv()
+                for packet in outbox:
+                    self.inboxes[self.link_part[packet[0]]].append(packet)
+            self.now = end
+        self.now = until
+
+    def in_order_rx_seqs(self):
+        seqs = [0] * len(self.topology.flows)
+        for conn in self.conns:
+            conn.send(("seqs", None))
+            for flow_id, seq in conn.recv().items():
+                seqs[flow_id] = seq
+        return seqs
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(("stop", None))
+            conn.close()
+        for process in self.processes:
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a multi-hop topology split across worker processes")
+    parser.add_argument("topology", help="topology file (JSON, or YAML with PyYAML installed)")
+    parser.add_argument("--seed", type=int, required=True)
+    parser.add_argument("--ticks", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    topology = Topology.load(args.topology)
+    simulator = ParallelTopologySimulator(topology, args.seed, args.workers)
+    try:
+        simulator.run(args.ticks)
+        report(topology, simulator.in_order_rx_seqs())
+    finally:
+        simulator.close()
+
+
+if __name__ == "__main__":
+    main()
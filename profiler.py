@@ -0,0 +1,219 @@
+"""
+Per-component profiling of Simulator.tick.
+
+A Profiler attached to a Simulator (Simulator(..., profiler=...) or attach_profiler())
+replaces the simulator's tick with Profiler.tick for as long as it is attached. A
+simulator without a profiler runs the plain Simulator.tick, so profiling costs
+nothing when it is off.
+
+Every sample_every-th tick that tick() runs on is timed component by component with
+time.perf_counter_ns: host.send, link.recv, link.tick, pdbox.tick (without the time
+spent in host.recv) and host.recv, together with the number of calls and packets
+each one handled. The other ticks run untimed, and only the peak sizes of the link
+queue, the delay box and the host's unacked packets are recorded on them. Totals
+for the whole run are estimated by scaling the sampled times up by the sampling rate.
+Simulator.run() skips idle ticks without calling tick(), so the ticks visited (and
+sampled) can be far fewer than the ticks simulated, which are counted from the
+simulator's tick when the profiler is attached up to its tick at stop().
+
+With track_memory, tracemalloc is started when the profiler is attached and
+snapshots taken then and at stop() are compared, to report the peak traced memory
+and the source lines that allocated the most blocks during the run.
+
+summary() returns the numbers as a dict and report() formats them as a table:
+
+    python simulator.py --seed 1 --host_type aimd --rtt_min 10 --ticks 100000 --profile 100
+"""
+
+import time
+import tracemalloc
+from packet import Packet
+
+
+class RecvTimer:
+    """
+    Stands in for the host when the delay box delivers packets on a sampled tick,
+    timing every host.recv
+    """
+
+    def __init__(self, host, profiler):
+        self.host = host
+        self.profiler = profiler
+        self.time_ns = 0
+
+    def recv(self, pkt, tick):
+        start = time.perf_counter_ns()
+        self.host.recv(pkt, tick)
+        elapsed = time.perf_counter_ns() - start
+        self.time_ns += elapsed
+        self.profiler.add("host.recv", elapsed, 1)
+
+
+class Profiler:
+    """
+    Collects per-component timings and peak sizes of a Simulator. Data members of this class are
+
+    **start_tick**, **end_tick**: Simulated ticks the profiler covers, from the simulator's tick
+    when it was attached up to the last tick visited, or the simulator's tick at stop()
+
+    **visited_ticks**, **sampled_ticks**: Number of ticks tick() ran on, and how many of them were timed
+
+    **time_ns**, **calls**, **packets**: Per component (see COMPONENTS) time spent, calls and
+    packets handled on the sampled ticks
+
+    **peak_link_queue**, **peak_pdbox**, **peak_unacked**: Largest sizes seen on any tick
+    """
+    COMPONENTS = ["host.send", "link.recv", "link.tick", "pdbox.tick", "host.recv"]
+
+    def __init__(self, sample_every=100, track_memory=False, top=10):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.sample_every = sample_every
+        self.track_memory = track_memory
+        self.top = top
+        self.start_tick = 0
+        self.end_tick = 0
+        self.visited_ticks = 0
+        self.sampled_ticks = 0
+        self.time_ns = dict.fromkeys(Profiler.COMPONENTS, 0)
+        self.calls = dict.fromkeys(Profiler.COMPONENTS, 0)
+        self.packets = dict.fromkeys(Profiler.COMPONENTS, 0)
+        self.peak_link_queue = 0
+        self.peak_pdbox = 0
+        self.peak_unacked = 0
+        self.first_snapshot = None
+        self.allocations = []
+        self.peak_memory = None
+        self.started_tracemalloc = False
+
+    def start(self, simulator):
+        # Called when the profiler is attached: simulated ticks are counted from the simulator's next tick
+        self.start_tick = simulator.now
+        self.end_tick = simulator.now
+        if self.track_memory and self.first_snapshot is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self.first_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self, simulator):
+        """
+        Counts the simulated ticks up to the simulator's current tick, including idle ones
+        run() skipped at the end, and takes the final memory snapshot (with track_memory)
+        and compares it to the first one
+        """
+        self.end_tick = max(self.end_tick, simulator.now)
+        if self.first_snapshot is not None and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            stats = snapshot.compare_to(self.first_snapshot, "lineno")
+            stats.sort(key=lambda stat: stat.count_diff, reverse=True)
+            self.allocations = [(str(stat.traceback), stat.count_diff, stat.size_diff) for stat in stats[:self.top]]
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+            self.first_snapshot = None
+
+    def add(self, component, elapsed_ns, packets):
+        self.time_ns[component] += elapsed_ns
+        self.calls[component] += 1
+        self.packets[component] += packets
+
+    def observe(self, simulator):
+        link_queue = len(simulator.link.link_queue)
+        if link_queue > self.peak_link_queue:
+            self.peak_link_queue = link_queue
+        pdbox = len(simulator.pdbox)
+        if pdbox > self.peak_pdbox:
+            self.peak_pdbox = pdbox
+        unacked = getattr(simulator.host, "unacked", None)
+        if unacked is not None and len(unacked) > self.peak_unacked:
+            self.peak_unacked = len(unacked)
+
+    def tick(self, simulator, tick_val):
+        # Replaces simulator.tick while the profiler is attached
+        self.visited_ticks += 1
+        self.end_tick = tick_val + 1
+        if self.visited_ticks % self.sample_every:
+            type(simulator).tick(simulator, tick_val)
+            self.observe(simulator)
+            return
+        self.sampled_ticks += 1
+        clock = time.perf_counter_ns
+        link = simulator.link
+
+        start = clock()
+        packets = simulator.send(tick_val)
+        self.add("host.send", clock() - start, 0 if packets is None else 1 if type(packets) is Packet else len(packets))
+        if packets is not None:
+            if type(packets) is Packet:
+                packets = [packets]
+            start = clock()
+            for packet in packets:
+                link.recv(packet, tick_val)
+            self.add("link.recv", clock() - start, len(packets))
+
+        queued = len(link.link_queue)
+        start = clock()
+        link.tick(tick_val, simulator.pdbox)
+        self.add("link.tick", clock() - start, queued - len(link.link_queue))
+
+        # With a receiver.Receiver, host.recv is the time spent in the receiver and the ACKs it sends
+        receiver = RecvTimer(simulator.host if simulator.receiver is None else simulator.receiver, self)
+        delivered = self.packets["host.recv"]
+        start = clock()
+        simulator.pdbox.tick(tick_val, receiver)
+        self.add("pdbox.tick", clock() - start - receiver.time_ns, self.packets["host.recv"] - delivered)
+        if simulator.receiver is not None:
+            start = clock()
+            simulator.receiver.tick(tick_val)
+            self.add("host.recv", clock() - start, 0)
+        self.observe(simulator)
+
+    def summary(self):
+        """
+        Returns the collected numbers as a dict. "ticks" counts the simulated ticks and
+        "visited_ticks" those tick() ran on. "estimated_total_ns" scales the sampled time
+        of every component up to all visited ticks (skipped ticks cost no component time).
+        """
+        scale = self.visited_ticks / self.sampled_ticks if self.sampled_ticks else 0
+        components = {}
+        for component in Profiler.COMPONENTS:
+            components[component] = {
+                "sampled_ns": self.time_ns[component],
+                "calls": self.calls[component],
+                "packets": self.packets[component],
+                "estimated_total_ns": self.time_ns[component] * scale,
+            }
+        return {
+            "ticks": self.end_tick - self.start_tick,
+            "visited_ticks": self.visited_ticks,
+            "sampled_ticks": self.sampled_ticks,
+            "components": components,
+            "peak_link_queue": self.peak_link_queue,
+            "peak_pdbox": self.peak_pdbox,
+            "peak_unacked": self.peak_unacked,
+            "peak_memory": self.peak_memory,
+            "allocations": self.allocations,
+        }
+
+    def report(self):
+        summary = self.summary()
+        total = sum(self.time_ns.values())
+        lines = ["%d ticks simulated, %d visited, %d timed" % (summary["ticks"], summary["visited_ticks"], summary["sampled_ticks"]),
+                 "%-12s %8s %12s %12s %10s %14s" % ("component", "share", "ns/call", "ns/packet", "calls", "est. total s")]
+        for component, stats in summary["components"].items():
+            calls = stats["calls"]
+            packets = stats["packets"]
+            lines.append("%-12s %7.1f%% %12.0f %12.0f %10d %14.3f" % (
+                component, 100.0 * stats["sampled_ns"] / total if total else 0.0,
+                stats["sampled_ns"] / calls if calls else 0.0, stats["sampled_ns"] / packets if packets else 0.0,
+                calls, stats["estimated_total_ns"] / 1e9))
+        lines.append("peak link queue %d, peak delay box %d, peak unacked %d" %
+                     (summary["peak_link_queue"], summary["peak_pdbox"], summary["peak_unacked"]))
+        if summary["peak_memory"] is not None:
+            lines.append("peak traced memory %d bytes, top allocation sites (blocks, bytes):" % summary["peak_memory"])
+            for site, count, size in summary["allocations"]:
+                lines.append("    %-60s %+10d %+12d" % (site, count, size))
+        return "\n".join(lines)
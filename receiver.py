@@ -0,0 +1,160 @@
+"""
+Cumulative, delayed and selective ACKs.
+
+By default every packet that comes out of the delay box is handed to host.recv()
+on its own, so the host updates its timeout, looks the packet up among its unacked
+packets and recomputes in_order_rx_seq once per packet. A Receiver sits between
+the delay box and the host instead and acks the packets it receives the way a TCP
+receiver does: one Ack covers every packet received since the previous one, and is
+handed to host.recv_ack() in a single call. The ACK is sent once ack_every packets
+are waiting for it, or ack_delay ticks after the first of them arrived, whichever
+comes first. ack_delay 0 sends it at the end of the tick the first one arrived on,
+so ack_every then only groups packets that arrive on the same tick. ack_delay
+therefore defaults to DEFAULT_ACK_DELAY ticks when ack_every is above 1, and to 0
+(every packet acked as it arrives) otherwise.
+
+An Ack carries
+
+    cumulative: every sequence number up to it has been received
+    ranges:     (start, end) ranges, inclusive, of sequence numbers above cumulative
+                received since the previous ACK (SACK blocks, empty without sack)
+    sent_ts:    sent_ts of the oldest packet the ACK covers, for one RTT sample
+                that includes the time the ACK was held back (as RFC 7323 echoes)
+    count:      the number of packets the ACK covers, duplicates included
+
+The path from the receiver to the host doesn't lose ACKs, so each one only needs
+the ranges received since the previous one rather than the latest blocks as TCP
+sends them. Without sack, packets received above a hole are only acked once the
+hole is filled. With ack_every 1 every packet is acked as it arrives, and hosts
+end up exactly where one recv() per packet would have left them.
+"""
+
+import heapq
+import math
+from packet import Packet
+
+
+class Ack:
+    """
+    A cumulative ACK, see the module documentation. Receivers reuse one Ack, so
+    hosts must not keep it.
+    """
+    __slots__ = ("cumulative", "ranges", "sent_ts", "count")
+
+    def __init__(self):
+        self.cumulative = -1
+        self.ranges = []
+        self.sent_ts = 0
+        self.count = 0
+
+
+class Receiver:
+    """
+    Receiving end that acks the packets it gets from the delay box to host with
+    cumulative ACKs, every ack_every packets or ack_delay ticks after the first
+    unacked one (DEFAULT_ACK_DELAY if ack_every is above 1 and ack_delay is not
+    given), with SACK ranges if sack is set
+    """
+    # Ticks an ACK is held back at most when ack_every is above 1 and ack_delay isn't given
+    DEFAULT_ACK_DELAY = 5
+
+    def __init__(self, host, ack_every=1, ack_delay=None, sack=True):
+        if ack_every < 1:
+            raise ValueError("ack_every must be at least 1")
+        if ack_delay is None:
+            ack_delay = Receiver.DEFAULT_ACK_DELAY if ack_every > 1 else 0
+        if ack_delay < 0:
+            raise ValueError("ack_delay must not be negative")
+        self.host = host
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.sack = sack
+        # Every sequence number up to cumulative has been received, and the ones in
+        # above beyond it; new_above are those received since the last ACK
+        self.cumulative = -1
+        self.above = set()
+        self.new_above = []
+        # Packets received since the last ACK, and the tick the ACK is due at the latest
+        self.pending = []
+        self.deadline = math.inf
+        # Without sack, packets acked above cumulative, which the host may still hold,
+        # as a heap of (seq_num, id, packet) to release once cumulative passes them
+        self.held = []
+        self.ack = Ack()
+        # ACKs sent and packets they covered so far
+        self.acks_sent = 0
+        self.packets_acked = 0
+
+    def recv(self, pkt, tick):
+        seq_num = pkt.seq_num
+        if seq_num == self.cumulative + 1:
+            above = self.above
+            seq_num += 1
+            while seq_num in above:
+                above.remove(seq_num)
+                seq_num += 1
+            self.cumulative = seq_num - 1
+        elif seq_num > self.cumulative and seq_num not in self.above:
+            self.above.add(seq_num)
+            self.new_above.append(seq_num)
+        pending = self.pending
+        if not pending:
+            self.deadline = tick + self.ack_delay
+        pending.append(pkt)
+        if len(pending) >= self.ack_every:
+            self.send_ack(tick)
+
+    def tick(self, tick):
+        # Sends the ACK that has been held back for ack_delay ticks, if there is one
+        if self.pending and self.deadline <= tick:
+            self.send_ack(tick)
+
+    def next_event_tick(self, tick):
+        """
+        Tick at which the held back ACK is due, or math.inf if there is none
+        """
+        return max(tick + 1, self.deadline) if self.pending else math.inf
+
+    def send_ack(self, tick):
+        ack = self.ack
+        cumulative = self.cumulative
+        ack.cumulative = cumulative
+        ranges = ack.ranges
+        ranges.clear()
+        if self.sack and self.new_above:
+            start = end = None
+            for seq_num in sorted(self.new_above):
+                if seq_num <= cumulative:
+                    continue
+                if end is not None and seq_num == end + 1:
+                    end = seq_num
+                    continue
+                if start is not None:
+                    ranges.append((start, end))
+                start = end = seq_num
+            if start is not None:
+                ranges.append((start, end))
+        self.new_above.clear()
+        pending = self.pending
+        ack.sent_ts = pending[0].sent_ts
+        ack.count = len(pending)
+        self.acks_sent += 1
+        self.packets_acked += ack.count
+        self.host.recv_ack(ack, tick)
+        # The host has acked every packet the ACK covers, so they can be reused, except
+        # (without sack) packets above cumulative, which the host may still hold until
+        # an ACK gets past them
+        release = Packet.release
+        if self.sack:
+            for pkt in pending:
+                release(pkt)
+        else:
+            held = self.held
+            for pkt in pending:
+                if pkt.seq_num <= cumulative:
+                    release(pkt)
+                else:
+                    heapq.heappush(held, (pkt.seq_num, id(pkt), pkt))
+            while held and held[0][0] <= cumulative:
+                release(heapq.heappop(held)[2])
+        pending.clear()
@@ -18,15 +18,31 @@ link (where queues build up) to pdbox (where the packets incur a min.RTT worth
 of delay) back to host (where the recv() method is called to process ACKs for
 packets that were sent by host.send()).
 
+A simulator given a receiver puts a Receiver (see receiver.py) between pdbox and
+host instead: it acks the packets that come out of pdbox with cumulative ACKs,
+each covering any number of packets in one host.recv_ack() call.
+
 The current value of time is represented by the variable tick, which is set in
 the for loop and then passed to each of the objects within the simulator. If you
 need to access the current value of time when implementing a protocol (e.g., for
 computing RTT samples, or for setting the timestamp at which a packet was sent),
 tick is the variable you should be using. You don't need to create your own
 version of time.
+
+Instead of calling tick() for every value of time, Simulator.run() only visits
+ticks on which something can happen: the link has a queued packet, a packet is
+due out of pdbox, or the host has room in its window or a timer expiring. Each
+of these objects reports its next such tick through next_event_tick(). Idle
+stretches (e.g. a host waiting out a long timeout) are skipped in one step, and
+the results are identical to calling tick() on every value of time.
 """
 
 import argparse
+import functools
+import json
+import math
+import os
+import pickle
 import random
 from network import DelayBox, Link
 from packet import Packet
@@ -34,6 +50,14 @@ from timeout_calculator import TimeoutCalculator
 from stop_and_wait_host import StopAndWaitHost
 from sliding_window_host import SlidingWindowHost
 from aimd_host import AimdHost
+from tracer import Tracer
+from profiler import Profiler
+from metrics import Metrics
+from steady_state import FastForward
+from loss_models import GILBERT_ELLIOTT, IID, make_loss_model
+from capacity_trace import CapacityTrace
+from receiver import Receiver
+from branching import in_order_rx_seq, run_branches
 
 
 def check_host_type(host_type):
@@ -45,18 +69,142 @@ def check_host_type(host_type):
     return host_type.lower()
 
 
+def make_host(host_type, window_size=None, verbose=True, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+    # Create a host of the given (lower case) host type
+    if host_type == "stopandwait":
+        return StopAndWaitHost(verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
+    elif host_type == "slidingwindow":
+        if window_size is None:
+            raise argparse.ArgumentTypeError("window_size must be defined for host_type SlidingWindow")
+        return SlidingWindowHost(window_size, verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
+    elif host_type == "aimd":
+        return AimdHost(verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
+    else:
+        assert False
+
+
 class Simulator:
-    def __init__(self, host, loss_ratio, queue_limit, rtt_min, seed, verbose=True):
+    def __init__(self, host, loss_ratio, queue_limit, rtt_min, seed, verbose=True,
+                 link_rate=1, rate_unit=Link.PACKETS, limit_unit=Link.PACKETS, tracer=None, profiler=None,
+                 loss_model=None, metrics=None, fast_forward=None, capacity_trace=None, receiver=None):
         self.host = host
-        random.seed(seed)
+        # Each simulator draws from its own generator, so that several simulators
+        # can run in the same process without disturbing each other
+        self.rng = random.Random(seed)
 
-        # Sender and receiver are part of the host they are same as send() and recv() methods
-        self.link = Link(loss_ratio=loss_ratio, queue_limit=queue_limit, verbose=verbose)
+        # Sender and receiver are part of the host they are same as send() and recv() methods.
+        # loss_model is a dict describing the link's loss model (see loss_models.make_loss_model()),
+        # i.i.d. losses with probability loss_ratio by default. capacity_trace is the path of a
+        # binary capacity trace (see capacity_trace.py) that replaces link_rate, if given
+        self.loss_model = loss_model
+        self.link = Link(loss_ratio=loss_ratio, queue_limit=queue_limit, verbose=verbose,
+                         rate=link_rate, rate_unit=rate_unit, limit_unit=limit_unit, rng=self.rng,
+                         loss_model=make_loss_model(loss_model, loss_ratio, self.rng),
+                         capacity_trace=CapacityTrace(capacity_trace) if capacity_trace is not None else None)
 
         # Delay for delay box
         if rtt_min < 2:
             raise argparse.ArgumentTypeError("rtt_min must be at least 2")
         self.pdbox = DelayBox(rtt_min - 1)
+        # receiver is a dict of receiver.Receiver parameters (ack_every, ack_delay, sack): if
+        # given, the host gets cumulative ACKs from a Receiver rather than one recv() per packet
+        self.receiver = Receiver(host, **receiver) if receiver is not None else None
+
+        # Next tick that run() will simulate
+        self.now = 0
+
+        # Host and link record their events to tracer, if there is one. Per-component
+        # timings are collected by profiler (see profiler.py) and time series emitted
+        # by metrics (see metrics.py), if there are any.
+        self.tracer = None
+        self.profiler = None
+        self.metrics = None
+        # Periodic states are jumped over by fast_forward (see steady_state.py), if there is one
+        self.fast_forward = fast_forward
+        if tracer is not None:
+            self.attach_tracer(tracer)
+        if profiler is not None:
+            self.attach_profiler(profiler)
+        if metrics is not None:
+            self.attach_metrics(metrics)
+
+    CHECKPOINT_MAGIC = b"NSCKPT"
+    CHECKPOINT_VERSION = 7
+
+    def attach_tracer(self, tracer):
+        # Make host and link record their events to tracer (or stop recording if None)
+        self.tracer = tracer
+        self.connect_events()
+
+    def attach_profiler(self, profiler):
+        # Make tick() go through profiler (or stop profiling if None)
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.start(self)
+        self.install_tick()
+
+    def attach_metrics(self, metrics):
+        # Feed the events of host and link and every tick to metrics (or stop if None)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.start(self)
+        self.connect_events()
+        self.install_tick()
+
+    def connect_events(self):
+        # Host and link emit to the metrics, which pass the events on to the tracer, or straight to the tracer
+        sink = self.tracer
+        if self.metrics is not None:
+            self.metrics.tracer = self.tracer
+            sink = self.metrics
+        self.host.tracer = sink
+        self.link.tracer = sink
+
+    def install_tick(self):
+        # The plain tick is only shadowed while a profiler or metrics are attached, so
+        # it costs nothing otherwise. Metrics wrap the profiled tick, if there is one.
+        self.__dict__.pop("tick", None)
+        if self.profiler is not None:
+            self.tick = functools.partial(self.profiler.tick, self)
+        if self.metrics is not None:
+            self.tick = functools.partial(self.metrics.tick, self, self.tick)
+
+    def save_checkpoint(self, path):
+        # Write the whole simulation state (host, link queue, pdbox, tick, RNG state) to path.
+        # The tracer is not saved, since it holds an open file. The file is replaced
+        # atomically, so a run killed while writing still leaves the previous checkpoint.
+        tracer = self.tracer
+        profiler = self.profiler
+        metrics = self.metrics
+        self.profiler = None
+        self.metrics = None
+        self.attach_tracer(None)
+        self.install_tick()
+        try:
+            state = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            self.profiler = profiler
+            self.metrics = metrics
+            self.attach_tracer(tracer)
+            self.install_tick()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(Simulator.CHECKPOINT_MAGIC)
+            f.write(bytes([Simulator.CHECKPOINT_VERSION]))
+            f.write(state)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_checkpoint(path):
+        # Return the simulator saved by save_checkpoint. Running it on gives exactly the
+        # same results as if the saved simulator had never stopped.
+        with open(path, "rb") as f:
+            if f.read(len(Simulator.CHECKPOINT_MAGIC)) != Simulator.CHECKPOINT_MAGIC:
+                raise ValueError(path + " is not a simulator checkpoint")
+            version = f.read(1)[0]
+            if version != Simulator.CHECKPOINT_VERSION:
+                raise ValueError("unsupported checkpoint version " + str(version))
+            return pickle.load(f)
 
     def send(self, tick_val):
         # Host makes a packet 
@@ -70,13 +218,52 @@ class Simulator:
             if type(packets) is Packet:
                 packets = [packets]
             for packet in packets:
-                self.link.recv(packet)
+                self.link.recv(packet, tick_val)
         self.link.tick(tick_val, self.pdbox)
-        self.pdbox.tick(tick_val, self.host)
+        if self.receiver is None:
+            self.pdbox.tick(tick_val, self.host)
+        else:
+            self.pdbox.tick(tick_val, self.receiver)
+            self.receiver.tick(tick_val)
+
+    def next_event_tick(self, tick_val):
+        # Earliest tick after tick_val on which the host, link, pdbox or receiver has work to do.
+        # Hosts that don't implement next_event_tick are woken up on every tick.
+        if hasattr(self.host, "next_event_tick"):
+            host_tick = self.host.next_event_tick(tick_val)
+        else:
+            host_tick = tick_val + 1
+        next_tick = min(host_tick, self.link.next_event_tick(tick_val), self.pdbox.next_event_tick(tick_val))
+        if self.receiver is not None:
+            next_tick = min(next_tick, self.receiver.next_event_tick(tick_val))
+        return next_tick
+
+    def attach_fast_forward(self, fast_forward):
+        # Make run() jump over cycles of periodic states with fast_forward (or stop if None)
+        self.fast_forward = fast_forward
+
+    def branch(self, branches, until, workers=None, collect=in_order_rx_seq):
+        # Run what-if branches of this simulation up to until in forked processes, and
+        # return their results (see branching.py). This simulator is left as it is.
+        return run_branches(self, branches, until, workers=workers, collect=collect)
+
+    def run(self, until):
+        # Run simulation from self.now up to (but not including) tick until, skipping idle ticks
+        if self.fast_forward is not None and self.fast_forward.applies(self):
+            self.fast_forward.run(self, until)
+            return
+        tick_val = self.now
+        while tick_val < until:
+            self.tick(tick_val)
+            next_tick = self.next_event_tick(tick_val)
+            if next_tick == math.inf:
+                break
+            tick_val = next_tick
+        self.now = until
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Assignment 2 simulator. Link capacity is always 1 packet per tick")
+    parser = argparse.ArgumentParser(description="Assignment 2 simulator. Link capacity defaults to 1 packet per tick")
     optional = parser._action_groups.pop()
 
     required = parser.add_argument_group("required arguments")
@@ -86,7 +273,28 @@ if __name__ == "__main__":
     required.add_argument("--ticks", dest="ticks", type=int, help="Number of ticks to run simulation for", required=True)
 
     optional.add_argument("--loss_ratio", dest="loss_ratio", type=float, help="independent and identically distributed loss probability, default 0", default=0.0)
+    optional.add_argument("--loss_model", dest="loss_model", choices=[IID, GILBERT_ELLIOTT], help="iid losses with probability loss_ratio, or bursty gilbert_elliott losses, default iid", default=IID)
+    optional.add_argument("--ge_p", dest="ge_p", type=float, help="gilbert_elliott probability of going from the good to the bad state, per packet", default=0.01)
+    optional.add_argument("--ge_r", dest="ge_r", type=float, help="gilbert_elliott probability of going from the bad to the good state, per packet", default=0.5)
+    optional.add_argument("--ge_loss_good", dest="ge_loss_good", type=float, help="gilbert_elliott loss probability in the good state, default 0", default=0.0)
+    optional.add_argument("--ge_loss_bad", dest="ge_loss_bad", type=float, help="gilbert_elliott loss probability in the bad state, default 1", default=1.0)
     optional.add_argument("--queue_limit", dest="queue_limit", type=int, help="max. queue size of link queue, defaults to 1M packets, which is practically infinite", default=1000000)
+    optional.add_argument("--link_rate", dest="link_rate", type=float, help="link capacity in rate_unit per tick, may be fractional, default 1", default=1)
+    optional.add_argument("--rate_unit", dest="rate_unit", choices=[Link.PACKETS, Link.BYTES], help="unit of link_rate, default packets", default=Link.PACKETS)
+    optional.add_argument("--capacity_trace", dest="capacity_trace", help="binary trace of delivery opportunities per tick to replay as the link capacity instead of link_rate (see capacity_trace.py)")
+    optional.add_argument("--limit_unit", dest="limit_unit", choices=[Link.PACKETS, Link.BYTES], help="unit of queue_limit, default packets", default=Link.PACKETS)
+    optional.add_argument("--ack_every", dest="ack_every", type=int, help="acknowledge with one cumulative ACK every this many packets instead of one ACK per packet (see receiver.py)")
+    optional.add_argument("--ack_delay", dest="ack_delay", type=int, help="with cumulative ACKs, send the ACK at most this many ticks after the first packet it covers arrived, default %d if --ack_every is above 1 (0 only groups packets arriving on the same tick)" % Receiver.DEFAULT_ACK_DELAY)
+    optional.add_argument("--no_sack", dest="sack", action="store_false", help="with cumulative ACKs, don't acknowledge packets received above a hole until it is filled")
+    optional.add_argument("--trace", dest="trace", help="file to record a binary event trace to (see tracer.py)")
+    optional.add_argument("--checkpoint", dest="checkpoint", help="file to save checkpoints to")
+    optional.add_argument("--checkpoint_every", "--checkpoint-every", dest="checkpoint_every", type=int, help="save a checkpoint every this many ticks")
+    optional.add_argument("--resume", dest="resume", help="continue the simulation saved in this checkpoint file (its settings replace the ones given here) up to --ticks")
+    optional.add_argument("--profile", dest="profile", type=int, metavar="SAMPLE_EVERY", help="time host, link and delay box on every SAMPLE_EVERY-th tick and print a summary")
+    optional.add_argument("--profile_memory", dest="profile_memory", action="store_true", help="with --profile, also report allocations traced with tracemalloc")
+    optional.add_argument("--metrics", dest="metrics", help="file to write time series of goodput, utilization, queue, delays and window to as JSON lines, - for stdout (see metrics.py)")
+    optional.add_argument("--metrics_interval", dest="metrics_interval", type=int, default=10000, help="ticks per metrics record, default 10000")
+    optional.add_argument("--fast_forward", dest="fast_forward", type=int, metavar="CHECK_EVERY", help="fingerprint the state every CHECK_EVERY ticks and jump over whole cycles once it repeats (only for runs without losses, see steady_state.py)")
     optional.add_argument("--window_size", dest="window_size", type=int, help="Window size in packets for sliding window sender")
     optional.add_argument("--min_timeout", dest="min_timeout", type=int, default=TimeoutCalculator.MIN_TIMEOUT, help="The minimum timeout value possible for the TimeoutCalculator")
     optional.add_argument("--max_timeout", dest="max_timeout", type=int, default=TimeoutCalculator.MAX_TIMEOUT, help="The minimum timeout value possible for the TimeoutCalculator")
@@ -96,19 +304,55 @@ if __name__ == "__main__":
     for arg in vars(args):
         print("%s: %s" % (arg, getattr(args, arg)))
 
-    if args.host_type == "stopandwait":
-        host = StopAndWaitHost(min_timeout=args.min_timeout, max_timeout=args.max_timeout)
-    elif args.host_type == "slidingwindow":
-        if args.window_size is None:
-            raise argparse.ArgumentTypeError("window_size must be defined for host_type SlidingWindow")
-        host = SlidingWindowHost(args.window_size, min_timeout=args.min_timeout, max_timeout=args.max_timeout)
-    elif args.host_type == "aimd":
-        host = AimdHost(min_timeout=args.min_timeout, max_timeout=args.max_timeout)
-    else:
-        assert False
+    if args.checkpoint_every is not None and args.checkpoint is None:
+        raise argparse.ArgumentTypeError("checkpoint_every needs a checkpoint file")
 
-    simulator = Simulator(host, args.loss_ratio, args.queue_limit, args.rtt_min, args.seed)
-    for tick in range(0, args.ticks):
-        simulator.tick(tick)
+    if args.resume is not None:
+        simulator = Simulator.load_checkpoint(args.resume)
+        if args.trace is not None:
+            simulator.attach_tracer(Tracer(args.trace))
+    else:
+        host = make_host(args.host_type, args.window_size, min_timeout=args.min_timeout, max_timeout=args.max_timeout)
+        loss_model = None
+        if args.loss_model == GILBERT_ELLIOTT:
+            loss_model = {"type": GILBERT_ELLIOTT, "p": args.ge_p, "r": args.ge_r,
+                          "loss_good": args.ge_loss_good, "loss_bad": args.ge_loss_bad}
+        receiver = None
+        if args.ack_every is not None:
+            receiver = {"ack_every": args.ack_every, "ack_delay": args.ack_delay, "sack": args.sack}
+        simulator = Simulator(host, args.loss_ratio, args.queue_limit, args.rtt_min, args.seed,
+                              link_rate=args.link_rate, rate_unit=args.rate_unit, limit_unit=args.limit_unit,
+                              capacity_trace=args.capacity_trace, receiver=receiver,
+                              tracer=Tracer(args.trace) if args.trace is not None else None, loss_model=loss_model)
+    if args.profile is not None:
+        simulator.attach_profiler(Profiler(args.profile, track_memory=args.profile_memory))
+    if args.fast_forward is not None:
+        simulator.attach_fast_forward(FastForward(args.fast_forward))
+    metrics_file = None
+    if args.metrics is not None:
+        metrics_file = open(args.metrics, "w") if args.metrics != "-" else None
+        simulator.attach_metrics(Metrics(args.metrics_interval, out=metrics_file))
+    if args.checkpoint_every is not None:
+        while simulator.now < args.ticks:
+            simulator.run(min(args.ticks, simulator.now + args.checkpoint_every))
+            simulator.save_checkpoint(args.checkpoint)
+    else:
+        simulator.run(args.ticks)
+        if args.checkpoint is not None:
+            simulator.save_checkpoint(args.checkpoint)
+    if simulator.tracer is not None:
+        simulator.tracer.close()
+    if simulator.metrics is not None:
+        summary = simulator.metrics.finish(simulator)
+        print("Metrics summary " + json.dumps(summary))
+        if metrics_file is not None:
+            metrics_file.close()
+    if simulator.fast_forward is not None:
+        fast_forward = simulator.fast_forward
+        print("Fast-forwarded %d cycles of %s ticks (%d ticks) in %d jumps" %
+              (fast_forward.cycles, fast_forward.period, fast_forward.skipped_ticks, fast_forward.jumps))
+    if simulator.profiler is not None:
+        simulator.profiler.stop(simulator)
+        print(simulator.profiler.report())
 
     print("Maximum in order received sequence number " + str(simulator.host.in_order_rx_seq))
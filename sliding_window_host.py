@@ -1,19 +1,24 @@
+import math
+import tracer
 from packet import Packet
 from timeout_calculator import TimeoutCalculator
+from unacked_window import UnackedWindow
 
 
 class SlidingWindowHost:
     """
     This host follows the SlidingWindow protocol. It maintains a window size and the
-    list of unacked packets. The algorithm itself is documented with the send method
+    set of unacked packets (an UnackedWindow). The algorithm itself is documented with the send method.
+    Events are recorded to tracer (a tracer.Tracer) if it is set.
     """
     def __init__(self, window_size, verbose=True, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
-        self.unacked = []
+        self.unacked = UnackedWindow(window_size, max_timeout)
         self.window = window_size
         self.max_seq = -1
         self.in_order_rx_seq = -1
         self.timeout_calculator = TimeoutCalculator(verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
         self.verbose = verbose
+        self.tracer = None
 
     def send(self, tick):
         """
@@ -31,44 +36,49 @@ class SlidingWindowHost:
         """
         # TODO: Create an empty list of packets that the host will send
         packets = []
-        # Process retransmissions
-        for i, unacked_pkt in enumerate(self.unacked):
-            unacked_pkt = self.unacked[i]
-            if tick >= unacked_pkt.timeout_tick:
-                if self.verbose:
-                    print("@ " + str(tick) + " timeout for unacked_pkt " + str(unacked_pkt.seq_num) + " timeout duration was " + str(unacked_pkt.timeout_duration))
-                # TODO: Retransmit any packet that has timed out
-                # New packet
-                retx_pkt = Packet(tick, unacked_pkt.seq_num)
-                # Incrementing num_retx 
-                retx_pkt.num_retx = unacked_pkt.num_retx+1
-                # Add packet to the list
-                packets.append(retx_pkt)
-                # Back off timer
-                self.timeout_calculator.exp_backoff()
-                # Update timeout_tick and timeout_duration
-                retx_pkt.timeout_duration = self.timeout_calculator.timeout
-                retx_pkt.timeout_tick = retx_pkt.timeout_duration+tick
-                if self.verbose:
-                    print( "retx packet @ " + str(tick) + " with sequence number " + str(retx_pkt.seq_num))
-                if self.verbose:
-                    print("@ " + str(tick) + " exp backoff for packet " + str(unacked_pkt.seq_num))
-            self.unacked[i] = unacked_pkt
+        # Process retransmissions of the unacked packets that have timed out
+        for unacked_pkt in self.unacked.expired(tick):
+            if self.verbose:
+                print("@ " + str(tick) + " timeout for unacked_pkt " + str(unacked_pkt.seq_num) + " timeout duration was " + str(unacked_pkt.timeout_duration))
+            # TODO: Retransmit any packet that has timed out
+            # New packet
+            retx_pkt = Packet.alloc(tick, unacked_pkt.seq_num)
+            # Incrementing num_retx 
+            retx_pkt.num_retx = unacked_pkt.num_retx+1
+            # Add packet to the list
+            packets.append(retx_pkt)
+            # Back off timer
+            self.timeout_calculator.exp_backoff()
+            # Update timeout_tick and timeout_duration
+            retx_pkt.timeout_duration = self.timeout_calculator.timeout
+            retx_pkt.timeout_tick = retx_pkt.timeout_duration+tick
+            if self.verbose:
+                print( "retx packet @ " + str(tick) + " with sequence number " + str(retx_pkt.seq_num))
+            if self.verbose:
+                print("@ " + str(tick) + " exp backoff for packet " + str(unacked_pkt.seq_num))
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.BACKOFF, retx_pkt.seq_num, self.timeout_calculator.timeout)
+                self.tracer.emit(tick, tracer.RETX, retx_pkt.seq_num, retx_pkt.timeout_duration)
+            # The original packet stays in self.unacked with its old timeout_tick,
+            # so it is due again on the next tick until it is acked
+            self.unacked.schedule(unacked_pkt)
 
         assert len(self.unacked) <= self.window
 
         # Fill window with new packets
         while len(self.unacked) < self.window:
             # TODO: Create new packets, set their retransmission timeout, and add them to the list
-            pkt = Packet(tick, self.max_seq+1)
+            pkt = Packet.alloc(tick, self.max_seq+1)
             pkt.timeout_duration = self.timeout_calculator.timeout
             pkt.timeout_tick = pkt.timeout_duration+tick
             packets.append(pkt)
             # TODO: Remember to update self.max_seq and add the just sent packet to self.unacked
             self.max_seq += 1
-            self.unacked.append(pkt)
+            self.unacked.add(pkt)
             if self.verbose:
                 print("sent packet @ " + str(tick) + " with sequence number " + str(pkt.seq_num))
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.SEND, pkt.seq_num, pkt.timeout_duration)
         assert len(self.unacked) == self.window
 
         # TODO: return the list of packets that need to be transmitted on to the network
@@ -91,15 +101,63 @@ class SlidingWindowHost:
         # TODO: Update timeout
         self.timeout_calculator.update_timeout(rtt_sample)
         # TODO: Remove received packet from self.unacked
-        for i in range(len(self.unacked)):
-            if self.unacked[i].seq_num == pkt.seq_num:
-                self.unacked.pop(i)
-                break
+        self.unacked.ack(pkt.seq_num)
         # TODO: Update in_order_rx_seq to reflect the largest sequence number that you have received in order so far
-        self.in_order_rx_seq = self.max_seq
-        for i in self.unacked:
-            if i.seq_num < self.in_order_rx_seq:
-                self.in_order_rx_seq = i.seq_num-1
+        # (as with the original scan, the newest packet being unacked on its own doesn't hold it back)
+        if self.unacked.base < self.max_seq:
+            self.in_order_rx_seq = self.unacked.base-1
+        else:
+            self.in_order_rx_seq = self.max_seq
         assert len(self.unacked) <= self.window
         if self.verbose:
             print("rx packet @ " + str(tick) + " with sequence number " + str(pkt.seq_num))
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, pkt.seq_num, rtt_sample)
+        # Nothing refers to the ACK any more (acking removed it from self.unacked)
+        Packet.release(pkt)
+
+    def recv_ack(self, ack, tick):
+        """
+        Function to get a cumulative ACK from a receiver.Receiver, covering any
+        number of packets at once.
+
+        Args:
+
+            **ack**: receiver.Ack received from the network
+
+            **tick**: Simulated time
+        """
+        assert tick > ack.sent_ts
+        rtt_sample = tick-ack.sent_ts
+        self.timeout_calculator.update_timeout(rtt_sample)
+        self.unacked.ack_through(ack.cumulative)
+        for start, end in ack.ranges:
+            for seq_num in range(start, end+1):
+                self.unacked.ack(seq_num)
+        if self.unacked.base < self.max_seq:
+            self.in_order_rx_seq = self.unacked.base-1
+        else:
+            self.in_order_rx_seq = self.max_seq
+        assert len(self.unacked) <= self.window
+        if self.verbose:
+            print("rx ack @ " + str(tick) + " up to sequence number " + str(ack.cumulative) + " for " + str(ack.count) + " packets")
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, ack.cumulative, rtt_sample)
+
+    def next_event_tick(self, tick):
+        """
+        Earliest tick after tick at which send() has work to do: either the window has
+        room for new packets or an unacked packet has timed out. Used by Simulator.run
+        to skip ticks on which send() would do nothing.
+
+        Args:
+
+            **tick**: Current simulated time
+
+        Returns:
+            The next tick to call send() on, or math.inf if only an ACK can wake the host
+        """
+        if len(self.unacked) < self.window:
+            return tick + 1
+        next_tick = self.unacked.next_timeout()
+        return max(tick + 1, math.ceil(next_tick)) if next_tick != math.inf else math.inf
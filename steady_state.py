@@ -0,0 +1,330 @@
+"""
+Steady-state detection and fast-forwarding of a Simulator.
+
+Loss-free runs often settle into a periodic regime (e.g. a sliding window host
+whose window fills the pipe, or a sawtooth that repeats exactly). A FastForward
+attached to a Simulator (Simulator(..., fast_forward=...) or attach_fast_forward())
+looks for such a regime while run() simulates, and jumps over whole cycles of it.
+
+Every check_every ticks, the state of the simulator is fingerprinted relative to
+the current tick and to host.in_order_rx_seq: link queue and tokens, delay box
+contents, the host's unacked packets, timers and window, and the timeout
+calculator. Ticks and sequence numbers are stored as offsets, so two states that
+differ only by a shift in time and sequence number space get the same fingerprint.
+Only hashes of fingerprints are kept (at most history of them), and fingerprints
+are only taken once a cheap summary of the state (queue lengths, window, timeout)
+has been seen before, so growing states cost little. When a hash comes
+back P ticks later, the full fingerprint is taken and compared again one cycle of
+P ticks on; if it matches, the state repeats exactly every P ticks, advancing
+in_order_rx_seq by the same amount every cycle. The simulator then jumps ahead
+by as many whole cycles as fit before until, by shifting every tick and sequence
+number in its state, and simulates the rest normally.
+
+Jumps give exactly the results of simulating every cycle, because:
+
+    - they are only made when the link's loss model is deterministic (no losses),
+      so the future only depends on the state,
+    - the state shifted by whole cycles behaves as the state the simulation would
+      reach: the float deadlines tick + timeout (timeout_tick) and tick + mean_rtt
+      (AIMD's next_decrease) only matter through the first tick at or after them,
+      which is what the fingerprint holds, and
+    - every such deadline in the state, and every timeout added to a tick during the
+      cycle that was compared, is checked to be an integer or far enough from one
+      that adding any tick up to the end of the run can't round it across an
+      integer. Since all cycles are the same, neither the shift nor the ticks
+      simulated after it can then round a deadline differently.
+
+Cycles that are skipped emit no events, so no jumps are made while a tracer or
+metrics are attached.
+
+    python simulator.py --seed 1 --host_type slidingwindow --window_size 20 --rtt_min 10 --ticks 100000000 --fast_forward 1
+"""
+
+import math
+import tracer
+from aimd_host import AimdHost
+from sliding_window_host import SlidingWindowHost
+from stop_and_wait_host import StopAndWaitHost
+
+
+def packet_state(pkt, tick, seq):
+    return (pkt.sent_ts - tick, pkt.seq_num - seq, pkt.size, pkt.flow_id, pkt.dst,
+            pkt.num_retx, pkt.timeout_duration, math.ceil(pkt.timeout_tick) - tick)
+
+
+def rounds_safely(value, unit):
+    # Adding an integer to value, with a result below the horizon unit was computed
+    # for, rounds by at most unit / 2, so it can't move the value across an integer
+    fraction = value - math.floor(value)
+    return fraction == 0 or unit <= fraction <= 1 - unit
+
+
+class TimeoutCheck:
+    """
+    Stands in for the host's tracer while a cycle is being confirmed, checking that
+    every timeout the host adds to a tick rounds safely
+    """
+
+    def __init__(self, host, unit):
+        self.host = host
+        self.unit = unit
+        self.safe = True
+
+    def emit(self, tick, kind, seq_num=-1, value=0.0):
+        if kind == tracer.SEND or kind == tracer.RETX:
+            if not rounds_safely(value, self.unit):
+                self.safe = False
+            # AIMD sets next_decrease to tick + mean_rtt on every retransmission
+            if kind == tracer.RETX and isinstance(self.host, AimdHost):
+                if not rounds_safely(self.host.timeout_calculator.mean_rtt, self.unit):
+                    self.safe = False
+
+
+def wheel_timers(wheel):
+    # (key, tick or None if already due, value) of every pending timer of a TimerWheel
+    timers = []
+    for key, location in wheel.where.items():
+        if location is None:
+            timers.append((key, None, wheel.due[key]))
+        else:
+            level, index = location
+            timer_tick, value = wheel.slots[level][index][key]
+            timers.append((key, timer_tick, value))
+    timers.sort(key=lambda timer: timer[0])
+    return timers
+
+
+def unacked_state(unacked, tick, seq):
+    packets = []
+    for seq_num in range(unacked.base, unacked.next_seq):
+        pkt = unacked.ring[seq_num & unacked.mask]
+        packets.append(None if pkt is None else packet_state(pkt, tick, seq))
+    timers = tuple((key - seq, None if timer_tick is None else timer_tick - tick, value is unacked.get(key))
+                   for key, timer_tick, value in wheel_timers(unacked.timeouts))
+    return (unacked.base - seq, unacked.next_seq - seq, tuple(packets), timers, unacked.timeouts.now - tick)
+
+
+def host_state(host, tick, seq):
+    calculator = host.timeout_calculator
+    state = (type(host).__name__, calculator.mean_rtt, calculator.rtt_var, calculator.timeout, calculator.ewma_init)
+    if isinstance(host, StopAndWaitHost):
+        return state + (host.ready_to_send, host.packet_sent_time - tick)
+    state += (host.window, host.max_seq - seq, unacked_state(host.unacked, tick, seq))
+    if isinstance(host, AimdHost):
+        state += (host.slow_start, math.ceil(host.next_decrease) - tick)
+    return state
+
+
+def fingerprint(simulator, tick):
+    """
+    Returns the state of simulator before tick, with ticks relative to tick and
+    sequence numbers relative to host.in_order_rx_seq
+    """
+    seq = simulator.host.in_order_rx_seq
+    link = simulator.link
+    link_state = (link.tokens, link.idle, None if link.idle else link.last_tick - tick, link.queue_bytes,
+                  tuple(packet_state(pkt, tick, seq) for pkt in link.link_queue))
+    pdbox = simulator.pdbox
+    pdbox_state = (tuple(packet_state(pkt, tick, seq) + (pkt.pdbox_time - tick,) for pkt in pdbox.prop_delay_queue),
+                   tuple(sorted((deadline - tick, count) + packet_state(pkt, tick, seq)
+                                for deadline, count, pkt in pdbox.deadline_heap)))
+    return (host_state(simulator.host, tick, seq), link_state, pdbox_state)
+
+
+def packets(simulator):
+    # Every packet the simulator holds, once each
+    found = {}
+    host = simulator.host
+    if hasattr(host, "unacked"):
+        for pkt in host.unacked:
+            found[id(pkt)] = pkt
+        for _, _, pkt in wheel_timers(host.unacked.timeouts):
+            found[id(pkt)] = pkt
+    for pkt in simulator.link.link_queue:
+        found[id(pkt)] = pkt
+    for pkt in simulator.pdbox.prop_delay_queue:
+        found[id(pkt)] = pkt
+    for _, _, pkt in simulator.pdbox.deadline_heap:
+        found[id(pkt)] = pkt
+    return found.values()
+
+
+def shift_unacked(unacked, ticks, seqs):
+    timers = wheel_timers(unacked.timeouts)
+    ring = [None] * len(unacked.ring)
+    for seq_num in range(unacked.base, unacked.next_seq):
+        ring[(seq_num + seqs) & unacked.mask] = unacked.ring[seq_num & unacked.mask]
+    unacked.ring = ring
+    unacked.base += seqs
+    unacked.next_seq += seqs
+    # The wheel's slots depend on where its timers fall, so it is rebuilt around the shifted ones
+    wheel = unacked.timeouts
+    levels = len(wheel.slots)
+    wheel.now += ticks
+    wheel.slots = []
+    wheel.bitmaps = []
+    wheel.where = {}
+    wheel.due = {}
+    for _ in range(0, levels):
+        wheel.add_level()
+    for key, timer_tick, value in timers:
+        if timer_tick is None:
+            wheel.due[key + seqs] = value
+            wheel.where[key + seqs] = None
+        else:
+            wheel.insert(key + seqs, timer_tick + ticks, value)
+
+
+def shift(simulator, ticks, seqs):
+    """
+    Moves the whole state of simulator ticks ticks and seqs sequence numbers ahead
+    """
+    for pkt in packets(simulator):
+        pkt.sent_ts += ticks
+        pkt.seq_num += seqs
+        pkt.timeout_tick += ticks
+        pkt.pdbox_time += ticks
+    host = simulator.host
+    host.in_order_rx_seq += seqs
+    if isinstance(host, StopAndWaitHost):
+        host.packet_sent_time += ticks
+    else:
+        host.max_seq += seqs
+        shift_unacked(host.unacked, ticks, seqs)
+        if isinstance(host, AimdHost):
+            host.next_decrease += ticks
+    link = simulator.link
+    if not link.idle:
+        link.last_tick += ticks
+    pdbox = simulator.pdbox
+    pdbox.deadline_heap = [(deadline + ticks, count, pkt) for deadline, count, pkt in pdbox.deadline_heap]
+
+
+class FastForward:
+    """
+    Detects periodic states of a Simulator and jumps over whole cycles of them.
+    Data members of this class are
+
+    **check_every**: Ticks between fingerprints. Cycles are found at multiples of it
+
+    **history**: Maximum number of fingerprint hashes kept
+
+    **jumps**, **cycles**, **skipped_ticks**: Number of jumps made, cycles and ticks they skipped
+
+    **period**, **seqs_per_cycle**: Length and sequence number advance of the last cycle found
+    """
+
+    def __init__(self, check_every=1, history=1 << 16):
+        if check_every < 1:
+            raise ValueError("check_every must be at least 1")
+        self.check_every = check_every
+        self.history = history
+        # Summaries and fingerprint hashes seen, and (tick, seq, fingerprint, period,
+        # seqs) of the cycle being confirmed, or None
+        self.reset()
+        self.jumps = 0
+        self.cycles = 0
+        self.skipped_ticks = 0
+        self.period = None
+        self.seqs_per_cycle = None
+
+    @staticmethod
+    def applies(simulator):
+        # Jumps are only exact for deterministic runs of the hosts we know how to shift,
+        # and would hide the events of the skipped cycles from a tracer or metrics. A capacity
+        # trace makes the state depend on the absolute tick, which fingerprints leave out, and
+        # so would the ACKs a receiver holds back.
+        return (simulator.link.loss_model.deterministic() and simulator.link.capacity_trace is None
+                and simulator.receiver is None
+                and simulator.tracer is None and simulator.metrics is None
+                and isinstance(simulator.host, (StopAndWaitHost, SlidingWindowHost, AimdHost)))
+
+    def reset(self):
+        self.summaries = set()
+        self.hashes = {}
+        self.pending = None
+        self.timeout_check = None
+
+    def check(self, simulator, check_tick, tick_val, until, unit):
+        """
+        Checks the state at check_tick (nothing has happened since then, up to tick_val),
+        and returns the number of cycles to jump ahead
+        """
+        seq = simulator.host.in_order_rx_seq
+        if self.pending is not None:
+            start, start_seq, state, period, seqs = self.pending
+            confirm_tick = start + period
+            if confirm_tick <= tick_val:
+                safe = self.timeout_check.safe
+                self.pending = None
+                self.timeout_check = None
+                simulator.host.tracer = None
+                # Exact repetition over one whole cycle, without deadlines that could round differently later on
+                if (safe and seq - start_seq == seqs and fingerprint(simulator, confirm_tick) == state
+                        and all(rounds_safely(pkt.timeout_tick, unit) for pkt in packets(simulator))
+                        and rounds_safely(getattr(simulator.host, "next_decrease", 0), unit)):
+                    self.period = period
+                    self.seqs_per_cycle = seqs
+                    return (until - confirm_tick) // period
+            else:
+                return 0
+        # A full fingerprint costs as much as the state is large, so it is only taken
+        # once a summary of the state that costs O(1) has been seen before
+        host = simulator.host
+        summary = (len(host.unacked) if hasattr(host, "unacked") else host.ready_to_send, getattr(host, "window", None),
+                   host.timeout_calculator.timeout, len(simulator.link.link_queue), len(simulator.pdbox), simulator.link.tokens)
+        if summary not in self.summaries:
+            if len(self.summaries) >= self.history:
+                self.summaries = set()
+            self.summaries.add(summary)
+            return 0
+        state = fingerprint(simulator, check_tick)
+        key = hash(state)
+        if key in self.hashes:
+            earlier, earlier_seq = self.hashes[key]
+            self.pending = (check_tick, seq, state, check_tick - earlier, seq - earlier_seq)
+            self.hashes = {}
+            # Watch the timeouts the host uses during the cycle being confirmed
+            self.timeout_check = TimeoutCheck(host, unit)
+            host.tracer = self.timeout_check
+        else:
+            if len(self.hashes) >= self.history:
+                self.hashes = {}
+            self.hashes[key] = (check_tick, seq)
+        return 0
+
+    def run(self, simulator, until):
+        # Run simulation from simulator.now up to (but not including) tick until, like
+        # Simulator.run, jumping over cycles once the state repeats
+        # Deadlines are at most max_timeout past a tick before until
+        horizon = until + simulator.host.timeout_calculator.max_timeout + 1
+        unit = math.ulp(float(horizon))
+        check_every = self.check_every
+        next_check = -(-simulator.now // check_every) * check_every
+        tick_val = simulator.now
+        while tick_val < until:
+            if tick_val >= next_check:
+                cycles = self.check(simulator, next_check, tick_val, until, unit)
+                if cycles > 0:
+                    ticks = cycles * self.period
+                    shift(simulator, ticks, cycles * self.seqs_per_cycle)
+                    tick_val += ticks
+                    self.jumps += 1
+                    self.cycles += cycles
+                    self.skipped_ticks += ticks
+                    self.reset()
+                    next_check = (tick_val // check_every + 1) * check_every
+                    continue
+                next_check = (tick_val // check_every + 1) * check_every
+            simulator.tick(tick_val)
+            next_tick = simulator.next_event_tick(tick_val)
+            if next_tick == math.inf:
+                break
+            tick_val = next_tick
+        simulator.now = until
+        # A cycle still being confirmed is given up, so the host's tracer is left as it was
+        # (the horizon of the next run may differ anyway)
+        if self.pending is not None:
+            simulator.host.tracer = None
+            self.pending = None
+            self.timeout_check = None
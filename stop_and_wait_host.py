@@ -1,3 +1,5 @@
+import math
+import tracer
 from packet import Packet
 from timeout_calculator import TimeoutCalculator
 
@@ -5,7 +7,8 @@ from timeout_calculator import TimeoutCalculator
 class StopAndWaitHost:
     """
     This host implements the stop and wait protocol. Here the host only
-    sends one packet in return of an acknowledgement.
+    sends one packet in return of an acknowledgement. Events are recorded
+    to tracer (a tracer.Tracer) if it is set.
     """
 
     def __init__(self, verbose=True, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
@@ -15,6 +18,7 @@ class StopAndWaitHost:
         # set TimeoutCalculator
         self.timeout_calculator = TimeoutCalculator(verbose=verbose, min_timeout=min_timeout, max_timeout=max_timeout)
         self.verbose = verbose
+        self.tracer = None
 
     def send(self, tick):
         """
@@ -22,18 +26,20 @@ class StopAndWaitHost:
         """
         if self.ready_to_send:
             # TODO: Send next sequence number by creating a packet
-            pkt = Packet(tick, self.in_order_rx_seq+1)
+            pkt = Packet.alloc(tick, self.in_order_rx_seq+1)
             # TODO: Remember to update packet_sent_time and ready_to_send appropriately
             self.packet_sent_time = tick
             self.ready_to_send = False
             # TODO: Return the packet
             if self.verbose:
                 print("sent packet @ " + str(tick) + " with sequence number " + str(pkt.seq_num))
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.SEND, pkt.seq_num, self.timeout_calculator.timeout)
             return pkt
         elif tick - self.packet_sent_time >= self.timeout_calculator.timeout:
             pass
             # TODO: Timeout has been exceeded, retransmit packet
-            pkt = Packet(tick, self.in_order_rx_seq+1)
+            pkt = Packet.alloc(tick, self.in_order_rx_seq+1)
             self.packet_sent_time = tick
             # TODO: Exponentially back off the timer
             self.timeout_calculator.exp_backoff()
@@ -42,6 +48,9 @@ class StopAndWaitHost:
             # TODO: Return the packet
             if self.verbose:
                 print("retx packet @ " + str(tick) + " with sequence number " + str(pkt.seq_num))
+            if self.tracer is not None:
+                self.tracer.emit(tick, tracer.BACKOFF, pkt.seq_num, self.timeout_calculator.timeout)
+                self.tracer.emit(tick, tracer.RETX, pkt.seq_num, self.timeout_calculator.timeout)
             return pkt
 
     def recv(self, pkt, tick):
@@ -70,3 +79,43 @@ class StopAndWaitHost:
         if self.ready_to_send:
             if self.verbose:
                 print("rx packet @ " + str(tick) + " with sequence number " + str(pkt.seq_num))
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, pkt.seq_num, rtt_sample)
+        Packet.release(pkt)
+
+    def recv_ack(self, ack, tick):
+        """
+        Function to get a cumulative ACK from a receiver.Receiver.
+
+        Args:
+
+            **ack**: receiver.Ack received from the network
+
+            **tick**: Simulated time
+        """
+        assert tick > ack.sent_ts
+        rtt_sample = tick-ack.sent_ts
+        self.timeout_calculator.update_timeout(rtt_sample)
+        if ack.cumulative > self.in_order_rx_seq:
+            self.ready_to_send = True
+            self.in_order_rx_seq = ack.cumulative
+            if self.verbose:
+                print("rx ack @ " + str(tick) + " up to sequence number " + str(ack.cumulative))
+        if self.tracer is not None:
+            self.tracer.emit(tick, tracer.ACK, ack.cumulative, rtt_sample)
+
+    def next_event_tick(self, tick):
+        """
+        Earliest tick after tick at which send() has work to do: either the host is
+        ready to send the next sequence number or the outstanding packet has timed out.
+
+        Args:
+
+            **tick**: Simulated time
+
+        Returns:
+            The next tick to call send() on
+        """
+        if self.ready_to_send:
+            return tick + 1
+        return max(tick + 1, math.ceil(self.packet_sent_time + self.timeout_calculator.timeout))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Parameter sweeps over the simulator, run in parallel.
+
+A sweep is a list of configurations, each a dict with the keys of DEFAULTS.
+grid() builds the cross product of lists of values (host type x window size x
+rtt_min x loss_ratio x queue_limit x seed). sweep() fans the configurations out
+over a ProcessPoolExecutor in chunks and yields a result dict for every run as
+soon as its chunk finishes. A run that raises or takes longer than timeout
+seconds is retried, and after the last retry its result carries an "error"
+instead of "in_order_rx_seq".
+
+Every run builds its own Simulator, which draws losses from its own
+random.Random(seed), so results don't depend on which worker ran what or in which
+order.
+"""
+
+import argparse
+import itertools
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from simulator import Simulator, make_host, check_host_type
+from timeout_calculator import TimeoutCalculator
+
+DEFAULTS = {
+    "host_type": "slidingwindow",
+    "window_size": None,
+    "rtt_min": 10,
+    "loss_ratio": 0.0,
+    "queue_limit": 1000000,
+    "seed": 1,
+    "ticks": 10000,
+    "min_timeout": TimeoutCalculator.MIN_TIMEOUT,
+    "max_timeout": TimeoutCalculator.MAX_TIMEOUT,
+}
+
+
+def grid(**values):
+    """
+    Returns the configurations for every combination of the given values. Each
+    keyword is a key of DEFAULTS and takes a list of values (or a single value).
+    Window sizes are only combined with sliding window hosts.
+    """
+    for key in values:
+        if key not in DEFAULTS:
+            raise ValueError("Unknown sweep parameter " + key)
+    keys = list(DEFAULTS)
+    axes = []
+    for key in keys:
+        value = values.get(key, DEFAULTS[key])
+        axes.append(value if isinstance(value, (list, tuple, range)) else [value])
+    configs = []
+    for combination in itertools.product(*axes):
+        config = dict(zip(keys, combination))
+        if config["host_type"] != "slidingwindow":
+            if config["window_size"] != axes[keys.index("window_size")][0]:
+                continue
+            config["window_size"] = None
+        configs.append(config)
+    return configs
+
+
+def run_config(config):
+    # Run one simulation and return the largest in order received sequence number
+    host = make_host(config["host_type"], config["window_size"], verbose=False,
+                     min_timeout=config["min_timeout"], max_timeout=config["max_timeout"])
+    simulator = Simulator(host, config["loss_ratio"], config["queue_limit"], config["rtt_min"], config["seed"], verbose=False)
+    simulator.run(config["ticks"])
+    return simulator.host.in_order_rx_seq
+
+
+class RunTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise RunTimeout()
+
+
+def init_worker():
+    # Workers don't print, and a SIGALRM interrupts a run that is over its time limit
+    sys.stdout = open(os.devnull, "w")
+    signal.signal(signal.SIGALRM, raise_timeout)
+
+
+def run_chunk(configs, timeout):
+    results = []
+    for config in configs:
+        result = dict(config)
+        try:
+            if timeout is not None:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                result["in_order_rx_seq"] = run_config(config)
+            finally:
+                if timeout is not None:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except RunTimeout:
+            result["error"] = "timed out after %s seconds" % timeout
+        except Exception as e:
+            result["error"] = repr(e)
+        results.append(result)
+    return results
+
+
+def sweep(configs, workers=None, chunksize=1, timeout=None, retries=1):
+    """
+    Runs every configuration and yields its result dict as soon as it is available.
+    Results come back in completion order, not in the order of configs.
+
+    Args:
+
+        **configs**: List of configuration dicts (see grid())
+
+        **workers**: Number of worker processes, defaults to the number of CPUs
+
+        **chunksize**: Number of runs sent to a worker at a time
+
+        **timeout**: Seconds after which a run is abandoned (needs SIGALRM), or None
+
+        **retries**: Number of times a failed or timed out run is run again
+    """
+    if timeout is not None and not hasattr(signal, "setitimer"):
+        raise ValueError("timeout is not supported on this platform")
+    attempts = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        pending = set()
+        for i in range(0, len(configs), chunksize):
+            pending.add(executor.submit(run_chunk, configs[i:i + chunksize], timeout))
+        while pending:
+            future = next(as_completed(pending))
+            pending.remove(future)
+            for result in future.result():
+                if "error" in result:
+                    key = tuple(sorted((k, v) for k, v in result.items() if k != "error"))
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] <= retries:
+                        config = {k: result[k] for k in DEFAULTS}
+                        pending.add(executor.submit(run_chunk, [config], timeout))
+                        continue
+                yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a grid of simulations in parallel and print one line per run")
+    parser.add_argument("--host_type", type=check_host_type, nargs="+", default=[DEFAULTS["host_type"]])
+    parser.add_argument("--window_size", type=int, nargs="+", default=[DEFAULTS["window_size"]])
+    parser.add_argument("--rtt_min", type=int, nargs="+", default=[DEFAULTS["rtt_min"]])
+    parser.add_argument("--loss_ratio", type=float, nargs="+", default=[DEFAULTS["loss_ratio"]])
+    parser.add_argument("--queue_limit", type=int, nargs="+", default=[DEFAULTS["queue_limit"]])
+    parser.add_argument("--seed", type=int, nargs="+", default=[DEFAULTS["seed"]])
+    parser.add_argument("--ticks", type=int, default=DEFAULTS["ticks"])
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--chunksize", type=int, default=1, help="number of runs sent to a worker at a time")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds after which a run is abandoned")
+    parser.add_argument("--retries", type=int, default=1, help="number of times a failed run is retried")
+    args = parser.parse_args()
+
+    configs = grid(host_type=args.host_type, window_size=args.window_size, rtt_min=args.rtt_min,
+                   loss_ratio=args.loss_ratio, queue_limit=args.queue_limit, seed=args.seed, ticks=args.ticks)
+    keys = ["host_type", "window_size", "rtt_min", "loss_ratio", "queue_limit", "seed"]
+    print(",".join(keys + ["in_order_rx_seq", "error"]))
+    for result in sweep(configs, workers=args.workers, chunksize=args.chunksize, timeout=args.timeout, retries=args.retries):
+        print(",".join(str(result[key]) for key in keys) + "," + str(result.get("in_order_rx_seq", "")) + "," + result.get("error", ""))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+The list-based window hosts as they were before UnackedWindow: the unacked packets
+are a list that send() scans for timeouts and recv() scans to remove the ACKed
+packet and recompute in_order_rx_seq. The tests run them next to the current hosts,
+which must behave exactly alike.
+"""
+
+from packet import Packet
+from timeout_calculator import TimeoutCalculator
+
+
+class ListSlidingWindowHost:
+    def __init__(self, window_size, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+        self.unacked = []
+        self.window = window_size
+        self.max_seq = -1
+        self.in_order_rx_seq = -1
+        self.timeout_calculator = TimeoutCalculator(verbose=False, min_timeout=min_timeout, max_timeout=max_timeout)
+
+    def send(self, tick):
+        packets = []
+        for unacked_pkt in self.unacked:
+            if tick >= unacked_pkt.timeout_tick:
+                retx_pkt = Packet(tick, unacked_pkt.seq_num)
+                retx_pkt.num_retx = unacked_pkt.num_retx+1
+                packets.append(retx_pkt)
+                self.timeout_calculator.exp_backoff()
+                retx_pkt.timeout_duration = self.timeout_calculator.timeout
+                retx_pkt.timeout_tick = retx_pkt.timeout_duration+tick
+        while len(self.unacked) < self.window:
+            pkt = Packet(tick, self.max_seq+1)
+            pkt.timeout_duration = self.timeout_calculator.timeout
+            pkt.timeout_tick = pkt.timeout_duration+tick
+            packets.append(pkt)
+            self.max_seq += 1
+            self.unacked.append(pkt)
+        return packets
+
+    def recv(self, pkt, tick):
+        self.timeout_calculator.update_timeout(tick-pkt.sent_ts)
+        for i in range(len(self.unacked)):
+            if self.unacked[i].seq_num == pkt.seq_num:
+                self.unacked.pop(i)
+                break
+        self.in_order_rx_seq = self.max_seq
+        for unacked_pkt in self.unacked:
+            if unacked_pkt.seq_num < self.in_order_rx_seq:
+                self.in_order_rx_seq = unacked_pkt.seq_num-1
+
+
+class ListAimdHost:
+    def __init__(self, min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+        self.unacked = []
+        self.window = 1
+        self.max_seq = -1
+        self.in_order_rx_seq = -1
+        self.slow_start = True
+        self.next_decrease = -1
+        self.timeout_calculator = TimeoutCalculator(verbose=False, min_timeout=min_timeout, max_timeout=max_timeout)
+
+    def send(self, tick):
+        packets = []
+        for i in range(0, len(self.unacked)):
+            unacked_pkt = self.unacked[i]
+            if tick >= unacked_pkt.timeout_tick:
+                new_packet = Packet(tick, unacked_pkt.seq_num)
+                new_packet.num_retx = unacked_pkt.num_retx+1
+                packets.append(new_packet)
+                self.timeout_calculator.exp_backoff()
+                new_packet.timeout_tick = self.timeout_calculator.timeout+tick
+                new_packet.timeout_duration = self.timeout_calculator.timeout
+                unacked_pkt = new_packet
+                if self.next_decrease <= tick:
+                    self.window *= .5
+                    if self.window < 1:
+                        self.window = 1
+                self.next_decrease = tick+self.timeout_calculator.mean_rtt
+                self.slow_start = False
+            self.unacked[i] = unacked_pkt
+        while len(self.unacked) < self.window:
+            new_packet = Packet(tick, self.max_seq+1)
+            new_packet.timeout_tick = self.timeout_calculator.timeout+tick
+            new_packet.timeout_duration = self.timeout_calculator.timeout
+            packets.append(new_packet)
+            self.max_seq += 1
+            self.unacked.append(new_packet)
+        return packets
+
+    def recv(self, pkt, tick):
+        self.timeout_calculator.update_timeout(tick-pkt.sent_ts)
+        for i in range(len(self.unacked)):
+            if self.unacked[i].seq_num == pkt.seq_num:
+                self.unacked.pop(i)
+                break
+        self.in_order_rx_seq = self.max_seq
+        for unacked_pkt in self.unacked:
+            if unacked_pkt.seq_num < self.in_order_rx_seq:
+                self.in_order_rx_seq = unacked_pkt.seq_num-1
+        if self.slow_start:
+            self.window += 1
+        else:
+            self.window += 1/self.window
@@ -0,0 +1,64 @@
+import copy
+import pytest
+from branching import apply_changes, branch_seed
+from loss_models import GILBERT_ELLIOTT, IidLoss
+from simulator import Simulator, make_host
+
+GILBERT_ELLIOTT_MODEL = {"type": GILBERT_ELLIOTT, "p": 0.01, "r": 0.3, "loss_good": 0.0, "loss_bad": 1.0}
+
+
+def warmed_up(warmup, loss_ratio=0.1, loss_model=None, seed=1):
+    simulator = Simulator(make_host("aimd", verbose=False), loss_ratio, 1000000, 10, seed, verbose=False,
+                          loss_model=loss_model)
+    simulator.run(warmup)
+    return simulator
+
+
+def branch_losses(simulator, index=0, packets=500):
+    # Loss decisions of the first packets of branch index of simulator
+    branch = copy.deepcopy(simulator)
+    apply_changes(branch, {"loss_ratio": 0.5}, branch_seed(branch, index))
+    return [branch.link.loss_model.lost() for _ in range(0, packets)]
+
+
+@pytest.mark.parametrize("loss_ratio", [0.0, 0.1])
+def test_branch_seed_depends_on_warmup(loss_ratio):
+    short = warmed_up(1000, loss_ratio)
+    long = warmed_up(3000, loss_ratio)
+    assert branch_seed(short, 0) != branch_seed(long, 0)
+    assert branch_losses(short) != branch_losses(long)
+    assert branch_seed(short, 0) == branch_seed(warmed_up(1000, loss_ratio), 0)
+    assert branch_seed(short, 0) != branch_seed(short, 1)
+
+
+def test_branch_seed_leaves_parent_untouched():
+    simulator = warmed_up(2000)
+    reference = warmed_up(2000)
+    branch_seed(simulator, 0)
+    simulator.run(4000)
+    reference.run(4000)
+    assert simulator.host.in_order_rx_seq == reference.host.in_order_rx_seq
+
+
+def test_loss_ratio_replaces_parent_loss_model():
+    simulator = warmed_up(1000, loss_model=GILBERT_ELLIOTT_MODEL)
+    apply_changes(simulator, {"loss_ratio": 0.05}, 7)
+    assert simulator.loss_model is None
+    assert isinstance(simulator.link.loss_model, IidLoss)
+    assert simulator.link.loss_model.loss_ratio == 0.05
+
+
+def test_loss_ratio_rejected_with_non_iid_loss_model():
+    simulator = warmed_up(1000)
+    with pytest.raises(ValueError):
+        apply_changes(simulator, {"loss_ratio": 0.05, "loss_model": GILBERT_ELLIOTT_MODEL}, 7)
+
+
+def test_branches_are_reproducible():
+    simulator = warmed_up(2000)
+    branches = [{"loss_ratio": 0.0}, {"loss_ratio": 0.05}, {"queue_limit": 5}]
+    first = simulator.branch(branches, 5000, workers=1)
+    second = simulator.branch(branches, 5000, workers=2)
+    assert first == second
+    assert all("result" in result for result in first)
+    assert simulator.now == 2000
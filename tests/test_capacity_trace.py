@@ -0,0 +1,88 @@
+import itertools
+import os
+import pytest
+import capacity_trace
+from capacity_trace import COUNTS, HEADER, MAHIMAHI, CapacityTrace, convert
+from simulator import Simulator, make_host
+
+TICKS = 6000
+HOSTS = [("stopandwait", None), ("slidingwindow", 1), ("slidingwindow", 8), ("slidingwindow", 60), ("aimd", None)]
+# Bursts of opportunities with stretches of up to 400 ticks without any
+COUNTS_TRACE = [2, 0, 0, 1, 3, 0, 1] * 30 + [0] * 400 + [1, 1, 0, 5] * 20 + [0] * 150 + [1]
+# About one opportunity per tick, with short gaps
+DENSE_TRACE = [1, 0, 2, 1, 0, 1, 3, 0, 0, 2] * 50
+
+
+def write_trace(tmp_path, lines, trace_format=COUNTS):
+    text_path = tmp_path / "trace.txt"
+    text_path.write_text("# a comment\n\n" + "\n".join(str(line) for line in lines) + "\n")
+    path = str(tmp_path / "trace.bin")
+    return convert(str(text_path), path, trace_format), path
+
+
+@pytest.mark.parametrize("block", [capacity_trace.BLOCK, 3])
+def test_convert_counts(tmp_path, monkeypatch, block):
+    # A small block makes convert() write the columns in several pieces
+    monkeypatch.setattr(capacity_trace, "BLOCK", block)
+    (period, total), path = write_trace(tmp_path, COUNTS_TRACE)
+    assert (period, total) == (len(COUNTS_TRACE), sum(COUNTS_TRACE))
+    trace = CapacityTrace(path)
+    ticks = [tick for tick, count in enumerate(COUNTS_TRACE) if count > 0]
+    assert (trace.period, trace.entries, trace.total) == (period, len(ticks), total)
+    assert os.path.getsize(path) == HEADER.size + 16 * len(ticks)
+    assert list(trace.ticks) == ticks
+    assert list(trace.cumulative_counts) == list(itertools.accumulate(COUNTS_TRACE[tick] for tick in ticks))
+    # Opportunities of every tick, looping over the period
+    for tick in range(0, 3 * period):
+        assert trace.opportunities(tick, tick + 1) == COUNTS_TRACE[tick % period]
+    assert trace.opportunities(5, 2 * period + 17) == sum(COUNTS_TRACE[tick % period] for tick in range(5, 2 * period + 17))
+    trace.close()
+
+
+def test_convert_mahimahi(tmp_path):
+    # Timestamps in ms: tick t is ms t + 1, and ms 0 counts at the end of the period
+    (period, total), path = write_trace(tmp_path, [0, 1, 1, 4, 7, 7, 7, 10], MAHIMAHI)
+    assert (period, total) == (10, 8)
+    trace = CapacityTrace(path)
+    assert [trace.opportunities(tick, tick + 1) for tick in range(0, 10)] == [2, 0, 0, 1, 0, 0, 3, 0, 0, 2]
+    trace.close()
+
+
+@pytest.mark.parametrize("lines,trace_format", [([0, 0, 0], COUNTS), ([3, 1], MAHIMAHI), ([1, -1], COUNTS), ([1, "x"], COUNTS)])
+def test_convert_rejects_bad_traces(tmp_path, lines, trace_format):
+    with pytest.raises(ValueError):
+        write_trace(tmp_path, lines, trace_format)
+
+
+def test_zero_capacity_stretch_is_skipped(tmp_path):
+    _, path = write_trace(tmp_path, COUNTS_TRACE)
+    trace = CapacityTrace(path)
+    start = 7 * 30
+    assert trace.opportunities(start, start + 400) == 0
+    # The opportunity after the last one before the stretch is the first one after it
+    assert trace.tick_of(trace.cumulative(start) + 1) == start + 400
+    assert trace.tick_of(trace.cumulative(len(COUNTS_TRACE)) + 1) == len(COUNTS_TRACE)
+    trace.close()
+
+
+def state(simulator):
+    host = simulator.host
+    return (host.in_order_rx_seq, host.timeout_calculator.timeout, host.timeout_calculator.mean_rtt,
+            len(simulator.link.link_queue), len(simulator.pdbox))
+
+
+@pytest.mark.parametrize("host_type,window_size", HOSTS)
+@pytest.mark.parametrize("loss_ratio,queue_limit,rtt_min", [(0.0, 1000000, 10), (0.05, 20, 10), (0.0, 5, 50)])
+@pytest.mark.parametrize("lines", [COUNTS_TRACE, DENSE_TRACE])
+def test_run_matches_tick_loop_with_trace(tmp_path, host_type, window_size, loss_ratio, queue_limit, rtt_min, lines):
+    _, path = write_trace(tmp_path, lines)
+    simulators = [Simulator(make_host(host_type, window_size, verbose=False), loss_ratio, queue_limit, rtt_min, 7,
+                            verbose=False, capacity_trace=path) for _ in range(0, 2)]
+    stepped, skipping = simulators
+    for until in range(500, TICKS + 1, 500):
+        for tick_val in range(until - 500, until):
+            stepped.tick(tick_val)
+        skipping.run(until)
+        assert state(skipping) == state(stepped)
+    for simulator in simulators:
+        simulator.link.capacity_trace.close()
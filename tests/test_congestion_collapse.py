@@ -0,0 +1,33 @@
+import pytest
+import congestion_collapse
+
+
+def test_failed_window_raises_value_error(monkeypatch):
+    def sweep(configs):
+        for config in configs:
+            result = {key: value for key, value in config.items()}
+            if config["window_size"] == 64:
+                result["error"] = "timed out after 1 seconds"
+            else:
+                result["in_order_rx_seq"] = 0
+            yield result
+
+    monkeypatch.setattr(congestion_collapse, "sweep", sweep)
+    with pytest.raises(ValueError, match="window size 64"):
+        congestion_collapse.main()
+
+
+def test_search_matches_dense_grid():
+    # With losses the peak (window 12) falls between two coarse windows
+    settings = {"rtt_min": 10, "loss_ratio": 0.01, "queue_limit": 50, "seed": 1000, "ticks": 10000}
+    searches = [congestion_collapse.find_knee_and_collapse(points=points, **settings) for points in [1, 3]]
+    dense = congestion_collapse.grid(host_type="slidingwindow", window_size=range(1, max(searches[0]["results"]) + 1),
+                                     **settings)
+    results = {config["window_size"]: congestion_collapse.run_config(config) for config in dense}
+    peak_window = max(results, key=lambda w: (results[w], -w))
+    peak = results[peak_window]
+    knee = min(w for w in results if results[w] >= 0.99 * peak)
+    collapse = min(w for w in results if w > knee and results[w] < 0.5 * peak)
+    for search in searches:
+        assert (search["peak"], search["peak_window"], search["knee"], search["collapse"]) == (peak, peak_window, knee, collapse)
+        assert search["simulations"] < len(results)
@@ -0,0 +1,45 @@
+import pytest
+import early_stopping
+from sweep import grid, run_config
+
+TICKS = 2000
+
+
+@pytest.mark.parametrize("df, p, value", [
+    (1, 0.975, 12.706), (2, 0.975, 4.303), (3, 0.975, 3.182), (5, 0.975, 2.571), (10, 0.975, 2.228), (30, 0.975, 2.042),
+    (1, 0.995, 63.657), (2, 0.995, 9.925), (3, 0.995, 5.841), (4, 0.995, 4.604), (10, 0.995, 3.169), (30, 0.995, 2.750),
+    (3, 0.95, 2.353), (10, 0.95, 1.812),
+])
+def test_t_quantile_matches_table(df, p, value):
+    assert early_stopping.t_quantile(p, df) == pytest.approx(value, rel=0.008)
+    assert early_stopping.t_quantile(1 - p, df) == pytest.approx(-value, rel=0.008)
+
+
+def test_seeds_do_not_depend_on_workers():
+    configs = grid(host_type=["slidingwindow", "aimd"], window_size=8, loss_ratio=[0.0, 0.05], ticks=TICKS)
+    runs = [early_stopping.run_experiment(configs, 0.01, relative=True, min_seeds=3, max_seeds=30, workers=workers)
+            for workers in [1, 3]]
+    assert runs[0] == runs[1]
+    for result in runs[0]:
+        if result["loss_ratio"] == 0.0:
+            # Without losses every seed gives the same run
+            assert (result["seeds"], result["stdev"], result["half_width"], result["converged"]) == (3, 0.0, 0.0, True)
+        else:
+            assert result["seeds"] > 3
+
+
+def failing_run_config(config):
+    if config["loss_ratio"] > 0 and config["seed"] == 4:
+        raise RuntimeError("failed")
+    return run_config(config)
+
+
+def test_failed_run_is_reported_per_config(monkeypatch):
+    monkeypatch.setattr(early_stopping, "run_config", failing_run_config)
+    configs = grid(window_size=8, loss_ratio=[0.0, 0.05], ticks=TICKS)
+    results = early_stopping.run_experiment(configs, 0.001, relative=True, min_seeds=3, max_seeds=30, workers=2)
+    assert "error" not in results[0]
+    assert results[0]["converged"]
+    assert results[1]["error"] == "seed 4: RuntimeError('failed')"
+    assert results[1]["seeds"] == 3
+    assert not results[1]["converged"]
@@ -0,0 +1,55 @@
+import io
+import pytest
+from metrics import Metrics, QuantileSketch
+from simulator import Simulator, make_host
+
+TICKS = 20000
+
+
+def run_summary(step_every_tick, host_type, window_size, loss_ratio):
+    simulator = Simulator(make_host(host_type, window_size, verbose=False), loss_ratio, 1000000, 10, 7, verbose=False)
+    simulator.attach_metrics(Metrics(1000, out=io.StringIO()))
+    if step_every_tick:
+        for tick_val in range(0, TICKS):
+            simulator.tick(tick_val)
+        simulator.now = TICKS
+    else:
+        simulator.run(TICKS)
+    records = simulator.metrics.out.getvalue()
+    return records, simulator.metrics.finish(simulator)
+
+
+@pytest.mark.parametrize("host_type,window_size", [("stopandwait", None), ("slidingwindow", 8), ("aimd", None)])
+@pytest.mark.parametrize("loss_ratio", [0.0, 0.2])
+def test_queue_metrics_do_not_depend_on_skipped_ticks(host_type, window_size, loss_ratio):
+    stepped_records, stepped = run_summary(True, host_type, window_size, loss_ratio)
+    skipped_records, skipped = run_summary(False, host_type, window_size, loss_ratio)
+    assert skipped == stepped
+    assert skipped_records == stepped_records
+    assert sum(skipped["queue"]["counts"]) == TICKS
+
+
+def test_quantile_sketch_keeps_at_most_max_buckets():
+    sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=64)
+    values = [1.01 ** i for i in range(0, 5000)]
+    for value in values:
+        sketch.add(value)
+    assert len(sketch.buckets) <= 64
+    assert sketch.count == len(values)
+    # The high quantiles are untouched by merging the lowest buckets
+    expected = sorted(values)[int(0.99 * (len(values) - 1))]
+    assert abs(sketch.quantile(0.99) - expected) <= 0.01 * expected
+    assert sketch.quantile(0.0) <= sketch.quantile(0.5) <= sketch.quantile(0.99)
+
+
+def test_quantile_sketch_collapses_in_batches(monkeypatch):
+    # Every value makes a new bucket: the buckets must be merged once per max_buckets // 8
+    # new ones, not on every add past the limit
+    collapses = []
+    collapse = QuantileSketch.collapse
+    monkeypatch.setattr(QuantileSketch, "collapse", lambda sketch: collapses.append(1) or collapse(sketch))
+    sketch = QuantileSketch(relative_accuracy=0.001, max_buckets=4096)
+    for i in range(0, 40000):
+        sketch.add(1.01 ** i)
+    assert len(sketch.buckets) <= 4096
+    assert len(collapses) <= (40000 - 4096) // (4096 // 8) + 1
@@ -0,0 +1,15 @@
+import itertools
+import pytest
+from monte_carlo import AIMD, SLIDING_WINDOW, LockstepSimulator, validate
+
+TICKS = 2000
+SEEDS = range(1, 5)
+HOSTS = [(SLIDING_WINDOW, 1), (SLIDING_WINDOW, 8), (SLIDING_WINDOW, 40), (AIMD, None)]
+
+
+@pytest.mark.parametrize("host_type,window_size", HOSTS)
+@pytest.mark.parametrize("loss_ratio,queue_limit,rtt_min", list(itertools.product([0.0, 0.05, 0.2], [5, 1000000], [2, 10, 60])))
+def test_lockstep_matches_scalar_simulator(host_type, window_size, loss_ratio, queue_limit, rtt_min):
+    simulator = LockstepSimulator(host_type, SEEDS, loss_ratio, queue_limit, rtt_min, window_size)
+    simulator.run(TICKS)
+    assert validate(simulator, TICKS, len(SEEDS)) == []
@@ -0,0 +1,56 @@
+import pytest
+from multi_flow import MultiFlowSimulator
+from network import Link
+from simulator import Simulator, make_host
+
+TICKS = 6000
+FLOWS = [("aimd", None), ("slidingwindow", 4), ("stopandwait", None), ("aimd", None), ("slidingwindow", 1)]
+
+
+class PolledHost:
+    """
+    A host without next_event_tick(), which MultiFlowSimulator polls on every tick
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def send(self, tick):
+        return self.host.send(tick)
+
+    def recv(self, pkt, tick):
+        self.host.recv(pkt, tick)
+
+
+def make_hosts():
+    return [make_host(host_type, window_size, verbose=False) for host_type, window_size in FLOWS]
+
+
+def host_states(hosts):
+    return [(host.in_order_rx_seq, host.timeout_calculator.timeout, getattr(host, "window", None)) for host in hosts]
+
+
+@pytest.mark.parametrize("host_type,window_size", FLOWS[:3])
+@pytest.mark.parametrize("loss_ratio,queue_limit", [(0.0, 1000000), (0.05, 5)])
+def test_single_flow_matches_simulator(host_type, window_size, loss_ratio, queue_limit):
+    host = make_host(host_type, window_size, verbose=False)
+    simulator = Simulator(host, loss_ratio, queue_limit, 10, 7, verbose=False)
+    simulator.run(TICKS)
+    flow = make_host(host_type, window_size, verbose=False)
+    multi_flow = MultiFlowSimulator([flow], loss_ratio, queue_limit, 10, 7, verbose=False)
+    multi_flow.run(TICKS)
+    assert host_states([flow]) == host_states([host])
+
+
+@pytest.mark.parametrize("scheduler", [Link.FIFO, Link.ROUND_ROBIN, Link.DRR])
+@pytest.mark.parametrize("loss_ratio,queue_limit", [(0.0, 1000000), (0.05, 20)])
+def test_wakeups_match_polling_every_host(scheduler, loss_ratio, queue_limit):
+    hosts = make_hosts()
+    woken = MultiFlowSimulator(hosts, loss_ratio, queue_limit, 10, 7, verbose=False, scheduler=scheduler)
+    woken.run(TICKS)
+    polled_hosts = make_hosts()
+    polled = MultiFlowSimulator([PolledHost(host) for host in polled_hosts], loss_ratio, queue_limit, 10, 7,
+                                verbose=False, scheduler=scheduler)
+    for tick_val in range(0, TICKS):
+        polled.tick(tick_val)
+    assert host_states(hosts) == host_states(polled_hosts)
@@ -0,0 +1,38 @@
+import random
+from network import Link
+from packet import Packet
+
+
+class Collector:
+    """
+    Stands in for the delay box and keeps the sequence numbers the link delivers
+    """
+
+    def __init__(self):
+        self.delivered = []
+
+    def recv(self, pkt, tick):
+        self.delivered.append(pkt.seq_num)
+
+
+def deliver(link, packets=2000):
+    collector = Collector()
+    for seq_num in range(0, packets):
+        link.recv(Packet(seq_num, seq_num), seq_num)
+        link.tick(seq_num, collector)
+    return collector.delivered
+
+
+def test_link_without_rng_uses_its_own_fixed_seed():
+    random.seed(5)
+    state = random.getstate()
+    delivered = deliver(Link(0.2, 1000000, False))
+    # The global random module is left alone
+    assert random.getstate() == state
+    assert 0 < len(delivered) < 2000
+    assert deliver(Link(0.2, 1000000, False)) == delivered
+    assert deliver(Link(0.2, 1000000, False, rng=random.Random(Link.DEFAULT_SEED))) == delivered
+
+
+def test_link_rng_decides_losses():
+    assert deliver(Link(0.2, 1000000, False, rng=random.Random(1))) != deliver(Link(0.2, 1000000, False, rng=random.Random(2)))
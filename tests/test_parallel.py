@@ -0,0 +1,54 @@
+import pytest
+from parallel import ParallelTopologySimulator
+from topology import Topology, TopologySimulator
+
+TICKS = 5000
+# Two senders on either side of a lossy, bursty bottleneck, with routed and direct ACKs
+SPEC = {
+    "links": [
+        {"src": "a", "dst": "r1", "delay": 3, "bidirectional": True},
+        {"src": "b", "dst": "r1", "delay": 2, "bidirectional": True},
+        {"src": "r1", "dst": "r2", "delay": 8, "queue_limit": 30, "rate": 0.75, "loss_ratio": 0.01, "bidirectional": True},
+        {"src": "r2", "dst": "c", "delay": 4, "loss_model": {"type": "gilbert_elliott", "p": 0.01, "r": 0.3},
+         "bidirectional": True},
+        {"src": "r2", "dst": "d", "delay": 5, "bidirectional": True},
+    ],
+    "flows": [
+        {"host_type": "aimd", "src": "a", "dst": "c"},
+        {"host_type": "slidingwindow", "window_size": 6, "src": "b", "dst": "d"},
+        {"host_type": "stopandwait", "src": "c", "dst": "a"},
+        {"host_type": "slidingwindow", "window_size": 3, "src": "r2", "dst": "d", "ack": "direct"},
+    ],
+}
+# Fewer nodes than workers
+SMALL_SPEC = {
+    "links": [{"src": "a", "dst": "b", "delay": 6, "loss_ratio": 0.02, "bidirectional": True}],
+    "flows": [{"host_type": "aimd", "src": "a", "dst": "b"}, {"host_type": "slidingwindow", "window_size": 4, "src": "b", "dst": "a"}],
+}
+
+
+def single_process(spec, seed):
+    simulator = TopologySimulator(Topology.from_dict(spec), seed, verbose=False)
+    simulator.run(TICKS)
+    return simulator.in_order_rx_seqs()
+
+
+def multi_process(spec, seed, workers):
+    simulator = ParallelTopologySimulator(Topology.from_dict(spec), seed, workers)
+    try:
+        # In two pieces, so that resuming between runs is covered too
+        simulator.run(TICKS // 3)
+        simulator.run(TICKS)
+        return simulator.in_order_rx_seqs()
+    finally:
+        simulator.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_parallel_matches_single_process(workers, seed):
+    assert multi_process(SPEC, seed, workers) == single_process(SPEC, seed)
+
+
+def test_more_workers_than_nodes():
+    assert multi_process(SMALL_SPEC, 1, 4) == single_process(SMALL_SPEC, 1)
@@ -0,0 +1,35 @@
+from profiler import Profiler
+from simulator import Simulator, make_host
+
+
+def make_simulator():
+    # A stop and wait host on a long path is idle most of the time, so run() skips most ticks
+    return Simulator(make_host("stopandwait", verbose=False), 0.0, 1000000, 200, 1, verbose=False)
+
+
+def test_summary_counts_simulated_and_visited_ticks():
+    simulator = make_simulator()
+    simulator.run(1000)
+    profiler = Profiler(sample_every=2)
+    simulator.attach_profiler(profiler)
+    simulator.run(6000)
+    profiler.stop(simulator)
+    summary = profiler.summary()
+    assert summary["ticks"] == 5000
+    assert 0 < summary["visited_ticks"] < 100
+    assert summary["sampled_ticks"] == summary["visited_ticks"] // 2
+    assert profiler.report().startswith("5000 ticks simulated, %d visited" % summary["visited_ticks"])
+    # Profiling doesn't change the results
+    plain = make_simulator()
+    plain.run(6000)
+    assert simulator.host.in_order_rx_seq == plain.host.in_order_rx_seq
+
+
+def test_summary_before_stop_counts_up_to_last_visited_tick():
+    simulator = make_simulator()
+    profiler = Profiler(sample_every=1)
+    simulator.attach_profiler(profiler)
+    for tick_val in range(0, 300):
+        simulator.tick(tick_val)
+    summary = profiler.summary()
+    assert summary["ticks"] == summary["visited_ticks"] == summary["sampled_ticks"] == 300
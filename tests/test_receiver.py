@@ -0,0 +1,91 @@
+import itertools
+import pytest
+from packet import Packet
+from receiver import Receiver
+from simulator import Simulator, make_host
+
+HOSTS = [("stopandwait", None), ("slidingwindow", 1), ("slidingwindow", 8), ("slidingwindow", 100), ("aimd", None)]
+
+
+def run_receiver(receiver, host_type="slidingwindow", window_size=20, loss_ratio=0.0, queue_limit=1000000, seed=1,
+                 ticks=2000, rtt_min=10, link_rate=1):
+    simulator = Simulator(make_host(host_type, window_size, verbose=False), loss_ratio, queue_limit, rtt_min, seed,
+                          verbose=False, link_rate=link_rate, receiver=receiver)
+    simulator.run(ticks)
+    return simulator
+
+
+@pytest.mark.parametrize("host_type,window_size", HOSTS)
+@pytest.mark.parametrize("loss_ratio,queue_limit,rtt_min,link_rate",
+                         list(itertools.product([0.01, 0.1], [10, 1000000], [2, 100], [1, 2.5])))
+def test_acking_every_packet_matches_per_packet_recv(host_type, window_size, loss_ratio, queue_limit, rtt_min, link_rate):
+    for seed in [1, 2, 3]:
+        settings = dict(host_type=host_type, window_size=window_size, loss_ratio=loss_ratio, queue_limit=queue_limit,
+                        seed=seed, rtt_min=rtt_min, link_rate=link_rate)
+        expected = run_receiver(None, **settings).host
+        got = run_receiver({"ack_every": 1, "ack_delay": 0}, **settings).host
+        assert got.in_order_rx_seq == expected.in_order_rx_seq
+        assert got.timeout_calculator.timeout == expected.timeout_calculator.timeout
+
+
+def test_ack_every_holds_acks_back_by_default():
+    receiver = run_receiver({"ack_every": 8}).receiver
+    assert receiver.ack_delay == Receiver.DEFAULT_ACK_DELAY
+    assert receiver.packets_acked > 4 * receiver.acks_sent
+
+
+@pytest.mark.parametrize("ack_every,ack_delay", [(1, 0), (8, 0)])
+def test_zero_ack_delay_acks_on_the_tick_of_arrival(ack_every, ack_delay):
+    # On a link of 1 packet per tick, every packet arrives on a tick of its own
+    receiver = run_receiver({"ack_every": ack_every, "ack_delay": ack_delay}).receiver
+    assert receiver.ack_delay == 0
+    assert receiver.packets_acked == receiver.acks_sent
+
+
+class PoolChecker:
+    """
+    Checks that packets go back to Packet.pool at most once per alloc(), and keeps the
+    packets handed to the receiver that haven't gone back yet
+    """
+
+    def __init__(self, monkeypatch):
+        self.pooled = set()
+        self.delivered = {}
+        alloc = Packet.alloc
+        release = Packet.release
+        recv = Receiver.recv
+
+        def checked_alloc(*args):
+            pkt = alloc(*args)
+            self.pooled.discard(id(pkt))
+            return pkt
+
+        def checked_release(pkt):
+            assert id(pkt) not in self.pooled, "packet %d released twice" % pkt.seq_num
+            self.pooled.add(id(pkt))
+            self.delivered.pop(id(pkt), None)
+            release(pkt)
+
+        def checked_recv(receiver, pkt, tick):
+            self.delivered[id(pkt)] = pkt
+            recv(receiver, pkt, tick)
+
+        monkeypatch.setattr(Packet, "pool", [])
+        monkeypatch.setattr(Packet, "alloc", staticmethod(checked_alloc))
+        monkeypatch.setattr(Packet, "release", staticmethod(checked_release))
+        monkeypatch.setattr(Receiver, "recv", checked_recv)
+
+
+@pytest.mark.parametrize("host_type,window_size", HOSTS)
+@pytest.mark.parametrize("ack_every", [1, 4, 16])
+@pytest.mark.parametrize("sack", [True, False])
+@pytest.mark.parametrize("link_rate", [1, 3])
+def test_receiver_releases_each_packet_once(monkeypatch, host_type, window_size, ack_every, sack, link_rate):
+    checker = PoolChecker(monkeypatch)
+    simulator = run_receiver({"ack_every": ack_every, "sack": sack}, host_type, window_size, loss_ratio=0.05,
+                             queue_limit=20, link_rate=link_rate, ticks=5000)
+    receiver = simulator.receiver
+    assert receiver.packets_acked > 0
+    # Every packet the receiver got is back in the pool, unless it still holds it
+    kept = {id(pkt) for pkt in receiver.pending} | {id(entry[2]) for entry in receiver.held}
+    assert set(checker.delivered) <= kept
@@ -0,0 +1,85 @@
+import itertools
+import pytest
+from aimd_host import AimdHost
+from simulator import Simulator
+from sliding_window_host import SlidingWindowHost
+from stop_and_wait_host import StopAndWaitHost
+
+TICKS = 6000
+# Ticks between the points at which the runs are compared
+STEP = 250
+HOSTS = {
+    "stopandwait": lambda: StopAndWaitHost(verbose=False),
+    "slidingwindow1": lambda: SlidingWindowHost(1, verbose=False),
+    "slidingwindow8": lambda: SlidingWindowHost(8, verbose=False),
+    "slidingwindow60": lambda: SlidingWindowHost(60, verbose=False),
+    "aimd": lambda: AimdHost(verbose=False),
+}
+GRID = list(itertools.product([0.0, 0.05, 0.3], [5, 1000000], [2, 10, 150]))
+
+
+def state(simulator):
+    host = simulator.host
+    timeout_calculator = host.timeout_calculator
+    return (host.in_order_rx_seq, getattr(host, "max_seq", None), getattr(host, "window", None),
+            timeout_calculator.timeout, timeout_calculator.mean_rtt,
+            len(simulator.link.link_queue), len(simulator.pdbox))
+
+
+def make_simulator(host, loss_ratio, queue_limit, rtt_min, link_rate=1, seed=7):
+    return Simulator(HOSTS[host](), loss_ratio, queue_limit, rtt_min, seed, verbose=False, link_rate=link_rate)
+
+
+def tick_loop_states(simulator):
+    # State after every STEP ticks of calling tick() on every tick
+    states = []
+    for tick_val in range(0, TICKS):
+        simulator.tick(tick_val)
+        if (tick_val + 1) % STEP == 0:
+            states.append(state(simulator))
+    return states
+
+
+def run_states(simulator):
+    # State after every STEP ticks of run(), which skips idle ticks
+    states = []
+    for until in range(STEP, TICKS + 1, STEP):
+        simulator.run(until)
+        states.append(state(simulator))
+    return states
+
+
+@pytest.mark.parametrize("host", sorted(HOSTS))
+@pytest.mark.parametrize("loss_ratio,queue_limit,rtt_min", GRID)
+def test_run_matches_tick_loop(host, loss_ratio, queue_limit, rtt_min):
+    # Each run is made on its own, as a simulator's random draws may share one generator
+    expected = tick_loop_states(make_simulator(host, loss_ratio, queue_limit, rtt_min))
+    assert run_states(make_simulator(host, loss_ratio, queue_limit, rtt_min)) == expected
+
+
+@pytest.mark.parametrize("host", sorted(HOSTS))
+def test_run_matches_tick_loop_fractional_rate(host):
+    expected = tick_loop_states(make_simulator(host, 0.05, 20, 10, link_rate=0.3))
+    assert run_states(make_simulator(host, 0.05, 20, 10, link_rate=0.3)) == expected
+
+
+@pytest.mark.parametrize("host", sorted(HOSTS))
+@pytest.mark.parametrize("loss_ratio", [0.0, 0.05])
+def test_resumed_checkpoint_matches_uninterrupted_run(tmp_path, host, loss_ratio):
+    uninterrupted = make_simulator(host, loss_ratio, 20, 10)
+    uninterrupted.run(TICKS)
+    path = str(tmp_path / "checkpoint")
+    simulator = make_simulator(host, loss_ratio, 20, 10)
+    for until in [1234, 1235, 4000]:
+        simulator.run(until)
+        simulator.save_checkpoint(path)
+        simulator = Simulator.load_checkpoint(path)
+    simulator.run(TICKS)
+    assert state(simulator) == state(uninterrupted)
+
+
+def test_load_checkpoint_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_checkpoint"
+    path.write_bytes(b"something else")
+    with pytest.raises(ValueError):
+        Simulator.load_checkpoint(str(path))
@@ -0,0 +1,46 @@
+import itertools
+import pytest
+from simulator import Simulator, make_host
+from steady_state import FastForward
+
+TICKS = 12000
+HOSTS = [("stopandwait", None), ("slidingwindow", 1), ("slidingwindow", 8), ("slidingwindow", 60), ("aimd", None)]
+
+
+def state(simulator):
+    host = simulator.host
+    return (host.in_order_rx_seq, host.timeout_calculator.timeout, host.timeout_calculator.mean_rtt,
+            len(simulator.link.link_queue), len(simulator.pdbox))
+
+
+def run(host_type, window_size, loss_ratio, queue_limit, rtt_min, fast_forward=None, receiver=None):
+    simulator = Simulator(make_host(host_type, window_size, verbose=False), loss_ratio, queue_limit, rtt_min, 3,
+                          verbose=False, fast_forward=fast_forward, receiver=receiver)
+    # In several pieces, so that cycles are also found again after a run() returns
+    for until in [TICKS // 3, TICKS // 2, TICKS]:
+        simulator.run(until)
+    return simulator
+
+
+@pytest.mark.parametrize("host_type,window_size", HOSTS)
+@pytest.mark.parametrize("queue_limit,rtt_min,check_every", list(itertools.product([5, 1000000], [2, 10, 50], [1, 7])))
+def test_fast_forward_matches_plain_run(host_type, window_size, queue_limit, rtt_min, check_every):
+    fast_forward = FastForward(check_every)
+    skipped = run(host_type, window_size, 0.0, queue_limit, rtt_min, fast_forward)
+    assert fast_forward.applies(skipped)
+    assert state(skipped) == state(run(host_type, window_size, 0.0, queue_limit, rtt_min))
+
+
+def test_fast_forward_jumps():
+    fast_forward = FastForward()
+    run("slidingwindow", 20, 0.0, 1000000, 10, fast_forward)
+    assert fast_forward.jumps > 0 and fast_forward.skipped_ticks > TICKS // 2
+
+
+@pytest.mark.parametrize("loss_ratio,receiver", [(0.05, None), (0.0, {"ack_every": 4})])
+def test_fast_forward_does_nothing_where_it_does_not_apply(loss_ratio, receiver):
+    fast_forward = FastForward()
+    skipped = run("slidingwindow", 20, loss_ratio, 1000000, 10, fast_forward, receiver)
+    assert not fast_forward.applies(skipped)
+    assert fast_forward.jumps == 0
+    assert state(skipped) == state(run("slidingwindow", 20, loss_ratio, 1000000, 10, receiver=receiver))
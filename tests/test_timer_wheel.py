@@ -0,0 +1,149 @@
+import math
+import random
+import pytest
+from timeout_calculator import TimeoutCalculator
+from timer_wheel import TimerWheel
+
+SLOTS = 1 << TimerWheel.SLOT_BITS
+MAX_TIMEOUT = TimeoutCalculator.MAX_TIMEOUT
+
+
+def fires_at(wheel, key, tick):
+    # The timer of key hasn't fired by tick - 1 and fires at tick
+    assert key not in wheel.expire(tick - 1)
+    assert key in wheel
+    assert wheel.expire(tick) == [key]
+    assert key not in wheel
+
+
+def test_schedule_fires_on_first_tick_at_or_after_deadline():
+    wheel = TimerWheel()
+    wheel.schedule(1, 5, 1)
+    wheel.schedule(2, 7.5, 2)
+    assert len(wheel) == 2
+    assert wheel.next_deadline() == 5
+    fires_at(wheel, 1, 5)
+    assert wheel.next_deadline() == 8
+    fires_at(wheel, 2, 8)
+    assert len(wheel) == 0
+    assert wheel.next_deadline() == math.inf
+
+
+def test_past_deadline_fires_on_next_expire():
+    wheel = TimerWheel()
+    wheel.expire(100)
+    wheel.schedule(1, 50, 1)
+    wheel.schedule(2, 100, 2)
+    assert wheel.next_deadline() == 100
+    assert wheel.expire(100) == [1, 2]
+    assert len(wheel) == 0
+
+
+def test_expired_values_are_in_key_order():
+    wheel = TimerWheel()
+    for key, deadline in [(5, 3), (2, 200), (9, 3), (1, 70), (7, 0)]:
+        wheel.schedule(key, deadline, "value %d" % key)
+    assert wheel.expire(300) == ["value 1", "value 2", "value 5", "value 7", "value 9"]
+
+
+def test_cancel():
+    wheel = TimerWheel()
+    wheel.schedule(1, 10, 1)
+    wheel.schedule(2, 5000, 2)
+    wheel.schedule(3, 0, 3)
+    assert wheel.cancel(1)
+    assert wheel.cancel(2)
+    assert wheel.cancel(3)
+    assert not wheel.cancel(1)
+    assert not wheel.cancel(4)
+    assert len(wheel) == 0
+    assert wheel.next_deadline() == math.inf
+    assert wheel.expire(MAX_TIMEOUT) == []
+    assert all(bitmap == 0 for bitmap in wheel.bitmaps)
+
+
+@pytest.mark.parametrize("first, second", [(10, 3), (3, 10), (10, 5000), (5000, 10), (0, 64), (64, 0)])
+def test_reschedule_replaces_the_timer(first, second):
+    wheel = TimerWheel()
+    wheel.schedule(1, first, "first")
+    wheel.schedule(1, second, "second")
+    assert len(wheel) == 1
+    if second > 0:
+        assert wheel.expire(second - 1) == []
+    assert wheel.expire(max(first, second)) == ["second"]
+    assert len(wheel) == 0
+
+
+@pytest.mark.parametrize("now", [0, 1, SLOTS - 1, SLOTS, SLOTS ** 2 - 1, 12345])
+@pytest.mark.parametrize("delay", [1, SLOTS - 1, SLOTS, SLOTS + 1, SLOTS ** 2 - 1, SLOTS ** 2, SLOTS ** 2 + 1,
+                                   MAX_TIMEOUT - 1, MAX_TIMEOUT, MAX_TIMEOUT + 1])
+def test_expiry_at_level_boundaries(now, delay):
+    wheel = TimerWheel()
+    wheel.expire(now)
+    wheel.schedule(1, now + delay, 1)
+    # A neighbour on either side, cascading down through the same slots
+    if delay > 1:
+        wheel.schedule(0, now + delay - 1, 0)
+    wheel.schedule(2, now + delay + 1, 2)
+    assert wheel.next_deadline() <= now + delay - (delay > 1)
+    if delay > 1:
+        fires_at(wheel, 0, now + delay - 1)
+    fires_at(wheel, 1, now + delay)
+    fires_at(wheel, 2, now + delay + 1)
+
+
+@pytest.mark.parametrize("now", [0, SLOTS ** 3 - MAX_TIMEOUT - 1])
+def test_max_timeout_fits_the_initial_levels(now):
+    wheel = TimerWheel(MAX_TIMEOUT)
+    levels = len(wheel.slots)
+    assert SLOTS ** (levels - 1) <= MAX_TIMEOUT < SLOTS ** levels
+    wheel.expire(now)
+    wheel.schedule(1, now + MAX_TIMEOUT, 1)
+    assert len(wheel.slots) == levels
+    fires_at(wheel, 1, now + MAX_TIMEOUT)
+
+
+def test_max_timeout_across_the_end_of_the_rotation():
+    # The timer's tick is in the next rotation of the top level, which takes a level more
+    wheel = TimerWheel(MAX_TIMEOUT)
+    levels = len(wheel.slots)
+    now = SLOTS ** levels - MAX_TIMEOUT // 2
+    wheel.expire(now)
+    wheel.schedule(1, now + MAX_TIMEOUT, 1)
+    assert len(wheel.slots) == levels + 1
+    fires_at(wheel, 1, now + MAX_TIMEOUT)
+
+
+def test_timers_beyond_the_levels_add_levels():
+    wheel = TimerWheel(SLOTS - 1)
+    assert len(wheel.slots) == 1
+    wheel.schedule(1, SLOTS ** 3 + 5, 1)
+    assert len(wheel.slots) == 4
+    fires_at(wheel, 1, SLOTS ** 3 + 5)
+
+
+@pytest.mark.parametrize("seed", range(0, 5))
+def test_matches_a_dict_of_deadlines(seed):
+    rng = random.Random(seed)
+    wheel = TimerWheel()
+    deadlines = {}
+    now = 0
+    for _ in range(0, 3000):
+        op = rng.random()
+        key = rng.randrange(0, 200)
+        if op < 0.5:
+            deadline = now + rng.choice([rng.uniform(-5, 70), rng.randrange(0, 5000), rng.randrange(0, 2 * MAX_TIMEOUT)])
+            wheel.schedule(key, deadline, key)
+            deadlines[key] = max(math.ceil(deadline), now)
+        elif op < 0.65:
+            assert wheel.cancel(key) == (key in deadlines)
+            deadlines.pop(key, None)
+        else:
+            now += rng.choice([0, 1, rng.randrange(0, SLOTS), rng.randrange(0, 5000)])
+            expected = sorted(key for key, tick in deadlines.items() if tick <= now)
+            assert wheel.expire(now) == expected
+            for key in expected:
+                del deadlines[key]
+            assert len(wheel) == len(deadlines)
+            if deadlines:
+                assert now <= wheel.next_deadline() <= min(deadlines.values())
@@ -0,0 +1,39 @@
+import itertools
+import pytest
+from aimd_host import AimdHost
+from reference_hosts import ListAimdHost, ListSlidingWindowHost
+from simulator import Simulator
+from sliding_window_host import SlidingWindowHost
+
+TICKS = 6000
+GRID = list(itertools.product([0.0, 0.05, 0.3], [5, 1000000], [2, 10, 150]))
+HOSTS = {
+    "slidingwindow1": (lambda: SlidingWindowHost(1, verbose=False), lambda: ListSlidingWindowHost(1)),
+    "slidingwindow8": (lambda: SlidingWindowHost(8, verbose=False), lambda: ListSlidingWindowHost(8)),
+    "slidingwindow60": (lambda: SlidingWindowHost(60, verbose=False), lambda: ListSlidingWindowHost(60)),
+    "aimd": (lambda: AimdHost(verbose=False), ListAimdHost),
+}
+
+
+def host_state(host):
+    timeout_calculator = host.timeout_calculator
+    return (host.in_order_rx_seq, host.max_seq, host.window, len(host.unacked),
+            timeout_calculator.timeout, timeout_calculator.mean_rtt)
+
+
+def run_ticks(host, loss_ratio, queue_limit, rtt_min, seed=7):
+    # Calls tick() on every tick, as the simulator did before run() skipped idle ticks,
+    # and returns the state of the host after each of them
+    simulator = Simulator(host, loss_ratio, queue_limit, rtt_min, seed, verbose=False)
+    states = []
+    for tick_val in range(0, TICKS):
+        simulator.tick(tick_val)
+        states.append(host_state(host))
+    return states
+
+
+@pytest.mark.parametrize("host", sorted(HOSTS))
+@pytest.mark.parametrize("loss_ratio,queue_limit,rtt_min", GRID)
+def test_window_host_matches_list_host(host, loss_ratio, queue_limit, rtt_min):
+    make_host, make_list_host = HOSTS[host]
+    assert run_ticks(make_host(), loss_ratio, queue_limit, rtt_min) == run_ticks(make_list_host(), loss_ratio, queue_limit, rtt_min)
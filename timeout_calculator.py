@@ -65,7 +65,8 @@ class TimeoutCalculator:
         self.timeout *= 2
         # TODO: Re-initialize the EWMA
         self.EWMA = False
-        print("exponential backoff here, re-initializing EWMA")
+        if self.verbose:
+            print("exponential backoff here, re-initializing EWMA")
         # TODO: Before you return from this function,
         # ensure that updated timeout is between self.min_timeout and self.max_timeout
         # i.e, if your timeout is above self.max_timeout, you should set it to self.max_timeout.
@@ -77,6 +78,46 @@ class TimeoutCalculator:
         return self.timeout
 
 
+def timeout_series(rtt_samples, alphas=(0.125,), betas=(0.25,), ks=(4.0,),
+                   min_timeout=TimeoutCalculator.MIN_TIMEOUT, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+    """
+    Replays update_timeout over a trace of RTT samples for every combination of
+    alpha, beta and k at once, using NumPy (see ewma.ewma_series). Meant for tuning
+    alpha, beta and k offline against recorded traces; exponential backoff is not
+    modelled.
+
+    Args:
+
+        **rtt_samples**: 1-D array of n RTT samples
+
+        **alphas**, **betas**, **ks**: 1-D arrays of A, B and K parameter values
+
+    Returns:
+        mean_rtt of shape (A, n), rtt_var of shape (A, B, n) and the clamped timeout
+        of shape (A, B, K, n), each holding the value after every sample
+    """
+    import numpy as np
+    from ewma import ewma_series
+    rtt_samples = np.asarray(rtt_samples, dtype=float)
+    alphas = np.asarray(alphas, dtype=float).reshape(-1)
+    betas = np.asarray(betas, dtype=float).reshape(-1)
+    ks = np.asarray(ks, dtype=float).reshape(-1)
+    first = rtt_samples[0]
+    rest = rtt_samples[1:]
+    # The first sample initializes mean_rtt to the sample and rtt_var to half of it
+    mean_rtt = np.empty((alphas.shape[0], rtt_samples.shape[0]))
+    mean_rtt[:, 0] = first
+    mean_rtt[:, 1:] = ewma_series(rest, alphas, first)
+    # rtt_var is updated with the deviation from the mean before this sample
+    deviation = np.abs(rest[None, :] - mean_rtt[:, :-1])
+    rtt_var = np.empty((alphas.shape[0], betas.shape[0], rtt_samples.shape[0]))
+    rtt_var[:, :, 0] = first * .5
+    rtt_var[:, :, 1:] = ewma_series(deviation, betas, first * .5).transpose(1, 0, 2)
+    timeout = mean_rtt[:, None, None, :] + ks[None, None, :, None] * rtt_var[:, :, None, :]
+    np.clip(timeout, min_timeout, max_timeout, out=timeout)
+    return mean_rtt, rtt_var, timeout
+
+
 def main():
     # This is a simple example for you to experiment. This is not part of the
     # submission
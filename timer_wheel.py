@@ -0,0 +1,155 @@
+import math
+from operator import itemgetter
+from timeout_calculator import TimeoutCalculator
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel that holds one timer per key and hands back only the
+    timers that have expired. Data members of this class are
+
+    **now**: Latest tick passed to expire(). Every timer due at or before it has fired
+
+    **slots**: One wheel of 2^SLOT_BITS slots per level. A slot of level L covers
+    2^(L * SLOT_BITS) ticks, and each slot is a dict of key -> (tick, value)
+
+    **bitmaps**: One int per level with a bit set for every non-empty slot
+
+    **where**: key -> (level, slot) of every pending timer, or None for timers in due
+
+    **due**: Timers whose tick had already passed when they were scheduled
+
+    A timer is kept in the lowest level whose current rotation contains its tick. When
+    time reaches a slot of a higher level, its timers are moved down to lower levels,
+    so each timer is moved at most once per level. The wheel starts with enough levels
+    for max_timeout and adds levels if a timer is scheduled past the current rotation
+    of its top level (further out than max_timeout, or across the end of the rotation
+    every 2^(levels * SLOT_BITS) ticks). Scheduling,
+    cancelling and firing a timer are O(1), and expire() jumps over empty slots using
+    the bitmaps, so the cost of a call doesn't depend on how many ticks it skips.
+    """
+    SLOT_BITS = 6
+    SLOT_MASK = (1 << SLOT_BITS) - 1
+
+    def __init__(self, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+        self.now = 0
+        self.slots = []
+        self.bitmaps = []
+        self.where = {}
+        self.due = {}
+        while (1 << (len(self.slots) * TimerWheel.SLOT_BITS)) <= max_timeout:
+            self.add_level()
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def add_level(self):
+        self.slots.append([None] * (1 << TimerWheel.SLOT_BITS))
+        self.bitmaps.append(0)
+
+    def schedule(self, key, deadline, value):
+        """
+        Sets the timer of key to fire on the first tick at or after deadline,
+        replacing any timer key already had.
+        """
+        if key in self.where:
+            self.cancel(key)
+        tick = math.ceil(deadline)
+        if tick <= self.now:
+            self.due[key] = value
+            self.where[key] = None
+        else:
+            self.insert(key, tick, value)
+
+    def insert(self, key, tick, value):
+        level = ((tick ^ self.now).bit_length() - 1) // TimerWheel.SLOT_BITS
+        while level >= len(self.slots):
+            self.add_level()
+        index = (tick >> (level * TimerWheel.SLOT_BITS)) & TimerWheel.SLOT_MASK
+        slot = self.slots[level][index]
+        if slot is None:
+            slot = self.slots[level][index] = {}
+            self.bitmaps[level] |= 1 << index
+        slot[key] = (tick, value)
+        self.where[key] = (level, index)
+
+    def cancel(self, key):
+        """
+        Removes the timer of key.
+
+        Returns:
+            True if key had a pending timer
+        """
+        if key not in self.where:
+            return False
+        location = self.where.pop(key)
+        if location is None:
+            del self.due[key]
+            return True
+        level, index = location
+        slot = self.slots[level][index]
+        del slot[key]
+        if not slot:
+            self.slots[level][index] = None
+            self.bitmaps[level] &= ~(1 << index)
+        return True
+
+    def next_slot(self):
+        # Level, index and start tick of the earliest non-empty slot. Slots are only
+        # ever filled ahead of now in their level's current rotation, so this is the
+        # lowest set bit of the lowest non-empty level.
+        for level, bitmap in enumerate(self.bitmaps):
+            if bitmap:
+                index = (bitmap & -bitmap).bit_length() - 1
+                shift = level * TimerWheel.SLOT_BITS
+                start = ((self.now >> (shift + TimerWheel.SLOT_BITS)) << (shift + TimerWheel.SLOT_BITS)) | (index << shift)
+                return level, index, start
+        return None
+
+    def expire(self, tick):
+        """
+        Advances the wheel to tick and removes every timer due at or before it.
+
+        Returns:
+            The values of the expired timers, in key order
+        """
+        fired = list(self.due.items())
+        for key in self.due:
+            del self.where[key]
+        self.due = {}
+        while True:
+            next_slot = self.next_slot()
+            if next_slot is None or next_slot[2] > tick:
+                break
+            level, index, start = next_slot
+            self.now = start
+            slot = self.slots[level][index]
+            self.slots[level][index] = None
+            self.bitmaps[level] &= ~(1 << index)
+            for key, (timer_tick, value) in slot.items():
+                if timer_tick <= start:
+                    fired.append((key, value))
+                    del self.where[key]
+                else:
+                    self.insert(key, timer_tick, value)
+        if tick > self.now:
+            self.now = tick
+        if len(fired) > 1:
+            fired.sort(key=itemgetter(0))
+        return [value for key, value in fired]
+
+    def next_deadline(self):
+        """
+        Returns a lower bound on the tick of the next timer to fire: the start of the
+        earliest non-empty slot, which is the tick of the timer itself when it sits in
+        the lowest level. math.inf if there are no timers
+        """
+        if self.due:
+            return self.now
+        next_slot = self.next_slot()
+        if next_slot is None:
+            return math.inf
+        return next_slot[2]
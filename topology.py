@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Multi-hop topologies: flows routed across a graph of links.
+
+A Topology is a set of named nodes joined by directed links. Every link is a Link
+(its queue, rate and loss) followed by a DelayBox (its propagation delay in ticks).
+A flow is a host attached at a source node that sends to a destination node. With
+ack=Topology.ROUTED (the default) a packet that reaches the destination is turned
+around and routed back to the source as the ACK, across whatever links lead back.
+With ack=Topology.DIRECT the ACK is handed to the host as soon as the packet
+reaches the destination, so a single link with delay rtt_min - 1 behaves like
+Simulator (exactly so when the link has no losses, which are drawn from another
+random stream).
+
+Topologies are built with the Python API
+
+    topology = Topology()
+    topology.add_link("a", "b", delay=5, bidirectional=True)
+    topology.add_link("b", "c", delay=10, queue_limit=50, rate=0.5, bidirectional=True)
+    topology.add_flow(make_host("aimd"), "a", "c")
+    simulator = TopologySimulator(topology, seed=1)
+    simulator.run(100000)
+
+or loaded from a JSON (or, with PyYAML installed, YAML) file with the same fields:
+
+    {
+        "links": [
+            {"src": "a", "dst": "b", "delay": 5, "bidirectional": true},
+            {"src": "b", "dst": "c", "delay": 10, "queue_limit": 50, "rate": 0.5, "bidirectional": true}
+        ],
+        "flows": [
+            {"host_type": "aimd", "src": "a", "dst": "c"},
+            {"host_type": "slidingwindow", "window_size": 4, "src": "b", "dst": "c", "ack": "direct"}
+        ]
+    }
+
+    python topology.py topology.json --seed 1 --ticks 100000
+
+Routes are shortest paths by propagation delay plus one tick per hop (ties go to
+the lower link id). They are computed once when the simulator is built, into one
+array per destination node that maps every node to the id of its next link, so
+forwarding a packet is two list lookups.
+
+Per tick, only links whose next_event_tick() is due and delay boxes with a packet
+leaving are ticked, in link id order, so idle parts of the topology cost nothing.
+Every link draws its losses from its own random.Random seeded from the simulator's
+seed and the link id (see link_rng()), so results don't depend on which links are
+ticked together, which lets parallel.py split a topology across processes. Losses
+are i.i.d. with the link's loss_ratio unless the link has a "loss_model" (a dict
+as taken by loss_models.make_loss_model(), e.g. {"type": "gilbert_elliott", "p":
+0.01, "r": 0.5} for bursty losses). A link with a "capacity_trace" (the path of a
+binary trace, see capacity_trace.py) replays its delivery opportunities instead of
+sending at its rate.
+"""
+
+import argparse
+import heapq
+import json
+import math
+import random
+from array import array
+from network import DelayBox, Link
+from loss_models import make_loss_model
+from capacity_trace import CapacityTrace
+from packet import Packet
+from multi_flow import HostWakeups, jain_fairness
+from simulator import make_host
+
+
+class Topology:
+    """
+    Description of a topology: nodes, links and flows. Data members of this class are
+
+    **nodes**: Node names, indexed by node id
+
+    **links**: One dict of Link parameters per directed link, indexed by link id
+
+    **flows**: One dict per flow with its host, src and dst node ids and ack mode
+    """
+    ROUTED = "routed"
+    DIRECT = "direct"
+
+    LINK_DEFAULTS = {
+        "loss_ratio": 0.0,
+        "queue_limit": 1000000,
+        "rate": 1,
+        "rate_unit": Link.PACKETS,
+        "limit_unit": Link.PACKETS,
+        "scheduler": Link.FIFO,
+        "quantum": Packet.SIZE,
+        "loss_model": None,
+        "capacity_trace": None,
+    }
+
+    def __init__(self):
+        self.nodes = []
+        self.node_ids = {}
+        self.links = []
+        self.flows = []
+
+    def add_node(self, name):
+        """
+        Adds a node if there isn't one called name yet and returns its id
+        """
+        if name not in self.node_ids:
+            self.node_ids[name] = len(self.nodes)
+            self.nodes.append(name)
+        return self.node_ids[name]
+
+    def add_link(self, src, dst, delay, bidirectional=False, **params):
+        """
+        Adds a link from node src to node dst (adding the nodes if needed) and returns
+        its id. With bidirectional, a link with the same parameters is also added
+        from dst to src.
+
+        Args:
+
+            **delay**: Propagation delay of the link in ticks
+
+            **params**: Link parameters, see LINK_DEFAULTS
+        """
+        for key in params:
+            if key not in Topology.LINK_DEFAULTS:
+                raise ValueError("Unknown link parameter " + key)
+        if delay < 0:
+            raise ValueError("delay must not be negative")
+        if src == dst:
+            raise ValueError("a link can't start and end at the same node")
+        link = dict(Topology.LINK_DEFAULTS)
+        link.update(params)
+        link["src"] = self.add_node(src)
+        link["dst"] = self.add_node(dst)
+        link["delay"] = delay
+        self.links.append(link)
+        if bidirectional:
+            self.add_link(dst, src, delay, **params)
+        return len(self.links) - 1 - bidirectional
+
+    def add_flow(self, host, src, dst, ack=ROUTED):
+        """
+        Attaches host at node src, sending to node dst, and returns its flow id
+        """
+        if ack not in [Topology.ROUTED, Topology.DIRECT]:
+            raise ValueError("ack must be Topology.ROUTED or Topology.DIRECT")
+        if src == dst:
+            raise ValueError("a flow can't start and end at the same node")
+        self.flows.append({"host": host, "src": self.add_node(src), "dst": self.add_node(dst), "ack": ack})
+        return len(self.flows) - 1
+
+    @staticmethod
+    def from_dict(spec, verbose=False):
+        """
+        Builds a topology from a dict with "nodes" (optional), "links" and "flows" lists,
+        as loaded from a topology file. Flow hosts are created with make_host().
+        """
+        topology = Topology()
+        for name in spec.get("nodes", []):
+            topology.add_node(name)
+        for link in spec.get("links", []):
+            params = dict(link)
+            src = params.pop("src")
+            dst = params.pop("dst")
+            delay = params.pop("delay")
+            topology.add_link(src, dst, delay, **params)
+        for flow in spec.get("flows", []):
+            params = dict(flow)
+            src = params.pop("src")
+            dst = params.pop("dst")
+            ack = params.pop("ack", Topology.ROUTED)
+            host_type = params.pop("host_type")
+            host = make_host(host_type, verbose=verbose, **params)
+            topology.add_flow(host, src, dst, ack)
+        return topology
+
+    @staticmethod
+    def load(path, verbose=False):
+        """
+        Loads a topology file, YAML if its name ends in .yaml or .yml and JSON otherwise
+        """
+        with open(path) as f:
+            if path.endswith((".yaml", ".yml")):
+                import yaml
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        return Topology.from_dict(spec, verbose=verbose)
+
+    def forwarding_tables(self):
+        """
+        Returns one array per destination node, mapping every node id to the id of the
+        link a packet at that node takes towards the destination (-1 if there is no
+        route, or at the destination itself)
+        """
+        incoming = [[] for _ in self.nodes]
+        for link_id, link in enumerate(self.links):
+            incoming[link["dst"]].append(link_id)
+        tables = []
+        for dst in range(0, len(self.nodes)):
+            # Dijkstra from dst over reversed links
+            distance = [math.inf] * len(self.nodes)
+            table = array("i", [-1] * len(self.nodes))
+            distance[dst] = 0
+            heap = [(0, dst)]
+            while heap:
+                dist, node = heapq.heappop(heap)
+                if dist > distance[node]:
+                    continue
+                for link_id in incoming[node]:
+                    link = self.links[link_id]
+                    prev = link["src"]
+                    prev_dist = dist + link["delay"] + 1
+                    if prev_dist < distance[prev] or (prev_dist == distance[prev] and link_id < table[prev]):
+                        if prev_dist < distance[prev]:
+                            heapq.heappush(heap, (prev_dist, prev))
+                        distance[prev] = prev_dist
+                        table[prev] = link_id
+            tables.append(table)
+        return tables
+
+
+def link_rng(seed, link_id):
+    # Loss stream of one link, the same whichever process simulates the link
+    return random.Random("%s/%d" % (seed, link_id))
+
+
+class NodePort:
+    """
+    Receives the packets that come out of the delay boxes of links ending at a node
+    and hands them to the simulator for forwarding
+    """
+
+    def __init__(self, simulator, node):
+        self.simulator = simulator
+        self.node = node
+
+    def recv(self, pkt, tick):
+        self.simulator.forward(pkt, self.node, tick)
+
+
+class TopologySimulator:
+    """
+    Simulates the flows of a Topology. Data members of this class are
+
+    **links**, **pdboxes**: Link and DelayBox of every link id
+
+    **next_link**: Forwarding tables, next_link[dst][node] is the link id to take from node towards dst
+
+    **link_heap**, **pdbox_heap**: Heaps of (tick, link id) at which a link or a delay box
+    has to be ticked. Entries that no longer match link_wake / pdbox_wake are stale
+    """
+
+    def __init__(self, topology, seed, verbose=True):
+        self.topology = topology
+        self.hosts = [flow["host"] for flow in topology.flows]
+        self.flow_src = array("i", [flow["src"] for flow in topology.flows])
+        self.flow_dst = array("i", [flow["dst"] for flow in topology.flows])
+        self.flow_routed = [flow["ack"] == Topology.ROUTED for flow in topology.flows]
+        self.links = []
+        self.pdboxes = []
+        for link_id, params in enumerate(topology.links):
+            self.links.append(Link(loss_ratio=params["loss_ratio"], queue_limit=params["queue_limit"], verbose=verbose,
+                                   rate=params["rate"], rate_unit=params["rate_unit"], limit_unit=params["limit_unit"],
+                                   scheduler=params["scheduler"], quantum=params["quantum"],
+                                   loss_model=make_loss_model(params["loss_model"], params["loss_ratio"], link_rng(seed, link_id)),
+                                   capacity_trace=CapacityTrace(params["capacity_trace"]) if params["capacity_trace"] is not None else None))
+            self.pdboxes.append(DelayBox(params["delay"]))
+        self.ports = [NodePort(self, node) for node in range(0, len(topology.nodes))]
+        self.link_ports = [self.ports[params["dst"]] for params in topology.links]
+
+        self.next_link = topology.forwarding_tables()
+        for flow_id, flow in enumerate(topology.flows):
+            if self.next_link[flow["dst"]][flow["src"]] < 0:
+                raise ValueError("no route for flow %d from %s to %s" %
+                                 (flow_id, topology.nodes[flow["src"]], topology.nodes[flow["dst"]]))
+            if flow["ack"] == Topology.ROUTED and self.next_link[flow["src"]][flow["dst"]] < 0:
+                raise ValueError("no route for the ACKs of flow %d from %s to %s" %
+                                 (flow_id, topology.nodes[flow["dst"]], topology.nodes[flow["src"]]))
+
+        self.link_heap = []
+        self.link_wake = [math.inf] * len(self.links)
+        self.pdbox_heap = []
+        self.pdbox_wake = [math.inf] * len(self.links)
+        self.wakeups = HostWakeups(self.hosts)
+        # Flows that got an ACK on the current tick
+        self.touched = set()
+
+        # Next tick that run() will simulate
+        self.now = 0
+
+    def enqueue(self, link_id, pkt, tick_val):
+        # Put pkt on a link and make sure the link is ticked on tick_val or later
+        self.links[link_id].recv(pkt, tick_val)
+        if self.link_wake[link_id] == math.inf:
+            self.link_wake[link_id] = tick_val
+            heapq.heappush(self.link_heap, (tick_val, link_id))
+
+    def forward(self, pkt, node, tick_val):
+        # pkt has arrived at node: deliver it to its host, turn it around as an ACK, or send it on
+        flow_id = pkt.flow_id
+        if node == pkt.dst:
+            if node == self.flow_dst[flow_id] and self.flow_routed[flow_id]:
+                pkt.dst = self.flow_src[flow_id]
+            else:
+                self.touched.add(flow_id)
+                self.hosts[flow_id].recv(pkt, tick_val)
+                return
+        # Packets that arrive now wait for the next tick to leave on the next link
+        self.enqueue(self.next_link[pkt.dst][node], pkt, tick_val + 1)
+
+    def tick(self, tick_val):
+        due = self.wakeups.due(tick_val)
+        for flow_id in due:
+            packets = self.hosts[flow_id].send(tick_val)
+            if packets is not None:
+                if type(packets) is Packet:
+                    packets = [packets]
+                src = self.flow_src[flow_id]
+                dst = self.flow_dst[flow_id]
+                for packet in packets:
+                    packet.flow_id = flow_id
+                    packet.dst = dst
+                    self.enqueue(self.next_link[dst][src], packet, tick_val)
+
+        # Links with packets that can leave now, in link id order
+        link_heap = self.link_heap
+        while link_heap and link_heap[0][0] <= tick_val:
+            wake, link_id = heapq.heappop(link_heap)
+            if self.link_wake[link_id] != wake:
+                continue
+            link = self.links[link_id]
+            pdbox = self.pdboxes[link_id]
+            link.tick(tick_val, pdbox)
+            next_tick = link.next_event_tick(tick_val)
+            self.link_wake[link_id] = next_tick
+            if next_tick != math.inf:
+                heapq.heappush(link_heap, (next_tick, link_id))
+            if self.pdbox_wake[link_id] == math.inf and len(pdbox) > 0:
+                next_tick = pdbox.next_event_tick(tick_val)
+                self.pdbox_wake[link_id] = next_tick
+                heapq.heappush(self.pdbox_heap, (next_tick, link_id))
+
+        # Delay boxes with packets arriving at the far end of their link now
+        self.touched.clear()
+        pdbox_heap = self.pdbox_heap
+        while pdbox_heap and pdbox_heap[0][0] <= tick_val:
+            wake, link_id = heapq.heappop(pdbox_heap)
+            if self.pdbox_wake[link_id] != wake:
+                continue
+            pdbox = self.pdboxes[link_id]
+            pdbox.tick(tick_val, self.link_ports[link_id])
+            next_tick = pdbox.next_event_tick(tick_val)
+            self.pdbox_wake[link_id] = next_tick
+            if next_tick != math.inf:
+                heapq.heappush(pdbox_heap, (next_tick, link_id))
+
+        # Flows that sent or got an ACK may want to send again at a different time
+        self.touched.update(due)
+        self.wakeups.update(self.touched, tick_val)
+
+    def next_event_tick(self, tick_val):
+        next_tick = self.wakeups.next_event_tick(tick_val)
+        for heap, wake in [(self.link_heap, self.link_wake), (self.pdbox_heap, self.pdbox_wake)]:
+            while heap and wake[heap[0][1]] != heap[0][0]:
+                heapq.heappop(heap)
+            if heap and heap[0][0] < next_tick:
+                next_tick = max(tick_val + 1, heap[0][0])
+        return next_tick
+
+    def run(self, until):
+        # Run simulation from self.now up to (but not including) tick until, skipping idle ticks
+        tick_val = self.now
+        while tick_val < until:
+            self.tick(tick_val)
+            next_tick = self.next_event_tick(tick_val)
+            if next_tick == math.inf:
+                break
+            tick_val = next_tick
+        self.now = until
+
+    def in_order_rx_seqs(self):
+        return [host.in_order_rx_seq for host in self.hosts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate flows routed across a multi-hop topology")
+    parser.add_argument("topology", help="topology file (JSON, or YAML with PyYAML installed)")
+    parser.add_argument("--seed", type=int, required=True)
+    parser.add_argument("--ticks", type=int, required=True)
+    args = parser.parse_args()
+
+    topology = Topology.load(args.topology)
+    simulator = TopologySimulator(topology, args.seed, verbose=False)
+    simulator.run(args.ticks)
+    report(topology, simulator.in_order_rx_seqs())
+
+
+def report(topology, in_order_rx_seqs):
+    seqs = [seq + 1 for seq in in_order_rx_seqs]
+    print("Nodes: " + str(len(topology.nodes)) + ", links: " + str(len(topology.links)) + ", flows: " + str(len(seqs)))
+    for flow_id, flow in enumerate(topology.flows):
+        print("Flow %d %s -> %s: %d packets received in order" %
+              (flow_id, topology.nodes[flow["src"]], topology.nodes[flow["dst"]], seqs[flow_id]))
+    print("Jain's fairness index: %.4f" % jain_fairness(seqs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Binary event tracing for the simulator.
+
+Hosts and the link emit typed events (send, retx, ack, drop, loss, backoff, window
+change, departure from the link) to a Tracer when one is attached to them (see Simulator). Every event is a
+tick, an event kind, a sequence number and a float value whose meaning depends on
+the kind:
+
+    SEND, RETX: timeout_duration of the packet
+    ACK:        RTT sample
+    DROP, LOSS: link queue length (DROP: queue_limit exceeded, LOSS: random loss)
+    BACKOFF:    timeout after the backoff
+    WINDOW:     new window size
+    DEPART:     queueing delay of the packet (pdbox_time - sent_ts)
+
+Events are written into preallocated columns (one array per field) used as a ring
+buffer. With a path, full buffers are appended to the file in one write per column;
+without one, the buffer keeps the latest capacity events in memory. Components that
+have no tracer only pay for an "is not None" check per event.
+
+The file starts with MAGIC, followed by blocks made of a little-endian uint32 event
+count and then the tick (int64), kind (uint8), seq_num (int64) and value (float64)
+columns of that many events. read_trace() yields the events of a file lazily, one
+block at a time, and format_event() turns them into text:
+
+    python tracer.py trace.bin
+"""
+
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+SEND = 0
+RETX = 1
+ACK = 2
+DROP = 3
+LOSS = 4
+BACKOFF = 5
+WINDOW = 6
+DEPART = 7
+NAMES = ["send", "retx", "ack", "drop", "loss", "backoff", "window", "depart"]
+
+MAGIC = b"NSTRACE1"
+
+Event = namedtuple("Event", ["tick", "kind", "seq_num", "value"])
+
+
+class Tracer:
+    """
+    Records events into a ring buffer of capacity events, flushed to path if given.
+    """
+
+    def __init__(self, path=None, capacity=1 << 16):
+        self.capacity = capacity
+        self.ticks = array("q", bytes(8 * capacity))
+        self.kinds = array("B", bytes(capacity))
+        self.seq_nums = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        # Next slot to write and number of events in the buffer
+        self.pos = 0
+        self.size = 0
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+
+    def emit(self, tick, kind, seq_num=-1, value=0.0):
+        pos = self.pos
+        self.ticks[pos] = tick
+        self.kinds[pos] = kind
+        self.seq_nums[pos] = seq_num
+        self.values[pos] = value
+        pos += 1
+        if self.size < self.capacity:
+            self.size += 1
+        if pos == self.capacity:
+            if self.file is not None:
+                self.flush()
+                return
+            pos = 0
+        self.pos = pos
+
+    def flush(self):
+        """
+        Appends the buffered events to the file (if there is one) and empties the buffer
+        """
+        if self.file is not None and self.size > 0:
+            # With a file the buffer is flushed before it wraps, so it starts at slot 0
+            self.file.write(struct.pack("<I", self.size))
+            for column in [self.ticks, self.kinds, self.seq_nums, self.values]:
+                data = column[:self.size]
+                if sys.byteorder != "little":
+                    data.byteswap()
+                data.tofile(self.file)
+            self.pos = 0
+            self.size = 0
+
+    def buffered(self):
+        """
+        Yields the events in the buffer, oldest first
+        """
+        start = self.pos - self.size if self.size < self.capacity else self.pos
+        for i in range(start, start + self.size):
+            i %= self.capacity
+            yield Event(self.ticks[i], self.kinds[i], self.seq_nums[i], self.values[i])
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def read_trace(path):
+    """
+    Yields the events of a trace file, reading one block at a time
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a trace file")
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return
+            count = struct.unpack("<I", header)[0]
+            columns = []
+            for typecode in ["q", "B", "q", "d"]:
+                column = array(typecode)
+                column.fromfile(f, count)
+                if sys.byteorder != "little":
+                    column.byteswap()
+                columns.append(column)
+            for i in range(0, count):
+                yield Event(columns[0][i], columns[1][i], columns[2][i], columns[3][i])
+
+
+def format_event(event):
+    text = "@ tick " + str(event.tick) + " " + NAMES[event.kind]
+    if event.seq_num >= 0:
+        text += " seq " + str(event.seq_num)
+    if event.kind in [SEND, RETX]:
+        text += " timeout duration " + str(event.value)
+    elif event.kind == ACK:
+        text += " rtt " + str(event.value)
+    elif event.kind in [DROP, LOSS]:
+        text += " queue " + str(int(event.value))
+    elif event.kind == BACKOFF:
+        text += " timeout " + str(event.value)
+    elif event.kind == WINDOW:
+        text += " size " + str(event.value)
+    elif event.kind == DEPART:
+        text += " queueing delay " + str(event.value)
+    return text
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: tracer.py TRACE_FILE")
+        sys.exit(1)
+    for event in read_trace(sys.argv[1]):
+        print(format_event(event))
+
+
+if __name__ == "__main__":
+    main()
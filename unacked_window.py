@@ -0,0 +1,144 @@
+from timeout_calculator import TimeoutCalculator
+from timer_wheel import TimerWheel
+
+
+class UnackedWindow:
+    """
+    Set of unacked packets of a window-based host, indexed by sequence number.
+    Data members of this class are
+
+    **base**: Lowest sequence number that has not been acked yet (low-water mark)
+
+    **next_seq**: Sequence number of the next new packet
+
+    **ring**: Ring buffer holding the packet for every sequence number in [base, next_seq),
+    or None once it has been acked. Its size is a power of two, so the slot of a sequence
+    number is seq_num & mask
+
+    **timeouts**: TimerWheel holding the timeout_tick of every unacked packet, so that
+    packets that have timed out are found without looking at the others
+
+    Adding, acking, advancing base and expiring a timeout are amortized O(1). Iterating
+    yields the unacked packets in sequence number order, like the list the hosts used to keep.
+    """
+
+    def __init__(self, capacity=16, max_timeout=TimeoutCalculator.MAX_TIMEOUT):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.ring = [None] * size
+        self.mask = size - 1
+        self.base = 0
+        self.next_seq = 0
+        self.count = 0
+        self.timeouts = TimerWheel(max_timeout)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for seq_num in range(self.base, self.next_seq):
+            pkt = self.ring[seq_num & self.mask]
+            if pkt is not None:
+                yield pkt
+
+    def get(self, seq_num):
+        """
+        Returns the unacked packet with sequence number seq_num, or None if it was acked
+        """
+        if self.base <= seq_num < self.next_seq:
+            return self.ring[seq_num & self.mask]
+        return None
+
+    def add(self, pkt):
+        """
+        Adds a newly sent packet. Its sequence number must be next_seq.
+        """
+        assert pkt.seq_num == self.next_seq
+        if self.next_seq - self.base == len(self.ring):
+            self.grow()
+        self.ring[pkt.seq_num & self.mask] = pkt
+        self.next_seq += 1
+        self.count += 1
+        self.schedule(pkt)
+
+    def replace(self, pkt):
+        """
+        Replaces the unacked packet with the same sequence number (e.g. by its retransmission)
+        """
+        assert self.get(pkt.seq_num) is not None
+        self.ring[pkt.seq_num & self.mask] = pkt
+        self.schedule(pkt)
+
+    def schedule(self, pkt):
+        """
+        Makes pkt show up in expired() once tick reaches pkt.timeout_tick
+        """
+        self.timeouts.schedule(pkt.seq_num, pkt.timeout_tick, pkt)
+
+    def ack(self, seq_num):
+        """
+        Removes the packet with sequence number seq_num and advances base past
+        every acked sequence number.
+
+        Returns:
+            The removed packet, or None if it was not unacked
+        """
+        pkt = self.get(seq_num)
+        if pkt is None:
+            return None
+        self.ring[seq_num & self.mask] = None
+        self.count -= 1
+        self.timeouts.cancel(seq_num)
+        if seq_num == self.base:
+            while self.base < self.next_seq and self.ring[self.base & self.mask] is None:
+                self.base += 1
+        return pkt
+
+    def ack_through(self, seq_num):
+        """
+        Removes every packet with a sequence number up to seq_num (a cumulative ACK)
+        and advances base past every acked sequence number.
+
+        Returns:
+            The number of packets removed
+        """
+        end = min(seq_num + 1, self.next_seq)
+        ring = self.ring
+        mask = self.mask
+        cancel = self.timeouts.cancel
+        removed = 0
+        for acked_seq in range(self.base, end):
+            if ring[acked_seq & mask] is not None:
+                ring[acked_seq & mask] = None
+                cancel(acked_seq)
+                removed += 1
+        self.count -= removed
+        if end > self.base:
+            self.base = end
+            while self.base < self.next_seq and ring[self.base & mask] is None:
+                self.base += 1
+        return removed
+
+    def expired(self, tick):
+        """
+        Returns:
+            The unacked packets whose timeout_tick is at or before tick, in sequence
+            number order. A packet is only returned again if it is rescheduled.
+        """
+        return self.timeouts.expire(tick)
+
+    def next_timeout(self):
+        """
+        Returns a lower bound on the earliest timeout_tick of an unacked packet,
+        or math.inf if there is none
+        """
+        return self.timeouts.next_deadline()
+
+    def grow(self):
+        ring = [None] * (2 * len(self.ring))
+        mask = len(ring) - 1
+        for seq_num in range(self.base, self.next_seq):
+            ring[seq_num & mask] = self.ring[seq_num & self.mask]
+        self.ring = ring
+        self.mask = mask